@@ -0,0 +1,82 @@
+"""
+Benchmark de la recherche d'identité dans la galerie de visages.
+Compare la latence et le rappel (même plus proche voisin que la force brute) des stratégies
+"exact", "centroid" et "hnsw" (si FAISS est installé) sur des embeddings synthétiques.
+
+Lancement depuis la racine du dépôt :
+    python -m benchmarks.face_gallery_bench
+    python -m benchmarks.face_gallery_bench --sizes 100 10000 --queries 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.face_gallery import FaceGallery, faiss
+
+EMBEDDING_DIM = 512
+
+
+def synthetic_gallery(size, samples_per_person, rng):
+    """Embeddings normalisés groupés par personne (centre aléatoire + bruit), comme ceux de FaceNet."""
+    people = max(1, size // samples_per_person)
+    centers = rng.standard_normal((people, EMBEDDING_DIM)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    person_of_row = np.arange(size) % people
+    embeddings = centers[person_of_row] + 0.03 * rng.standard_normal((size, EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    labels = [f"personne_{p}" for p in person_of_row]
+    return embeddings, labels
+
+
+def synthetic_queries(embeddings, count, rng):
+    rows = rng.integers(0, embeddings.shape[0], size=count)
+    queries = embeddings[rows] + 0.03 * rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_queries(gallery, queries, strategy):
+    """Une requête à la fois, comme dans l'étage identité. Retourne (labels, latences en ms)."""
+    labels, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found, _ = gallery.search_batch(query[np.newaxis, :], strategy=strategy)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        labels.append(found[0])
+    return labels, np.asarray(latencies)
+
+
+def run(sizes, query_count, samples_per_person, seed):
+    rng = np.random.default_rng(seed)
+    strategies = ["exact", "centroid"] + (["hnsw"] if faiss is not None else [])
+    if faiss is None:
+        print("FAISS non installé : stratégie hnsw ignorée.")
+
+    print(f"{'taille':>8} {'stratégie':>9} {'construction ms':>16} {'p50 ms':>8} {'p95 ms':>8} {'rappel':>7}")
+    for size in sizes:
+        embeddings, labels = synthetic_gallery(size, samples_per_person, rng)
+        queries = synthetic_queries(embeddings, query_count, rng)
+        gallery = FaceGallery.from_arrays(embeddings, labels)
+        reference = None
+        for strategy in strategies:
+            # La première recherche construit l'index (HNSW) : mesurée à part
+            start = time.perf_counter()
+            gallery.search_batch(queries[:1], strategy=strategy)
+            build_ms = (time.perf_counter() - start) * 1000.0
+
+            found, latencies = time_queries(gallery, queries, strategy)
+            if reference is None:
+                reference = found
+            recall = np.mean([a == b for a, b in zip(found, reference)])
+            print(f"{size:>8} {strategy:>9} {build_ms:>16.1f} {np.percentile(latencies, 50):>8.3f} "
+                  f"{np.percentile(latencies, 95):>8.3f} {recall:>7.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence et rappel de la recherche dans la galerie de visages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--samples-per-person", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.samples_per_person, args.seed)
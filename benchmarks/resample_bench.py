@@ -0,0 +1,75 @@
+"""
+Micro-benchmark du ré-échantillonnage de la sortie Kokoro (24 kHz) vers la fréquence du périphérique.
+Compare le ré-échantillonneur polyphase avec filtre en cache (src/audio_resampling.py) à
+l'ancien appel librosa.resample, en millisecondes de calcul par seconde d'audio.
+
+Lancement depuis la racine du dépôt :
+    python -m benchmarks.resample_bench
+    python -m benchmarks.resample_bench --durations 1 3 10 --repeats 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.audio_resampling import resample_audio, _polyphase_filter
+
+try:
+    import librosa
+except ImportError:
+    librosa = None
+
+KOKORO_SAMPLE_RATE = 24000
+
+
+def synthetic_speech(duration_s, sample_rate, rng):
+    """Signal proche de la parole : harmoniques modulées en amplitude + un peu de bruit."""
+    t = np.arange(int(duration_s * sample_rate), dtype=np.float32) / sample_rate
+    pitch = 180.0 + 40.0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 8)) * (0.5 + 0.5 * np.sin(2 * np.pi * 3.0 * t))
+    signal += 0.01 * rng.standard_normal(t.shape[0])
+    return (0.3 * signal / np.max(np.abs(signal))).astype(np.float32)
+
+
+def ms_per_audio_second(func, samples, duration_s, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(samples)
+        timings.append(time.perf_counter() - start)
+    return 1000.0 * np.median(timings) / duration_s
+
+
+def run(durations, target_rates, repeats):
+    rng = np.random.default_rng(0)
+    if librosa is None:
+        print("librosa non installé : seule la version polyphase est mesurée.")
+    print(f"{'cible Hz':>9} {'durée s':>8} {'polyphase froid':>16} {'polyphase':>10} {'librosa':>10}   (ms / s d'audio)")
+    for target_rate in target_rates:
+        for duration_s in durations:
+            samples = synthetic_speech(duration_s, KOKORO_SAMPLE_RATE, rng)
+
+            _polyphase_filter.cache_clear()
+            start = time.perf_counter()
+            resample_audio(samples, KOKORO_SAMPLE_RATE, target_rate)
+            cold = 1000.0 * (time.perf_counter() - start) / duration_s
+
+            warm = ms_per_audio_second(lambda x: resample_audio(x, KOKORO_SAMPLE_RATE, target_rate),
+                                       samples, duration_s, repeats)
+            reference = "-"
+            if librosa is not None:
+                reference = ms_per_audio_second(
+                    lambda x: librosa.resample(y=x, orig_sr=KOKORO_SAMPLE_RATE, target_sr=target_rate),
+                    samples, duration_s, repeats)
+                reference = f"{reference:.2f}"
+            print(f"{target_rate:>9} {duration_s:>8g} {cold:>16.2f} {warm:>10.2f} {reference:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coût du ré-échantillonnage 24 kHz -> fréquence du périphérique.")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1.0, 5.0, 15.0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[48000, 44100])
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+    run(args.durations, args.rates, args.repeats)
@@ -0,0 +1,103 @@
+"""
+Benchmark de latence d'un tour de conversation complet (outils, réponse, émotion de Julie, mémoires).
+Compare le mode "three_calls" (décideur d'outils, répondeur, agent émotion) au mode "single_shot"
+(une génération JSON contrainte par grammaire) en rejouant des conversations enregistrées
+(benchmarks/recorded_conversations.json). Mesure le délai jusqu'à la première phrase transmise au TTS
+et la durée totale du tour.
+La STM, la LTM et le cache de préfixes sont créés dans un dossier temporaire : les mémoires de Julie
+ne sont pas touchées. Nécessite le modèle GGUF dans ./model.
+
+Lancement depuis la racine du dépôt :
+    python -m benchmarks.turn_latency_bench
+    python -m benchmarks.turn_latency_bench --modes single_shot --repeats 3 --no-router --verbose
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src import llm_langchain_logic as logic
+
+DEFAULT_CONVERSATIONS = os.path.join(os.path.dirname(__file__), "recorded_conversations.json")
+
+
+def use_memory_dir(memory_dir):
+    logic.MEMORY_DIR = memory_dir
+    logic.VECTOR_STORE_INDEX_DIR = os.path.join(memory_dir, "vector_store_stm")
+    logic.VECTOR_IDS_PATH = os.path.join(memory_dir, "vector_store_stm_ids.pkl")
+    logic.LTM_DB_PATH = os.path.join(memory_dir, "long_term_memory.db")
+    logic.PROMPT_CACHE_DIR = os.path.join(memory_dir, "prompt_cache")
+
+
+def play_conversation(conversation, verbose):
+    """Rejoue une conversation. Retourne [(ms jusqu'à la 1re phrase, ms du tour complet)] par tour."""
+    logic.reset_short_term_context_deques()
+    timings = []
+    for turn in conversation["turns"]:
+        first_sentence_at = []
+        def on_sentence(sentence):
+            if not first_sentence_at:
+                first_sentence_at.append(time.perf_counter())
+            return True
+
+        start = time.perf_counter()
+        response, emotion, ended, _ = logic.process_user_input_langchain(
+            turn["text"], conversation["user_name"], turn["user_emotion"], on_sentence=on_sentence)
+        end = time.perf_counter()
+        first = first_sentence_at[0] if first_sentence_at else end
+        timings.append((1000.0 * (first - start), 1000.0 * (end - start)))
+        if verbose:
+            print(f"  [{conversation['name']}] U: {turn['text']}\n  [{conversation['name']}] J ({emotion}): {response}")
+        if ended:
+            break
+    return timings
+
+
+def run(conversations_path, modes, repeats, use_router, verbose):
+    with open(conversations_path, "r", encoding="utf-8") as f:
+        conversations = json.load(f)
+    memory_dir = tempfile.mkdtemp(prefix="julie_turn_bench_")
+    try:
+        use_memory_dir(memory_dir)
+        logic.TOOL_PRE_ROUTER_ENABLED = use_router
+        logic.init_llms_and_memory()
+
+        results = {}
+        for mode in modes:
+            if mode == "single_shot":
+                if logic.llm_single_shot is None:
+                    print("Mode single_shot indisponible (grammaire JSON) : ignoré.")
+                    continue
+                logic.llm_single_shot.prime()
+            logic.LLM_TURN_MODE = mode
+            timings = []
+            for _ in range(repeats):
+                logic.clear_all_memories()  # Même point de départ pour chaque passe
+                for conversation in conversations:
+                    timings.extend(play_conversation(conversation, verbose))
+            results[mode] = np.asarray(timings)
+
+        print(f"\n{'mode':>12} {'tours':>6} {'1re phrase p50':>15} {'p95':>8} {'tour p50':>10} {'p95':>8} {'moyenne':>9}   (ms)")
+        for mode, timings in results.items():
+            first, total = timings[:, 0], timings[:, 1]
+            print(f"{mode:>12} {len(timings):>6} {np.percentile(first, 50):>15.0f} {np.percentile(first, 95):>8.0f} "
+                  f"{np.percentile(total, 50):>10.0f} {np.percentile(total, 95):>8.0f} {total.mean():>9.0f}")
+        if logic.tool_router is not None:
+            print(f"Pré-routeur d'outils: {logic.tool_router.stats()}")
+    finally:
+        shutil.rmtree(memory_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latence d'un tour de conversation : trois appels LLM contre single-shot.")
+    parser.add_argument("--conversations", default=DEFAULT_CONVERSATIONS)
+    parser.add_argument("--modes", nargs="+", default=["three_calls", "single_shot"], choices=["three_calls", "single_shot"])
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--no-router", action="store_true", help="Désactive le pré-routeur d'outils (décideur LLM à chaque tour).")
+    parser.add_argument("--verbose", action="store_true", help="Affiche les échanges.")
+    args = parser.parse_args()
+    run(args.conversations, args.modes, args.repeats, not args.no_router, args.verbose)
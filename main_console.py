@@ -8,18 +8,21 @@ import queue
 import os
 
 # Kokoro doit être importé après sounddevice pour la sélection
-from src.Kokoro import initialize_kokoro, speak_mix, set_selected_output_device # Ajout de set_selected_output_device
+from src.Kokoro import initialize_kokoro, speak_mix, set_selected_output_device, configure_phrase_cache, warm_up_phrase_cache # Ajout de set_selected_output_device
 # KOKORO_INITIALIZED est défini après la sélection de périphérique
 
 # ... (autres imports) ...
 from src.emotion_detection import init_emotion_model
 from src.faceNet import init_mtcnn, init_facenet, detect_faces_and_coords, save_to_database
-from src.text import init_vosk_model, init_audio
+from src.text import init_vosk_model, init_audio, BargeInDetector
 
 from src.llm_langchain_logic import init_llms_and_memory, clear_all_memories, reset_short_term_context_deques
-from src.llm_processor import LLMProcessor
+from src.llm_langchain_logic import start_speculative_turn, take_speculative_turn, cancel_speculative_turn, get_llm_stats
+from src.llm_processor import LLMProcessor, ERROR_RESPONSE_TEMPLATE
 from src.tts_processor import TTSProcessor # TTSProcessor utilise maintenant le Kokoro.py modifié
 from src.vision_audio_processor import VisionAudioProcessor
+from src.vision_governor import VisionGovernor
+from src.face_gallery import get_face_gallery
 
 # ... (variables globales pour l'animation, configuration, etc. restent les mêmes) ...
 active_animation_command_queue = None
@@ -35,6 +38,36 @@ MODEL_PATHS = {
     "emotion_user": r"./model/emotion_model",
     "vosk": r"./model/vosk-model-small-fr-0.22"
 }
+# Backend du classifieur d'émotions utilisateur : "onnx" (ONNX Runtime) ou "transformers" (PyTorch)
+EMOTION_BACKEND = "onnx"
+EMOTION_QUANTIZE_INT8 = False
+# Cadence de l'analyse d'émotion pendant une conversation (images/seconde)
+VISION_CONVERSATION_EMOTION_FPS = 4.0
+# Réglages ONNX Runtime de Kokoro (None = valeur par défaut d'ONNX Runtime)
+KOKORO_SESSION_OPTIONS = {
+    "intra_op_threads": None,
+    "inter_op_threads": None,
+    "graph_optimization": "all",
+    "use_int8": False,
+}
+# Cache audio des phrases récurrentes (None = en mémoire seulement)
+TTS_PHRASE_CACHE_DIR = r"./model/kokoroTTS/phrase_cache"
+# Phrases pré-rendues au démarrage : (texte, vitesse) prononcés via speak_mix...
+TTS_WARMUP_PHRASES = [(f"Photo {i}", 1.1) for i in range(1, 6)] + [
+    ("Aucun visage détecté.", 1.1),
+    ("Désolée, enregistrement échoué.", 1.0),
+]
+# ... et réponses fixes prononcées via le TTSProcessor
+TTS_WARMUP_REPLIES = ["D'accord. À la prochaine !"]
+# Couper Julie quand l'utilisateur se met à parler pendant la lecture
+BARGE_IN_ENABLED = True
+# Réponse du LLM en streaming : chaque phrase part au TTS dès qu'elle est complète
+LLM_STREAMING_ENABLED = True
+# Émotion de Julie calculée pendant la synthèse vocale (les yeux changent un peu après le début de la phrase)
+AI_EMOTION_CONCURRENT = True
+# Mode spéculatif (opt-in) : après cette pause (s) dans la parole, routage d'outil et préremplissage du prompt
+# commencent sur le texte partiel ; réutilisés si la transcription finale correspond. None = désactivé.
+LLM_SPECULATIVE_PAUSE_SECONDS = None
 CONVERSATION_TRIGGER_WORD = "julie"
 CONVERSATION_TIMEOUT_SECONDS = 120
 FACE_GREETING_COOLDOWN_SECONDS = 600
@@ -54,6 +87,8 @@ face_greeting_cooldown_active = False
 face_greeting_cooldown_timer_obj = None
 global_shutdown_event = threading.Event()
 vision_audio_worker = None
+tts_processor = None
+barge_in_detector = None
 cap_instance = None
 mtcnn_instance = None
 facenet_instance = None
@@ -233,10 +268,11 @@ def execute_face_registration_procedure():
 
     for i in range(num_photos_a_prendre):
         print_to_console(f"Prise de la photo {i+1}/{num_photos_a_prendre}... Regardez la caméra.")
-        if KOKORO_INITIALIZED: speak_mix(f"Photo {i+1}", speed=1.1)
+        if KOKORO_INITIALIZED: speak_mix(f"Photo {i+1}", speed=1.1, cache=True)
         time.sleep(1.5)
 
-        ret, frame = cap_instance.read()
+        # La caméra est lue en continu par le pipeline vision : passer par lui
+        ret, frame = vision_audio_worker.read_frame() if vision_audio_worker else cap_instance.read()
         if not ret or frame is None: print_to_console("Erreur capture photo."); continue
 
         faces_rgb_list, coords_list = detect_faces_and_coords(frame, mtcnn_instance)
@@ -249,7 +285,7 @@ def execute_face_registration_procedure():
             active_send_animation_command_func(command_type="action", action="cligner")
         else:
             print_to_console("Aucun visage détecté. Repositionnez-vous.")
-            if KOKORO_INITIALIZED: speak_mix("Aucun visage détecté.", speed=1.1)
+            if KOKORO_INITIALIZED: speak_mix("Aucun visage détecté.", speed=1.1, cache=True)
             if i < num_photos_a_prendre -1 : time.sleep(1)
 
     if photos_prises_valides > 0:
@@ -261,7 +297,7 @@ def execute_face_registration_procedure():
     else:
         print_to_console("Aucune photo valide. Enregistrement échoué.")
         active_send_animation_command_func(command_type="set_emotion", emotion_name="tristesse")
-        if KOKORO_INITIALIZED: speak_mix("Désolée, enregistrement échoué.", speed=1.0)
+        if KOKORO_INITIALIZED: speak_mix("Désolée, enregistrement échoué.", speed=1.0, cache=True)
 
     print_to_console("--- FIN ENREGISTREMENT VISAGE ---")
     active_send_animation_command_func(command_type="set_emotion", emotion_name="neutre")
@@ -293,11 +329,14 @@ def process_vaw_output(data, llm_proc, tts_proc):
                 greeting_text_to_llm = f"Bonjour {current_face_identity}."
                 user_emotion_on_frame = data.get("emotion", "neutre")
 
-                ai_response, ai_emotion, ended, face_req = llm_proc.process_input(greeting_text_to_llm, user_emotion_on_frame, current_face_identity)
-                handle_llm_response(ai_response, ai_emotion, ended, tts_proc, face_req)
+                run_llm_turn(llm_proc, tts_proc, greeting_text_to_llm, user_emotion_on_frame, current_face_identity)
         elif not conversation_active and not is_current_face_known and not face_greeting_cooldown_active:
             last_processed_known_face_for_greeting = None
 
+    elif data_type == "speech_pause":
+        if conversation_active:
+            start_speculative_turn(data["text"], data["user_identity"], data["user_emotion"])
+
     elif data_type == "speech_stable":
         texte_utilisateur = data["text"]
         emotion_utilisateur = data["user_emotion"]
@@ -312,8 +351,8 @@ def process_vaw_output(data, llm_proc, tts_proc):
         if conversation_active:
             reset_conversation_timeout()
             if vision_audio_worker: vision_audio_worker.pause_heavy_processing()
-            ai_response, ai_emotion, ended, face_req = llm_proc.process_input(texte_utilisateur, emotion_utilisateur, prenom_utilisateur)
-            handle_llm_response(ai_response, ai_emotion, ended, tts_proc, face_req)
+            speculation = take_speculative_turn(texte_utilisateur, prenom_utilisateur) if LLM_SPECULATIVE_PAUSE_SECONDS is not None else None
+            run_llm_turn(llm_proc, tts_proc, texte_utilisateur, emotion_utilisateur, prenom_utilisateur, speculation=speculation)
 
         elif contains_trigger:
             print_to_console(f"--- Conversation Initiée (Mot Clé: '{CONVERSATION_TRIGGER_WORD}') ---")
@@ -328,15 +367,36 @@ def process_vaw_output(data, llm_proc, tts_proc):
             active_send_animation_command_func(command_type="set_emotion", emotion_name="neutre")
 
             if vision_audio_worker: vision_audio_worker.pause_heavy_processing()
-            ai_response, ai_emotion, ended, face_req = llm_proc.process_input(texte_utilisateur, emotion_utilisateur, prenom_utilisateur)
-            handle_llm_response(ai_response, ai_emotion, ended, tts_proc, face_req)
-
-def handle_llm_response(ai_response_text, ai_emotion, conversation_should_end, tts_proc, face_registration_requested):
-    # ... (code inchangé, avec le DEBUG print) ...
-    global conversation_active, ACTIVE_ANIMATION_EMOTIONS_AVAILABLE, ANIMATION_MODULE_TYPE
-    llm_text_display = f"Julie (Émotion: {ai_emotion}): {ai_response_text}"
-    print_to_console(llm_text_display)
-
+            run_llm_turn(llm_proc, tts_proc, texte_utilisateur, emotion_utilisateur, prenom_utilisateur)
+
+def run_llm_turn(llm_proc, tts_proc, user_text, user_emotion, user_name, speculation=None):
+    # En streaming, les phrases sont confiées au thread TTS pendant que le LLM continue à générer
+    speculative_tool_calls = None
+    if speculation is not None:
+        # Texte et émotion de la spéculation : le prompt correspond exactement à celui déjà prérempli
+        user_text, user_emotion = speculation["text"], speculation["user_detected_emotion"]
+        speculative_tool_calls = speculation["tool_calls"]
+    else:
+        cancel_speculative_turn()
+    streamed_jobs = []
+    def speak_sentence(sentence):
+        if any(job.interrupted for job in streamed_jobs):
+            return False  # Barge-in : inutile de générer la suite
+        streamed_jobs.append(tts_proc.speak_async(sentence))
+        drain_tts_events(tts_proc, turn_in_progress=True)  # Armer le barge-in dès que le son sort
+        return True
+
+    use_streaming = LLM_STREAMING_ENABLED and KOKORO_INITIALIZED and tts_proc is not None
+    ai_response, ai_emotion, ended, face_req = llm_proc.process_input(
+        user_text, user_emotion, user_name, on_sentence=speak_sentence if use_streaming else None,
+        on_emotion=handle_ai_emotion if AI_EMOTION_CONCURRENT else None,
+        speculative_tool_calls=speculative_tool_calls)
+    handle_llm_response(ai_response, ai_emotion, ended, tts_proc, face_req, streamed_jobs=streamed_jobs)
+
+def handle_ai_emotion(ai_emotion, announce=True):
+    # Peut être appelé depuis le thread de fin de tour du LLM (émotion calculée pendant la synthèse)
+    global ACTIVE_ANIMATION_EMOTIONS_AVAILABLE, ANIMATION_MODULE_TYPE
+    if announce: print_to_console(f"(Émotion de Julie: {ai_emotion})")
     final_emotion_for_anim = ai_emotion.lower()
     if final_emotion_for_anim == "degout" and "dégoût" in ACTIVE_ANIMATION_EMOTIONS_AVAILABLE:
         final_emotion_for_anim = "dégoût"
@@ -349,10 +409,31 @@ def handle_llm_response(ai_response_text, ai_emotion, conversation_should_end, t
     print(f"[DEBUG ANIMATION] Envoi commande: Type='set_emotion', Emotion='{final_emotion_for_anim}', Module='{ANIMATION_MODULE_TYPE}'")
     active_send_animation_command_func(command_type="set_emotion", emotion_name=final_emotion_for_anim)
 
-    if KOKORO_INITIALIZED and tts_proc and ai_response_text:
-        tts_proc.speak_text(ai_response_text)
+def handle_llm_response(ai_response_text, ai_emotion, conversation_should_end, tts_proc, face_registration_requested, streamed_jobs=None):
+    # ... (code inchangé, avec le DEBUG print) ...
+    global conversation_active
+    if ai_emotion is None:
+        # Émotion calculée en arrière-plan : les yeux sont mis à jour par handle_ai_emotion
+        print_to_console(f"Julie: {ai_response_text}")
+    else:
+        print_to_console(f"Julie (Émotion: {ai_emotion}): {ai_response_text}")
+        handle_ai_emotion(ai_emotion, announce=False)
+
+    # Synthèse dans le thread TTS : la boucle principale continue pendant que Julie parle
+    # (déjà fait phrase par phrase si la réponse a été streamée)
+    speech_job = None
+    if streamed_jobs:
+        speech_job = streamed_jobs[-1]
+        streamed_text = "".join("".join(job.text.split()) for job in streamed_jobs)
+        if not "".join(ai_response_text.split()).startswith(streamed_text) and tts_proc:
+            # Erreur pendant le streaming : la réponse de secours n'a pas été prononcée
+            speech_job = tts_proc.speak_async(ai_response_text)
+    elif KOKORO_INITIALIZED and tts_proc and ai_response_text:
+        speech_job = tts_proc.speak_async(ai_response_text)
 
     if face_registration_requested:
+        # La procédure parle elle-même et lit la console : laisser Julie finir sa phrase
+        if tts_proc: tts_proc.wait_until_idle()
         execute_face_registration_procedure()
 
     if conversation_should_end:
@@ -363,7 +444,42 @@ def handle_llm_response(ai_response_text, ai_emotion, conversation_should_end, t
     else:
         if not face_registration_requested: reset_conversation_timeout()
 
-    handle_tts_finished()
+    # Une seule reprise par tour : sur l'événement "speaking_finished" de la dernière synthèse (consommé ici
+    # s'il est déjà publié, sinon par la boucle principale), ou ici si la synthèse est finie sans événement
+    # en attente (pas de synthèse, événement déjà consommé pendant le tour)
+    speech_finished = speech_job is None or speech_job.done.is_set()
+    if not drain_tts_events(tts_proc) and speech_finished:
+        handle_tts_finished()
+
+def process_tts_event(event, tts_proc, turn_in_progress=False):
+    # Pendant un tour streamé, le TTS peut se vider entre deux phrases : la reprise attend la fin du tour.
+    # Retourne True si l'événement demande la reprise (faite une seule fois par drain_tts_events).
+    event_type = event.get("type")
+    if event_type == TTSProcessor.EVENT_SPEAKING_STARTED:
+        if barge_in_detector: barge_in_detector.arm()
+    elif event_type == TTSProcessor.EVENT_SPEAKING_FINISHED and not tts_proc.is_busy():
+        if barge_in_detector: barge_in_detector.disarm()
+        return not turn_in_progress
+    return False
+
+def drain_tts_events(tts_proc, turn_in_progress=False):
+    """Traite les événements TTS en attente. Retourne True si la reprise a été faite."""
+    resume = False
+    try:
+        while tts_proc:
+            resume = process_tts_event(tts_proc.events.get_nowait(), tts_proc, turn_in_progress) or resume
+    except queue.Empty: pass
+    if resume: handle_tts_finished()
+    return resume
+
+def handle_barge_in():
+    # Appelé depuis le thread de capture audio, avant l'envoi du pré-enregistrement à Vosk : couper la lecture
+    # et reprendre tout de suite l'écoute (la vision reprend avec l'événement "speaking_finished")
+    if tts_processor and tts_processor.is_busy():
+        print_to_console("--- (Barge-in: l'utilisateur parle, Julie s'interrompt) ---")
+        tts_processor.interrupt()
+    if vision_audio_worker:
+        vision_audio_worker.resume_speech_capture()
 
 def handle_tts_finished():
     # ... (code inchangé)
@@ -391,8 +507,7 @@ def handle_user_console_input(user_input_str, llm_proc, tts_proc):
 
     reset_conversation_timeout()
     current_active_user_name = last_processed_known_face_for_greeting if last_processed_known_face_for_greeting else "UtilisateurConsole"
-    ai_response, ai_emotion, ended, face_req = llm_proc.process_input(user_input_str, "neutre", current_active_user_name)
-    handle_llm_response(ai_response, ai_emotion, ended, tts_proc, face_req)
+    run_llm_turn(llm_proc, tts_proc, user_input_str, "neutre", current_active_user_name)
 
 
 if __name__ == "__main__":
@@ -404,7 +519,8 @@ if __name__ == "__main__":
 
     # L'initialisation de Kokoro se fait maintenant ici, APRÈS la sélection du périphérique
     print("Initialisation de Kokoro TTS...")
-    KOKORO_INITIALIZED = initialize_kokoro()
+    configure_phrase_cache(disk_dir=TTS_PHRASE_CACHE_DIR)
+    KOKORO_INITIALIZED = initialize_kokoro(**KOKORO_SESSION_OPTIONS)
     if not KOKORO_INITIALIZED:
         print("AVERTISSEMENT: Kokoro TTS n'a pas pu être initialisé. Le TTS ne fonctionnera pas.")
 
@@ -443,7 +559,7 @@ if __name__ == "__main__":
     print("Initialisation des modèles (Vosk, Emotion, FaceNet)...")
     try:
         vosk_model_instance = init_vosk_model(MODEL_PATHS["vosk"])
-        emotion_model_user_instance = init_emotion_model(MODEL_PATHS["emotion_user"])
+        emotion_model_user_instance = init_emotion_model(MODEL_PATHS["emotion_user"], backend=EMOTION_BACKEND, quantize_int8=EMOTION_QUANTIZE_INT8)
         mtcnn_instance = init_mtcnn()
         facenet_instance = init_facenet()
     except Exception as e:
@@ -471,7 +587,9 @@ if __name__ == "__main__":
     print("--------------------------------------------")
 
     print("Initialisation flux audio PyAudio pour Vosk...")
-    try: audio_processing_queue, audio_shutdown_flag = init_audio(selected_mic_index)
+    if BARGE_IN_ENABLED:
+        barge_in_detector = BargeInDetector(on_barge_in=handle_barge_in)
+    try: audio_processing_queue, audio_shutdown_flag = init_audio(selected_mic_index, barge_in_detector=barge_in_detector)
     except Exception as e:
         print(f"Erreur critique init audio: {e}")
         if cap_instance: cap_instance.release()
@@ -479,6 +597,15 @@ if __name__ == "__main__":
 
     llm_processor = LLMProcessor()
     tts_processor = TTSProcessor() # TTSProcessor utilisera maintenant le Kokoro.py modifié
+    if KOKORO_INITIALIZED:
+        # Pré-rendu en arrière-plan : les phrases fixes (et le message d'erreur pour chaque prénom connu)
+        # seront jouées depuis le cache
+        known_names = sorted(set(get_face_gallery(DATABASE_PATH).labels))
+        warmup_replies = TTS_WARMUP_REPLIES + [ERROR_RESPONSE_TEMPLATE.format(user_name=name) for name in known_names]
+        def warm_up_tts_cache():
+            warm_up_phrase_cache(TTS_WARMUP_PHRASES)
+            tts_processor.warm_up(warmup_replies)
+        threading.Thread(target=warm_up_tts_cache, daemon=True).start()
     vision_audio_worker = VisionAudioProcessor(
         history_size=HISTORY_SIZE,
         emotion_model_instance=emotion_model_user_instance,
@@ -488,14 +615,16 @@ if __name__ == "__main__":
         cap_instance=cap_instance,
         audio_data_q=audio_processing_queue,
         shutdown_event=audio_shutdown_flag,
-        db_path=DATABASE_PATH
+        db_path=DATABASE_PATH,
+        governor=VisionGovernor(conversation_emotion_fps=VISION_CONVERSATION_EMOTION_FPS),
+        speculative_pause=LLM_SPECULATIVE_PAUSE_SECONDS
     )
 
     vaw_thread = threading.Thread(target=vision_audio_worker.run, daemon=True)
     vaw_thread.start()
 
     print_to_console(f"Système prêt. Dites '{CONVERSATION_TRIGGER_WORD}' ou tapez votre message.")
-    print_to_console("Commandes console: 'quitter', 'reset memory'.")
+    print_to_console("Commandes console: 'quitter', 'reset memory', 'stats vision', 'stats llm'.")
     last_interaction_time = time.time()
 
     input_queue_console = queue.Queue()
@@ -527,6 +656,7 @@ if __name__ == "__main__":
                 elif console_input_str.strip().lower() == 'reset memory':
                     print_to_console("--- Réinitialisation mémoire ---")
                     if vision_audio_worker: vision_audio_worker.pause_heavy_processing()
+                    if tts_processor: tts_processor.interrupt(); tts_processor.wait_until_idle(timeout=2.0)
                     time.sleep(0.2); clear_all_memories(); conversation_active = False
                     if conversation_timeout_timer_obj and conversation_timeout_timer_obj.is_alive(): conversation_timeout_timer_obj.cancel()
                     if face_greeting_cooldown_timer_obj and face_greeting_cooldown_timer_obj.is_alive(): face_greeting_cooldown_timer_obj.cancel()
@@ -534,9 +664,18 @@ if __name__ == "__main__":
                     print_to_console("--- Mémoire réinitialisée. ---")
                     active_send_animation_command_func(command_type="set_emotion", emotion_name="neutre")
                     if vision_audio_worker: vision_audio_worker.resume_heavy_processing()
+                elif console_input_str.strip().lower() == 'stats vision':
+                    if vision_audio_worker:
+                        for stage_name, stage_stats in vision_audio_worker.get_pipeline_stats().items():
+                            print_to_console(f"[VISION] {stage_name}: {stage_stats}")
+                elif console_input_str.strip().lower() == 'stats llm':
+                    for stats_name, stats_values in get_llm_stats().items():
+                        print_to_console(f"[LLM] {stats_name}: {stats_values}")
                 elif console_input_str.strip() != "":
                     handle_user_console_input(console_input_str, llm_processor, tts_processor)
 
+            if vision_audio_worker: vision_audio_worker.set_conversation_active(conversation_active)
+
             try:
                 if vision_audio_worker:
                     vaw_data = vision_audio_worker.output_queue.get_nowait()
@@ -544,6 +683,8 @@ if __name__ == "__main__":
             except queue.Empty: pass
             except AttributeError: pass
 
+            drain_tts_events(tts_processor)
+
             if conversation_active and \
                (conversation_timeout_timer_obj is None or not conversation_timeout_timer_obj.is_alive()):
                  if (time.time() - last_interaction_time > CONVERSATION_TIMEOUT_SECONDS):
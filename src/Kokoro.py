@@ -1,8 +1,17 @@
 import sounddevice as sd
 # import soundfile as sf # Peut être nécessaire pour les dépendances internes de kokoro_onnx
 import numpy as np
+import collections
+import hashlib
 import os
-import librosa
+import queue
+import re
+import threading
+import time
+import unicodedata
+
+from .audio_resampling import resample_audio
+from .voice_registry import BLEND_RATIO_DECIMALS, VoiceRegistry
 
 try:
     from kokoro_onnx import Kokoro
@@ -11,20 +20,99 @@ except ImportError:
     Kokoro = None
 
 kokoro_instance = None
-VOICE_DATA = None
-mix_cache = {}
+VOICE_DATA = None  # VoiceRegistry (voix mmap + mélanges précalculés)
 SELECTED_OUTPUT_DEVICE_INDEX = None
+KOKORO_SAMPLE_RATE = 24000  # Fréquence de sortie du modèle Kokoro v1.0
 
 def set_selected_output_device(device_index):
     global SELECTED_OUTPUT_DEVICE_INDEX
     SELECTED_OUTPUT_DEVICE_INDEX = device_index
+    _output_rate_cache.clear()
     print(f"Kokoro: Périphérique de sortie audio réglé sur l'index système : {SELECTED_OUTPUT_DEVICE_INDEX}")
 
 
+ONNX_GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+
+
+def _resolve_model_path(model_path, use_int8, int8_model_path):
+    """Chemin du modèle à charger : la version int8 (créée par quantification dynamique si absente) ou l'original."""
+    if not use_int8:
+        return model_path
+    int8_model_path = int8_model_path or os.path.splitext(model_path)[0] + ".int8.onnx"
+    if not os.path.exists(int8_model_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Kokoro: Quantification dynamique int8 du modèle vers {int8_model_path}...")
+        quantize_dynamic(model_path, int8_model_path, weight_type=QuantType.QInt8)
+    return int8_model_path
+
+
+def _create_onnx_session(model_path, intra_op_threads=None, inter_op_threads=None, graph_optimization="all",
+                         optimized_model_dir=None):
+    """
+    Session ONNX Runtime réglée. Si `optimized_model_dir` est donné, le graphe optimisé est
+    sérialisé au premier lancement puis rechargé tel quel (sans repasser par l'optimiseur).
+    """
+    import onnxruntime as ort
+
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    options = ort.SessionOptions()
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = levels[graph_optimization]
+
+    session_path = model_path
+    if optimized_model_dir and graph_optimization != "disable":
+        base_name = os.path.splitext(os.path.basename(model_path))[0]
+        optimized_path = os.path.join(optimized_model_dir, f"{base_name}.{graph_optimization}.optimized.onnx")
+        if os.path.exists(optimized_path) and os.path.getmtime(optimized_path) >= os.path.getmtime(model_path):
+            session_path = optimized_path
+            options.graph_optimization_level = levels["disable"]
+        else:
+            os.makedirs(optimized_model_dir, exist_ok=True)
+            options.optimized_model_filepath = optimized_path
+    return ort.InferenceSession(session_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def _warm_up_kokoro(text="Bonjour.", runs=3):
+    """Quelques synthèses à vide : le premier appel paie l'allocation mémoire et l'initialisation du graphe."""
+    voice = "julie" if "julie" in VOICE_DATA else next(iter(VOICE_DATA.keys()))
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        kokoro_instance.create(text, voice=voice, speed=1.0, lang="fr-fr")
+        timings.append((time.perf_counter() - start_time) * 1000.0)
+    steady = f"{np.mean(timings[1:]):.0f} ms" if len(timings) > 1 else "n/a"
+    print(f"Kokoro: Préchauffage '{text}' : 1er appel {timings[0]:.0f} ms, régime établi {steady}.")
+    return timings
+
+
 def initialize_kokoro(
     model_path="model/kokoroTTS/kokoro-v1.0.onnx",
-    voices_path="model/kokoroTTS/voices-v1.0.bin"
+    voices_path="model/kokoroTTS/voices-v1.0.bin",
+    voice_blends=None,
+    intra_op_threads=None,
+    inter_op_threads=None,
+    graph_optimization="all",
+    optimized_model_dir="model/kokoroTTS/optimized",
+    use_int8=False,
+    int8_model_path=None,
+    warm_up=True
 ):
+    """
+    Charge le modèle et la table des voix. `voice_blends` ({nom: (voix1, voix2, ratio)}) remplace
+    les mélanges nommés par défaut (voir voice_registry.DEFAULT_BLENDS).
+    Réglages ONNX Runtime : nombre de threads intra/inter-opérateurs, niveau d'optimisation du
+    graphe ("disable", "basic", "extended", "all"), dossier du graphe optimisé mis en cache
+    (None pour ne rien écrire), modèle quantifié int8. Un préchauffage est lancé si `warm_up`.
+    """
     global kokoro_instance, VOICE_DATA
     if Kokoro is None:
         print("Kokoro TTS: kokoro_onnx non chargé.")
@@ -33,12 +121,33 @@ def initialize_kokoro(
         if not os.path.exists(voices_path):
             print(f"ERREUR: Fichier de voix Kokoro introuvable: {voices_path}")
             return False
-        VOICE_DATA = np.load(voices_path, allow_pickle=True)
+        VOICE_DATA = VoiceRegistry(voices_path, blends=voice_blends)
 
         if not os.path.exists(model_path):
             print(f"ERREUR: Fichier modèle Kokoro introuvable: {model_path}")
             return False
-        kokoro_instance = Kokoro(model_path, voices_path)
+        session_model_path = _resolve_model_path(model_path, use_int8, int8_model_path)
+        # Archive vide : voices-v1.0.bin n'est pas relu en entier, les voix viennent du registre mmap
+        empty_voices_path = VOICE_DATA.empty_archive_path()
+        start_time = time.perf_counter()
+        try:
+            session = _create_onnx_session(session_model_path, intra_op_threads, inter_op_threads,
+                                           graph_optimization, optimized_model_dir)
+            kokoro_instance = Kokoro.from_session(session, empty_voices_path)
+        except Exception as e_session:
+            print(f"Kokoro: Session ONNX réglée indisponible ({e_session}). Réglages par défaut.")
+            session_model_path = model_path
+            kokoro_instance = Kokoro(model_path, empty_voices_path)
+        print(f"Kokoro: Modèle {os.path.basename(session_model_path)} chargé en {time.perf_counter() - start_time:.1f} s.")
+        # Une seule table de voix : Kokoro utilise aussi le registre (mélanges nommés compris)
+        kokoro_instance.voices = VOICE_DATA
+        # L'audio mis en cache sur disque n'est valable que pour ce modèle
+        phrase_cache.namespace = os.path.basename(session_model_path)
+        if warm_up:
+            try:
+                _warm_up_kokoro()
+            except Exception as e_warm:
+                print(f"Kokoro: Préchauffage impossible: {e_warm}")
         print("Kokoro TTS initialisé avec succès.")
         return True
     except Exception as e:
@@ -47,51 +156,180 @@ def initialize_kokoro(
         VOICE_DATA = None
         return False
 
+# Fréquences essayées, dans l'ordre, quand le périphérique refuse la fréquence native du modèle.
+# 48000 Hz ou 44100 Hz sont de bons candidats universels.
+FALLBACK_PLAYBACK_RATES = (48000, 44100)
+TARGET_PLAYBACK_RATE = FALLBACK_PLAYBACK_RATES[0]
+_output_rate_cache = {}
+
+
+def _output_rate_for(sample_rate):
+    """
+    Fréquence de lecture pour un signal à `sample_rate` : la fréquence native si le périphérique
+    l'accepte (aucun ré-échantillonnage), sinon la première fréquence de repli acceptée.
+    Le résultat est mémorisé par (périphérique, fréquence).
+    """
+    key = (SELECTED_OUTPUT_DEVICE_INDEX, sample_rate)
+    if key not in _output_rate_cache:
+        chosen_rate = TARGET_PLAYBACK_RATE
+        for rate in (sample_rate,) + FALLBACK_PLAYBACK_RATES:
+            try:
+                sd.check_output_settings(device=SELECTED_OUTPUT_DEVICE_INDEX, samplerate=rate,
+                                         channels=1, dtype="float32")
+                chosen_rate = rate
+                break
+            except Exception:
+                continue
+        _output_rate_cache[key] = chosen_rate
+        print(f"[KOKORO AUDIO] Fréq. du modèle: {sample_rate} Hz -> fréq. de lecture: {chosen_rate} Hz.")
+    return _output_rate_cache[key]
+
+
+def _prepare_playback_audio(samples, sample_rate):
+    """Convertit en float32 et ré-échantillonne si le périphérique l'exige. Retourne (audio, fréquence)."""
+    # Kokoro devrait déjà retourner des flottants dans [-1, 1], mais une conversion explicite est plus sûre.
+    samples_float32 = np.asarray(samples, dtype=np.float32)
+    playback_rate = _output_rate_for(sample_rate)
+    if playback_rate == sample_rate:
+        return samples_float32, sample_rate
+    try:
+        return resample_audio(samples_float32, sample_rate, playback_rate), playback_rate
+    except Exception as e_resample:
+        print(f"[KOKORO AUDIO] ERREUR lors du ré-échantillonnage: {e_resample}.")
+        print(f"[KOKORO AUDIO] Tentative de lecture avec la fréquence originale de {sample_rate} Hz.")
+        return samples_float32, sample_rate
+
+
+class PhraseAudioCache:
+    """
+    Cache des phrases récurrentes ("Photo 1", "Aucun visage détecté.", ...) : l'audio déjà
+    ré-échantillonné est gardé en int16 dans un LRU en mémoire (borné en octets) et, si
+    `disk_dir` est donné, dans un fichier .npy par phrase. La clé est
+    (texte normalisé, voix ou mélange, vitesse, langue, fréquence de lecture).
+    Seules les phrases demandées explicitement (pré-rendu, messages fixes) sont ajoutées : les
+    réponses du LLM ne se répètent pas et rempliraient le disque. Les segments de plus de
+    `max_chars` caractères ne sont pas mis en cache. L'écriture disque se fait dans un thread dédié,
+    hors du chemin de lecture.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None, max_chars=160, namespace=""):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_chars = max_chars
+        self.namespace = namespace
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_writes = queue.Queue()
+        self._disk_writer_thread = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_text(text):
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, text, voice_key, speed, lang, playback_rate):
+        return (self.normalize_text(text), voice_key, round(float(speed), 3), lang, int(playback_rate))
+
+    def cacheable(self, key):
+        return len(key[0]) <= self.max_chars
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr((self.namespace,) + key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.npy")
+
+    def _store(self, key, pcm):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = pcm
+            self._bytes += pcm.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get(self, key):
+        """Retourne (audio float32, fréquence de lecture) ou None."""
+        if not self.cacheable(key):
+            return None
+        with self._lock:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+        if pcm is None and self.disk_dir:
+            try:
+                pcm = np.load(self._disk_path(key))
+                self._store(key, pcm)
+            except (OSError, ValueError):
+                pcm = None
+        if pcm is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pcm.astype(np.float32) / 32767.0, key[4]
+
+    def put(self, key, audio, playback_rate):
+        if not self.cacheable(key) or int(playback_rate) != key[4]:
+            return
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767.0).astype(np.int16)
+        self._store(key, pcm)
+        if self.disk_dir:
+            with self._lock:
+                if self._disk_writer_thread is None:
+                    self._disk_writer_thread = threading.Thread(
+                        target=self._disk_writer_loop, name="phrase-cache-writer", daemon=True)
+                    self._disk_writer_thread.start()
+            self._disk_writes.put((self._disk_path(key), pcm))
+
+    def _disk_writer_loop(self):
+        while True:
+            path, pcm = self._disk_writes.get()
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    np.save(f, pcm)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Kokoro: Écriture du cache de phrases impossible: {e}")
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+phrase_cache = PhraseAudioCache()
+
+
+def configure_phrase_cache(max_bytes=32 * 1024 * 1024, disk_dir=None, max_chars=160):
+    """Remplace le cache de phrases (à appeler avant initialize_kokoro)."""
+    global phrase_cache
+    phrase_cache = PhraseAudioCache(max_bytes=max_bytes, disk_dir=disk_dir, max_chars=max_chars,
+                                    namespace=phrase_cache.namespace)
+    return phrase_cache
+
+
+def _render_segment(text, voice_key, style, speed, lang, cache=False):
+    """
+    Audio prêt à jouer (float32, fréquence de lecture) d'un segment, depuis le cache si possible.
+    Avec `cache=True`, un segment synthétisé est ajouté au cache de phrases.
+    """
+    key = phrase_cache.make_key(text, voice_key, speed, lang, _output_rate_for(KOKORO_SAMPLE_RATE))
+    cached = phrase_cache.get(key)
+    if cached is not None:
+        return cached
+    samples, sample_rate = kokoro_instance.create(text, voice=style, speed=speed, lang=lang)
+    audio, playback_rate = _prepare_playback_audio(samples, sample_rate)
+    if cache:
+        phrase_cache.put(key, audio, playback_rate)
+    return audio, playback_rate
+
+
 def _play_audio(samples, sample_rate):
     global SELECTED_OUTPUT_DEVICE_INDEX
-    # Choisissez une fréquence cible que votre matériel supporte bien.
-    # 48000 Hz ou 44100 Hz sont de bons candidats universels.
-    TARGET_PLAYBACK_RATE = 48000
-
-    print(f"[KOKORO AUDIO] Fréq. originale: {sample_rate} Hz. Fréq. de lecture cible: {TARGET_PLAYBACK_RATE} Hz.")
     print(f"[KOKORO AUDIO] Périphérique de sortie index: {SELECTED_OUTPUT_DEVICE_INDEX if SELECTED_OUTPUT_DEVICE_INDEX is not None else 'Défaut'}")
 
-    # S'assurer que les samples sont un ndarray numpy de type float32
-    # Kokoro devrait déjà retourner des flottants, mais une conversion explicite est plus sûre.
-    if not isinstance(samples, np.ndarray):
-        samples_np = np.asarray(samples)
-    else:
-        samples_np = samples
-
-    if samples_np.dtype != np.float32:
-        samples_float32 = samples_np.astype(np.float32)
-    else:
-        samples_float32 = samples_np
-
-    # Normaliser si les samples sont des entiers convertis (ex: int16 -> float)
-    # Si Kokoro retourne des flottants déjà dans la plage [-1, 1], cette étape n'est pas strictement nécessaire
-    # mais ne fait pas de mal si les valeurs sont déjà petites.
-    # if np.issubdtype(samples_np.dtype, np.integer):
-    #     max_val = np.iinfo(samples_np.dtype).max
-    #     samples_float32 = samples_float32 / max_val
-
-    audio_to_play = samples_float32
-    actual_playback_rate = sample_rate
-
-    if sample_rate != TARGET_PLAYBACK_RATE:
-        print(f"[KOKORO AUDIO] Ré-échantillonnage de {sample_rate} Hz vers {TARGET_PLAYBACK_RATE} Hz...")
-        try:
-            # librosa.resample s'attend à y=samples_float32, orig_sr=..., target_sr=...
-            audio_to_play = librosa.resample(y=samples_float32, orig_sr=sample_rate, target_sr=TARGET_PLAYBACK_RATE)
-            actual_playback_rate = TARGET_PLAYBACK_RATE
-            print(f"[KOKORO AUDIO] Ré-échantillonnage terminé.")
-        except Exception as e_resample:
-            print(f"[KOKORO AUDIO] ERREUR lors du ré-échantillonnage: {e_resample}.")
-            print(f"[KOKORO AUDIO] Tentative de lecture avec la fréquence originale de {sample_rate} Hz.")
-            # On garde audio_to_play = samples_float32 et actual_playback_rate = sample_rate
-    else:
-        print(f"[KOKORO AUDIO] Pas de ré-échantillonnage nécessaire (fréquences identiques).")
-
+    audio_to_play, actual_playback_rate = _prepare_playback_audio(samples, sample_rate)
 
     try:
         if SELECTED_OUTPUT_DEVICE_INDEX is not None:
@@ -113,41 +351,256 @@ def _play_audio(samples, sample_rate):
             print(f"  (Erreur lors de la requête des périphériques: {e_qd})")
 
 
-def speak(text, voice="ff_siwis", speed=1.0, lang="fr-fr"):
+def speak(text, voice="ff_siwis", speed=1.0, lang="fr-fr", cache=False):
     if kokoro_instance is None:
         print("Kokoro non initialisé.")
         return
     try:
-        samples, sample_rate = kokoro_instance.create(text, voice=voice, speed=speed, lang=lang)
-        _play_audio(samples, sample_rate)
+        audio, playback_rate = _render_segment(text, voice, voice, speed, lang, cache=cache)
+        _play_audio(audio, playback_rate)
     except Exception as e:
         print(f"Erreur synthèse vocale (speak): {e}")
 
-def speak_mix(text, voice1="ff_siwis", voice2="if_sara", mix_ratio=0.85, speed=1.0, lang="fr-fr"):
+def _get_mix_style(voice1, voice2, mix_ratio):
+    """Style mélangé mix_ratio * voix1 + (1 - mix_ratio) * voix2, précalculé sur disque par le registre."""
+    if voice1 not in VOICE_DATA or voice2 not in VOICE_DATA:
+        print(f"Erreur: Voix '{voice1}' ou '{voice2}' non trouvée.")
+        default_voice_key = next(iter(VOICE_DATA.keys()))
+        voice1 = voice1 if voice1 in VOICE_DATA else default_voice_key
+        voice2 = voice2 if voice2 in VOICE_DATA else default_voice_key
+    return VOICE_DATA.blend(voice1, voice2, mix_ratio)
+
+
+def _mix_voice_key(voice1, voice2, mix_ratio):
+    return ("mix", voice1, voice2, round(float(mix_ratio), BLEND_RATIO_DECIMALS))
+
+
+def speak_mix(text, voice1="ff_siwis", voice2="if_sara", mix_ratio=0.85, speed=1.0, lang="fr-fr", cache=False):
+    """
+    Lecture bloquante d'un texte avec un mélange de deux voix (phrase par phrase, cache de phrases).
+    `cache=True` pour les messages fixes : leur audio est gardé pour les prochaines fois.
+    """
+    return speak_mix_stream(text, voice1=voice1, voice2=voice2, mix_ratio=mix_ratio, speed=speed, lang=lang,
+                            cache=cache)
+
+
+def warm_up_phrase_cache(phrases, voice1="ff_siwis", voice2="if_sara", mix_ratio=0.85, speed=1.0, lang="fr-fr"):
+    """
+    Pré-rend une liste de phrases dans le cache, découpées comme à la lecture.
+    Chaque élément est un texte ou un couple (texte, vitesse). Retourne le nombre de segments prêts.
+    """
+    if kokoro_instance is None or VOICE_DATA is None:
+        return 0
+    start_time = time.perf_counter()
+    hits_before = phrase_cache.hits
+    style_mix = _get_mix_style(voice1, voice2, mix_ratio)
+    rendered = 0
+    for phrase in phrases:
+        text, phrase_speed = (phrase, speed) if isinstance(phrase, str) else phrase
+        for chunk in split_text_for_tts(text):
+            try:
+                _render_segment(chunk, _mix_voice_key(voice1, voice2, mix_ratio), style_mix, phrase_speed, lang,
+                                cache=True)
+                rendered += 1
+            except Exception as e:
+                print(f"Kokoro: Pré-rendu impossible pour '{chunk}': {e}")
+    print(f"Kokoro: {rendered} segment(s) de phrases pré-rendu(s) en {time.perf_counter() - start_time:.1f} s "
+          f"({phrase_cache.hits - hits_before} déjà en cache).")
+    return rendered
+
+
+# --- Synthèse en flux : phrase par phrase, lecture continue ---
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…;:])\s+|\n+')
+_CLAUSE_SPLIT_RE = re.compile(r'(?<=,)\s+')
+
+
+def split_text_for_tts(text, max_chars=180):
+    """
+    Découpe un texte en phrases (puis en propositions si une phrase dépasse `max_chars`),
+    pour que la première phrase puisse être lue pendant la synthèse des suivantes.
+    La ponctuation finale reste attachée à sa phrase (elle guide la prosodie).
+    """
+    chunks = []
+    for sentence in _SENTENCE_SPLIT_RE.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if not any(c.isalnum() for c in sentence):
+            # Ponctuation seule (ex: "...") : rattachée à la phrase précédente
+            if chunks:
+                chunks[-1] += sentence
+            continue
+        if len(sentence) <= max_chars:
+            chunks.append(sentence)
+            continue
+        current = ""
+        for clause in _CLAUSE_SPLIT_RE.split(sentence):
+            if current and len(current) + 1 + len(clause) > max_chars:
+                chunks.append(current)
+                current = clause
+            else:
+                current = f"{current} {clause}" if current else clause
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+class AudioStreamPlayer:
+    """
+    Lecture continue via un sounddevice.OutputStream : les segments sont ajoutés avec write()
+    pendant que les précédents sont joués (pas de trou entre deux phrases tant que la synthèse
+    va plus vite que la lecture). abort() coupe la sortie immédiatement.
+    """
+
+    def __init__(self, sample_rate, device=None, blocksize=1024):
+        self.sample_rate = sample_rate
+        self._device = device
+        self._blocksize = blocksize
+        self._chunks = collections.deque()
+        self._chunk_offset = 0
+        self._lock = threading.Lock()
+        self._finished_writing = False
+        self._done = threading.Event()
+        self._stream = None
+        self.first_sample_time = None
+        self.underruns = 0
+
+    def start(self):
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, channels=1, dtype="float32",
+                                       device=self._device, blocksize=self._blocksize,
+                                       latency="low", callback=self._callback,
+                                       finished_callback=self._done.set)
+        self._stream.start()
+
+    def write(self, samples):
+        with self._lock:
+            self._chunks.append(np.asarray(samples, dtype=np.float32).reshape(-1))
+
+    def finish(self):
+        """Plus aucun segment ne sera ajouté : le flux s'arrête quand le tampon est vide."""
+        with self._lock:
+            self._finished_writing = True
+
+    def _callback(self, outdata, frames, time_info, status):
+        written = 0
+        with self._lock:
+            while written < frames and self._chunks:
+                chunk = self._chunks[0]
+                count = min(frames - written, chunk.shape[0] - self._chunk_offset)
+                outdata[written:written + count, 0] = chunk[self._chunk_offset:self._chunk_offset + count]
+                written += count
+                self._chunk_offset += count
+                if self._chunk_offset >= chunk.shape[0]:
+                    self._chunks.popleft()
+                    self._chunk_offset = 0
+            finished = self._finished_writing and not self._chunks
+        outdata[written:] = 0
+        if written and self.first_sample_time is None:
+            self.first_sample_time = time.perf_counter()
+        if written < frames and not finished:
+            self.underruns += 1
+        if finished:
+            raise sd.CallbackStop
+
+    def wait(self, stop_event=None, poll_interval=0.02):
+        """Attend la fin de la lecture. Retourne False si `stop_event` l'a interrompue."""
+        while not self._done.wait(poll_interval):
+            if stop_event is not None and stop_event.is_set():
+                self.abort()
+                return False
+        self.close()
+        return True
+
+    def abort(self):
+        if self._stream is not None:
+            self._stream.abort()
+        self.close()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self._done.set()
+
+
+def speak_mix_stream(text, voice1="ff_siwis", voice2="if_sara", mix_ratio=0.85, speed=1.0, lang="fr-fr",
+                     stop_event=None, on_playback_start=None, cache=False):
+    """
+    Comme speak_mix, mais le texte est synthétisé phrase par phrase dans un thread producteur
+    pendant que les phrases déjà prêtes sont jouées sur un flux de sortie continu.
+    Le temps jusqu'au premier échantillon joué est affiché. `on_playback_start()` est appelé à
+    l'ouverture du flux de sortie. `cache=True` ajoute les segments synthétisés au cache de phrases.
+    Retourne False si `stop_event` a interrompu la lecture, True sinon.
+    """
     if kokoro_instance is None:
         print("Kokoro non initialisé.")
-        return
+        return True
     if VOICE_DATA is None:
         print("Données de voix Kokoro non chargées.")
-        return
+        return True
+    start_time = time.perf_counter()
+    chunks = split_text_for_tts(text)
+    if not chunks:
+        return True
     try:
-        key = (voice1, voice2, round(mix_ratio, 2))
-        if key in mix_cache:
-            style_mix = mix_cache[key]
-        else:
-            if voice1 not in VOICE_DATA or voice2 not in VOICE_DATA:
-                print(f"Erreur: Voix '{voice1}' ou '{voice2}' non trouvée.")
-                default_voice_key = list(VOICE_DATA.keys())[0]
-                style1 = VOICE_DATA.get(voice1, VOICE_DATA[default_voice_key])
-                style2 = VOICE_DATA.get(voice2, VOICE_DATA[default_voice_key])
-            else:
-                style1 = VOICE_DATA[voice1]
-                style2 = VOICE_DATA[voice2]
-            style_mix = mix_ratio * style1 + (1 - mix_ratio) * style2
-            mix_cache[key] = style_mix
-        samples, sample_rate = kokoro_instance.create(text, voice=style_mix, speed=speed, lang=lang)
-        _play_audio(samples, sample_rate)
+        style_mix = _get_mix_style(voice1, voice2, mix_ratio)
     except KeyError as e:
-        print(f"Erreur clé de voix (speak_mix): {e}.")
+        print(f"Erreur clé de voix (speak_mix_stream): {e}.")
+        return True
+
+    voice_key = _mix_voice_key(voice1, voice2, mix_ratio)
+    synthesized = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                synthesized.put(_render_segment(chunk, voice_key, style_mix, speed, lang, cache=cache))
+        except Exception as e:
+            print(f"Erreur synthèse vocale (speak_mix_stream): {e}")
+        finally:
+            synthesized.put(None)
+
+    threading.Thread(target=produce, name="kokoro-synthesis", daemon=True).start()
+
+    player = None
+    completed = True
+    try:
+        while True:
+            try:
+                item = synthesized.get(timeout=0.05)
+            except queue.Empty:
+                if stop_event is not None and stop_event.is_set():
+                    completed = False
+                    break
+                continue
+            if item is None:
+                break
+            audio, playback_rate = item
+            if player is None:
+                player = AudioStreamPlayer(playback_rate, device=SELECTED_OUTPUT_DEVICE_INDEX)
+                player.write(audio)
+                player.start()
+                if on_playback_start is not None:
+                    on_playback_start()
+            else:
+                player.write(audio)
+        if player is not None:
+            player.finish()
+            completed = player.wait(stop_event) and completed
     except Exception as e:
-        print(f"Erreur synthèse vocale (speak_mix): {e}")
+        print(f"Erreur lors de la lecture audio en flux: {e}")
+        if player is not None:
+            player.abort()
+        return True
+
+    if player is not None and player.first_sample_time is not None:
+        print(f"[KOKORO AUDIO] Premier échantillon après {(player.first_sample_time - start_time) * 1000.0:.0f} ms "
+              f"({len(chunks)} segment(s), {player.underruns} sous-alimentation(s)).")
+    if not completed:
+        if player is not None:
+            player.abort()
+        print("[KOKORO AUDIO] Lecture interrompue.")
+    return completed
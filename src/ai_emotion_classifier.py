@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+
+class EmotionCentroidClassifier:
+    """
+    Émotion de Julie sans appel LLM : plus proche centroïde (cosinus) sur l'embedding MiniLM de sa réponse.
+    Les centroïdes sont appris depuis la LTM (colonnes ai_response / ai_response_emotion), c'est-à-dire
+    depuis les étiquettes produites jusqu'ici par l'agent émotion LLM.
+    predict() retourne None (=> repli sur le LLM) tant que le modèle n'est pas entraîné ou si l'écart
+    entre les deux meilleures émotions est trop faible.
+    """
+
+    def __init__(self, embeddings_model, labels, min_examples_per_label=5, min_margin=0.03, max_training_rows=2000):
+        self.embeddings_model = embeddings_model
+        self.labels = list(labels)
+        self.min_examples_per_label = min_examples_per_label
+        self.min_margin = min_margin
+        self.max_training_rows = max_training_rows
+        self._lock = threading.Lock()
+        self._centroid_labels = []
+        self._centroids = None
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    @property
+    def trained(self):
+        return self._centroids is not None
+
+    def train_from_ltm(self, db_path):
+        """(Ré)entraîne depuis les réponses les plus récentes de la LTM. Retourne le nombre d'exemples utilisés."""
+        rows = []
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                rows = conn.execute(
+                    """SELECT ai_response, ai_response_emotion FROM ltm_conversation_history
+                       WHERE ai_response_emotion IS NOT NULL ORDER BY id DESC LIMIT ?""",
+                    (self.max_training_rows,)).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Classifieur émotion Julie: Lecture LTM impossible: {e}")
+
+        examples = [(text, emotion) for text, emotion in rows if text and text.strip() and emotion in self.labels]
+        by_label = {}
+        for text, emotion in examples:
+            by_label.setdefault(emotion, []).append(text)
+        by_label = {label: texts for label, texts in by_label.items() if len(texts) >= self.min_examples_per_label}
+        if len(by_label) < 2:
+            with self._lock:
+                self._centroid_labels, self._centroids = [], None
+            print(f"Classifieur émotion Julie: Pas assez d'exemples en LTM ({len(examples)}), agent LLM utilisé.")
+            return 0
+
+        centroid_labels, centroids, used = [], [], 0
+        for label, texts in by_label.items():
+            vectors = self._normalize(np.asarray(self.embeddings_model.embed_documents(texts), dtype=np.float32))
+            centroid_labels.append(label)
+            centroids.append(vectors.mean(axis=0))
+            used += len(texts)
+        with self._lock:
+            self._centroid_labels = centroid_labels
+            self._centroids = self._normalize(np.stack(centroids))
+        print(f"Classifieur émotion Julie: Entraîné sur {used} réponses ({', '.join(centroid_labels)}).")
+        return used
+
+    def predict(self, text):
+        """Émotion prédite, ou None si le classifieur n'est pas assez sûr."""
+        with self._lock:
+            centroids, centroid_labels = self._centroids, self._centroid_labels
+        if centroids is None or not text.strip():
+            return None
+        query = self._normalize(np.asarray(self.embeddings_model.embed_query(text), dtype=np.float32))
+        similarities = centroids @ query
+        order = np.argsort(similarities)[::-1]
+        if similarities[order[0]] - similarities[order[1]] < self.min_margin:
+            return None
+        return centroid_labels[order[0]]
@@ -0,0 +1,29 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from scipy.signal import firwin, resample_poly
+
+
+@lru_cache(maxsize=8)
+def _polyphase_filter(up, down):
+    """Filtre passe-bas FIR de resample_poly (fenêtre de Kaiser), calculé une seule fois par ratio."""
+    max_rate = max(up, down)
+    taps = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    taps.setflags(write=False)
+    return taps
+
+
+def resample_audio(samples, orig_rate, target_rate):
+    """
+    Ré-échantillonnage polyphase (scipy.signal.resample_poly) avec filtre mis en cache.
+    Chaque segment est traité indépendamment : les segments Kokoro sont des phrases entières qui
+    commencent et finissent par du silence, le remplissage par zéros aux bords est donc inaudible.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if orig_rate == target_rate or samples.size == 0:
+        return samples
+    divisor = gcd(int(orig_rate), int(target_rate))
+    up, down = int(target_rate) // divisor, int(orig_rate) // divisor
+    # resample_poly modifie une copie du filtre fourni (h *= up) : le cache reste intact
+    return resample_poly(samples, up, down, window=_polyphase_filter(up, down)).astype(np.float32, copy=False)
@@ -1,30 +1,182 @@
 from transformers import pipeline
 import cv2
+import json
+import os
+import numpy as np
 import torch
 from PIL import Image
 
-def init_emotion_model(model_path, device=None):
-    """Initialise et retourne le pipeline d'analyse d'émotions"""
+
+class EmotionEngine:
+    """
+    Classifieur d'émotions par lot. Prend directement un lot de visages BGR (numpy),
+    fait tout le prétraitement en une seule passe vectorisée et exécute le modèle soit
+    avec PyTorch (backend "transformers"), soit avec une session ONNX Runtime exportée
+    (backend "onnx", quantification dynamique int8 optionnelle).
+    La sortie reste un dictionnaire {label: score} par visage, comme avec le pipeline HuggingFace.
+    """
+
+    def __init__(self, model_path, backend="transformers", device=None, quantize_int8=False):
+        self.model_path = model_path
+        self.device = self._resolve_device(device)
+        self._torch_model = None
+        self._onnx_session = None
+        self._onnx_input_name = None
+
+        with open(os.path.join(model_path, "config.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.labels = [config["id2label"][str(i)] for i in range(len(config["id2label"]))]
+
+        preprocessor_path = os.path.join(model_path, "preprocessor_config.json")
+        preprocessor = {}
+        if os.path.exists(preprocessor_path):
+            with open(preprocessor_path, "r", encoding="utf-8") as f:
+                preprocessor = json.load(f)
+        size = preprocessor.get("size", 224)
+        if isinstance(size, dict):
+            self.input_size = (size.get("width", 224), size.get("height", 224))
+        else:
+            self.input_size = (size, size)
+        self._rescale = np.float32(preprocessor.get("rescale_factor", 1.0 / 255.0))
+        self._mean = np.asarray(preprocessor.get("image_mean", [0.5, 0.5, 0.5]), dtype=np.float32)
+        self._std = np.asarray(preprocessor.get("image_std", [0.5, 0.5, 0.5]), dtype=np.float32)
+
+        self.backend = backend
+        if backend == "onnx":
+            try:
+                self._init_onnx(quantize_int8)
+            except Exception as e:
+                print(f"Émotion: Backend ONNX indisponible ({e}). Repli sur PyTorch.")
+                self.backend = "transformers"
+        if self.backend == "transformers":
+            self._torch_model = self._load_torch_model()
+        print(f"Émotion: Moteur initialisé (backend: {self.backend}, entrée: {self.input_size[0]}x{self.input_size[1]}).")
+
+    @staticmethod
+    def _resolve_device(device):
+        # Compatibilité avec la convention du pipeline HuggingFace (0 = GPU, -1 = CPU)
+        if device is None:
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        if isinstance(device, int):
+            return f"cuda:{device}" if device >= 0 else "cpu"
+        return device
+
+    def _load_torch_model(self):
+        from transformers import AutoModelForImageClassification
+        return AutoModelForImageClassification.from_pretrained(self.model_path).eval().to(self.device)
+
+    def _init_onnx(self, quantize_int8):
+        import onnxruntime as ort
+
+        onnx_path = os.path.join(self.model_path, "model.onnx")
+        if not os.path.exists(onnx_path):
+            self._export_onnx(onnx_path)
+
+        session_path = onnx_path
+        if quantize_int8:
+            int8_path = os.path.join(self.model_path, "model.int8.onnx")
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                print("Émotion: Quantification dynamique int8 du modèle ONNX...")
+                quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+            session_path = int8_path
+
+        self._onnx_session = ort.InferenceSession(session_path, providers=["CPUExecutionProvider"])
+        self._onnx_input_name = self._onnx_session.get_inputs()[0].name
+
+    def _export_onnx(self, onnx_path):
+        print(f"Émotion: Export du modèle vers {onnx_path}...")
+        model = self._load_torch_model().to("cpu")
+        dummy_input = torch.zeros(1, 3, self.input_size[1], self.input_size[0], dtype=torch.float32)
+        torch.onnx.export(
+            model, (dummy_input,), onnx_path,
+            input_names=["pixel_values"], output_names=["logits"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17
+        )
+
+    def preprocess(self, faces, is_rgb=False):
+        """
+        Lot de visages (liste ou tableau N x H x W x 3, uint8) -> tenseur N x 3 x H x W float32 normalisé.
+        Seul le redimensionnement est fait image par image, le reste est une seule opération sur le lot.
+        """
+        width, height = self.input_size
+        if isinstance(faces, np.ndarray) and faces.ndim == 4 and faces.shape[1:3] == (height, width):
+            batch = faces
+        else:
+            batch = np.empty((len(faces), height, width, 3), dtype=np.uint8)
+            for i, face in enumerate(faces):
+                if face.shape[:2] == (height, width):
+                    batch[i] = face
+                else:
+                    batch[i] = cv2.resize(face, (width, height))
+        if not is_rgb:
+            batch = batch[..., ::-1]
+        normalized = (batch.astype(np.float32) * self._rescale - self._mean) / self._std
+        return np.ascontiguousarray(normalized.transpose(0, 3, 1, 2))
+
+    def predict_batch(self, faces, is_rgb=False):
+        """Retourne une liste de dictionnaires {label: score}, un par visage."""
+        if faces is None or len(faces) == 0:
+            return []
+        pixel_values = self.preprocess(faces, is_rgb=is_rgb)
+        if self._onnx_session is not None:
+            logits = self._onnx_session.run(None, {self._onnx_input_name: pixel_values})[0]
+        else:
+            with torch.no_grad():
+                logits = self._torch_model(pixel_values=torch.from_numpy(pixel_values).to(self.device)).logits.cpu().numpy()
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        return [dict(zip(self.labels, map(float, row))) for row in probs]
+
+
+def init_emotion_model(model_path, device=None, backend="transformers", quantize_int8=False):
+    """Initialise et retourne le moteur d'analyse d'émotions (par lot)"""
+    return EmotionEngine(model_path, backend=backend, device=device, quantize_int8=quantize_int8)
+
+
+def init_emotion_pipeline(model_path, device=None):
+    """Initialise et retourne le pipeline HuggingFace d'analyse d'émotions (image par image)"""
     if device is None:
         device = 0 if torch.cuda.is_available() else -1
-        
+
     return pipeline(
-        "image-classification", 
+        "image-classification",
         model=model_path,
         device=device,
         top_k=None  # Retourne tous les résultats
     )
 
+
+def analyze_emotions_batch(faces, emotion_model, is_rgb=False):
+    """Analyse les émotions d'un lot de visages (BGR par défaut, RGB si is_rgb). Retourne une liste de dictionnaires."""
+    if faces is None or len(faces) == 0:
+        return []
+    try:
+        if isinstance(emotion_model, EmotionEngine):
+            return emotion_model.predict_batch(faces, is_rgb=is_rgb)
+        if is_rgb:
+            faces = [cv2.cvtColor(face, cv2.COLOR_RGB2BGR) for face in faces]
+        return [analyze_emotion(face, emotion_model) for face in faces]
+    except Exception as e:
+        print(f"Erreur dans analyze_emotions_batch: {e}")
+        return [{} for _ in range(len(faces))]
+
+
 def analyze_emotion(frame, emotion_model, input_size=224):
     """Analyse les émotions sur une frame avec le modèle initialisé"""
     if frame is None: # Ajout d'une vérification pour éviter les erreurs si frame est None
         return {}
     try:
+        if isinstance(emotion_model, EmotionEngine):
+            return emotion_model.predict_batch([frame])[0]
+
         resized_frame = cv2.resize(frame, (input_size, input_size))
         pil_image = Image.fromarray(cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB))
-        
+
         results = emotion_model(pil_image)
-        
+
         return {res['label']: res['score'] for res in results}
     except Exception as e:
         print(f"Erreur dans analyze_emotion: {e}")
@@ -33,4 +185,4 @@ def analyze_emotion(frame, emotion_model, input_size=224):
 
 def enhance_contrast_grayscale(image_gray, contrast_factor=1):
     """Augmente le contraste d'une image en niveaux de gris."""
-    return cv2.convertScaleAbs(image_gray, alpha=contrast_factor, beta=0)
\ No newline at end of file
+    return cv2.convertScaleAbs(image_gray, alpha=contrast_factor, beta=0)
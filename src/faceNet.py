@@ -2,77 +2,125 @@ import cv2
 import numpy as np
 import torch
 import os
-import pickle
 from facenet_pytorch import InceptionResnetV1, MTCNN
 
-def init_mtcnn(device='cuda' if torch.cuda.is_available() else 'cpu'):
-    """Initialise et retourne le détecteur MTCNN"""
-    return MTCNN(
-        keep_all=False, # On ne garde que le visage avec la plus haute probabilité
-        post_process=False, # On ne veut pas les tenseurs normalisés, mais les images de visages
-        device=device
-    )
+from .face_gallery import get_face_gallery
+
+class FaceDetector:
+    """
+    Détecteur MTCNN (keep_all=True) construit une seule fois et réutilisé à chaque frame.
+    Les poids P/R/O-Net restent chargés pendant toute la durée de vie de l'objet.
+    """
+
+    def __init__(self, device='cuda' if torch.cuda.is_available() else 'cpu',
+                 min_face_size=20, thresholds=(0.6, 0.7, 0.7), factor=0.709):
+        self.device = device
+        self.min_face_size = min_face_size
+        self.thresholds = list(thresholds)
+        self.factor = factor
+        self._mtcnn = MTCNN(
+            keep_all=True, # On garde tous les visages, le choix se fait plus loin
+            post_process=False, # On ne veut pas les tenseurs normalisés, mais les images de visages
+            min_face_size=min_face_size,
+            thresholds=self.thresholds,
+            factor=factor,
+            device=device
+        )
+
+    def detect(self, frame_rgb):
+        """Retourne (boxes, probs, landmarks) pour une image RGB. boxes vaut None si aucun visage."""
+        return self._mtcnn.detect(frame_rgb, landmarks=True)
+
+    def detect_batch(self, frames_rgb):
+        """
+        Détecte les visages sur plusieurs images RGB de même taille en un seul passage.
+        Retourne trois listes (boxes, probs, landmarks), un élément par image.
+        """
+        if len(frames_rgb) == 0:
+            return [], [], []
+        batch = np.stack(frames_rgb) if not isinstance(frames_rgb, np.ndarray) else frames_rgb
+        boxes, probs, landmarks = self._mtcnn.detect(batch, landmarks=True)
+        return list(boxes), list(probs), list(landmarks)
+
+
+def init_mtcnn(device='cuda' if torch.cuda.is_available() else 'cpu', min_face_size=20,
+               thresholds=(0.6, 0.7, 0.7), factor=0.709):
+    """Initialise et retourne le détecteur de visages (MTCNN chargé une seule fois)"""
+    return FaceDetector(device=device, min_face_size=min_face_size, thresholds=thresholds, factor=factor)
 
 def init_facenet(device='cuda' if torch.cuda.is_available() else 'cpu'):
     """Initialise et retourne le modèle Facenet avec les poids pré-entraînés"""
     model = InceptionResnetV1(pretrained='vggface2').eval().to(device)
     return model
 
-def detect_faces_and_coords(frame, mtcnn):
+def extract_face_crops(rgb_frame, boxes, size=(160, 160)):
+    """
+    Découpe les boîtes détectées dans l'image RGB et retourne deux listes :
+    - faces : les visages redimensionnés (160x160 par défaut) en format RGB
+    - coords : les coordonnées [x1, y1, x2, y2] ramenées dans le cadre de l'image
+    """
+    faces = []
+    coords = []
+    if boxes is None:
+        return faces, coords
+    for box in boxes:
+        x1, y1, x2, y2 = map(int, box)
+        #ajuster lorsque l'image sort du cadre
+        x1 = max(0, x1)
+        y1 = max(0, y1)
+        x2 = min(rgb_frame.shape[1], x2)  # largeur de l'image
+        y2 = min(rgb_frame.shape[0], y2)  # hauteur de l'image
+
+        #suite
+        if x1 < x2 and y1 < y2 : # S'assurer que la boîte a une taille valide
+            face = rgb_frame[y1:y2, x1:x2]
+            if face.size > 0: # S'assurer que le crop n'est pas vide
+                face_resized = cv2.resize(face, size)
+                faces.append(face_resized) # Garder en RGB
+                coords.append([x1, y1, x2, y2])
+    return faces, coords
+
+
+def detect_faces_and_coords(frame, detector):
     """
-    Détecte tous les visages d'une image avec MTCNN et retourne deux listes :
+    Détecte tous les visages d'une image BGR avec le détecteur partagé et retourne deux listes :
     - faces : une liste d'images de visages redimensionnées (160x160) en format RGB
     - coords : une liste de listes contenant les coordonnées [x1, y1, x2, y2] de chaque visage
     """
     rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    faces = []
-    coords = []
     try:
-        # mtcnn.detect retourne (boxes, probs, landmarks)
-        # Si keep_all=False, il ne retourne qu'un seul visage (ou None)
-        # Si keep_all=True, il retourne une liste de visages
-        # Pour être cohérent avec l'utilisation de plusieurs visages possibles plus tard:
-        mtcnn_temp_keep_all = MTCNN(keep_all=True, post_process=False, device=mtcnn.device)
-        boxes, _ = mtcnn_temp_keep_all.detect(rgb_frame)
-        
-        if boxes is not None:
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box)
-                #ajuster lorsque l'image sort du cadre
-                x1 = max(0, x1)
-                y1 = max(0, y1)
-                x2 = min(rgb_frame.shape[1], x2)  # largeur de l'image
-                y2 = min(rgb_frame.shape[0], y2)  # hauteur de l'image                
-
-                #suite
-                if x1 < x2 and y1 < y2 : # S'assurer que la boîte a une taille valide
-                    face = rgb_frame[y1:y2, x1:x2]
-                    if face.size > 0: # S'assurer que le crop n'est pas vide
-                        face_resized = cv2.resize(face, (160, 160))
-                        faces.append(face_resized) # Garder en RGB
-                        coords.append([x1, y1, x2, y2])
+        boxes, _, _ = detector.detect(rgb_frame)
+        return extract_face_crops(rgb_frame, boxes)
     except Exception as e:
         print(f"Erreur de détection faciale (detect_faces_and_coords): {e}")
-    return faces, coords
+    return [], []
+
+
+def faces_to_embeddings(face_images_rgb, facenet_model):
+    """
+    Calcule les embeddings de plusieurs visages RGB (160x160) en un seul passage FaceNet.
+    Accepte une liste d'images (H, W, C) ou un tableau (N, H, W, C), par exemple les visages
+    de plusieurs frames consécutives. Retourne un tableau numpy N x 512.
+    """
+    if face_images_rgb is None or len(face_images_rgb) == 0:
+        return np.empty((0, 512), dtype=np.float32)
+
+    device = next(facenet_model.parameters()).device
+    batch = face_images_rgb if isinstance(face_images_rgb, np.ndarray) else np.stack(face_images_rgb)
+    # (N, H, W, C) uint8 -> (N, C, H, W) float32, normalisation standard pour InceptionResnetV1
+    faces_tensor = torch.from_numpy(np.ascontiguousarray(batch)).to(device).permute(0, 3, 1, 2).float()
+    faces_tensor = (faces_tensor - 127.5) / 127.5
+
+    with torch.no_grad():
+        embeddings = facenet_model(faces_tensor).cpu().numpy()
+
+    return embeddings
 
 
 def face_to_embedding(face_image_rgb, facenet_model): # S'attendre à une image RGB
     if face_image_rgb is None:
         return None # Retourner None pour indiquer l'échec
-    
-    device = next(facenet_model.parameters()).device
-    # L'image est déjà un ndarray numpy (provenant de cv2.resize ou d'un crop)
-    # Elle doit être (H, W, C) et en RGB.
-    # Conversion en tenseur: (C, H, W), puis ajout d'un batch dimension (1, C, H, W)
-    face_tensor = torch.tensor(face_image_rgb, dtype=torch.float32).permute(2, 0, 1).unsqueeze(0).to(device)
-    
-    # Normalisation standard pour InceptionResnetV1
-    face_tensor = (face_tensor / 255.0 - 0.5) / 0.5 
-    
-    with torch.no_grad():
-        embedding = facenet_model(face_tensor).cpu().numpy()[0]
-    
-    return embedding
+    return faces_to_embeddings([face_image_rgb], facenet_model)[0]
 
 def compare_face(embedding1, embedding2):
     if embedding1 is None or embedding2 is None:
@@ -82,31 +130,15 @@ def compare_face(embedding1, embedding2):
 
 
 def analyze_database(embedding, db_path, threshold=0.7): # Augmenté le seuil un peu
-    """Comparaison des embeddings avec la base de données"""
+    """Comparaison des embeddings avec la base de données (galerie en mémoire, rechargée si elle change)"""
     if embedding is None:
         return "visage inconnu" # Ou gérer comme une erreur
-        
-    min_distance = float('inf')
-    best_match = None
-    
+
     if not os.path.exists(db_path):
         # print(f"Avertissement: Le dossier de base de données '{db_path}' n'existe pas.")
         return "visage inconnu"
 
-    for entry in os.listdir(db_path):
-        if entry.endswith(".pkl"):
-            try:
-                with open(os.path.join(db_path, entry), 'rb') as f:
-                    saved_embeddings_list = pickle.load(f)
-                    for saved_emb in saved_embeddings_list:
-                        distance = np.linalg.norm(embedding - saved_emb)
-                        if distance < min_distance:
-                            min_distance, best_match = distance, entry[:-4]
-            except Exception as e:
-                print(f"Erreur lors de la lecture du fichier .pkl {entry}: {e}")
-                continue # Passer au fichier suivant en cas d'erreur
-
-    return best_match if min_distance < threshold else "visage inconnu"
+    return get_face_gallery(db_path).identify(embedding, threshold)
 
 
 def save_to_database(name, face_images_rgb_dict, db_path, facenet_model):
@@ -114,7 +146,7 @@ def save_to_database(name, face_images_rgb_dict, db_path, facenet_model):
     if not face_images_rgb_dict:
         return "Aucune image valide fournie."
     
-    embeddings = []
+    valid_images = []
     
     for img_rgb in face_images_rgb_dict.values():
         if img_rgb is None:
@@ -124,29 +156,21 @@ def save_to_database(name, face_images_rgb_dict, db_path, facenet_model):
         if not isinstance(img_rgb, np.ndarray) or img_rgb.ndim != 3 or img_rgb.shape[2] != 3:
             print("Erreur: L'image fournie n'est pas au format RGB numpy attendu.")
             continue
-        
-        embedding = face_to_embedding(img_rgb, facenet_model)
-        if embedding is not None:
-            embeddings.append(embedding)
-        else:
-            print("Avertissement: N'a pas pu générer d'embedding pour une image.")
+        if img_rgb.shape[:2] != (160, 160):
+            img_rgb = cv2.resize(img_rgb, (160, 160))
+        valid_images.append(img_rgb)
+
+    embeddings = list(faces_to_embeddings(valid_images, facenet_model))
             
     if not embeddings:
         return "Aucun embedding n'a pu être généré à partir des images fournies."
 
+    # Ajout à la galerie persistante (en ajout seul, sans réécrire les autres personnes)
     os.makedirs(db_path, exist_ok=True)
-    filename = os.path.join(db_path, f"{name}.pkl")
-    
-    # Si le fichier existe déjà, charger les anciens embeddings et ajouter les nouveaux
-    # ou remplacer. Pour l'instant, remplaçons.
-    # Si vous voulez ajouter :
-    # if os.path.exists(filename):
-    #     with open(filename, 'rb') as f_read:
-    #         existing_embeddings = pickle.load(f_read)
-    #     embeddings.extend(existing_embeddings)
-
-    with open(filename, 'wb') as f:
-        pickle.dump(embeddings, f)
+    try:
+        get_face_gallery(db_path).add(name, np.asarray(embeddings, dtype=np.float32))
+    except (OSError, ValueError) as e:
+        return f"Erreur lors de la sauvegarde des embeddings pour {name}: {e}"
     
     return f"{len(embeddings)} embeddings de visage sauvegardés pour {name}."
 
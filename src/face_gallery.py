@@ -0,0 +1,447 @@
+import collections
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+UNKNOWN_FACE_LABEL = "visage inconnu"
+
+GALLERY_DIR_NAME = "gallery"
+GALLERY_FORMAT_VERSION = 1
+
+
+class GalleryStore:
+    """
+    Stockage persistant de la galerie de visages dans <db_path>/gallery/ :
+    - header.json     : dimension, nombre de lignes validées, taille validée du fichier de labels
+    - embeddings.f32  : matrice float32 brute (N x D), en ajout seul, ouverte par np.memmap
+    - labels.txt      : un prénom par ligne, la ligne i correspond à la ligne i de la matrice
+    - enrollments.log : journal des enregistrements (date, prénom, lignes ajoutées)
+    Une ligne n'est prise en compte que si header.json la couvre. L'en-tête est réécrit de
+    façon atomique (fichier temporaire + os.replace) après la synchronisation des données :
+    une écriture interrompue laisse au pire des octets en trop, écrasés au prochain ajout.
+    """
+
+    def __init__(self, db_path, dim=512):
+        self.db_path = db_path
+        self.dir_path = os.path.join(db_path, GALLERY_DIR_NAME)
+        self.header_path = os.path.join(self.dir_path, "header.json")
+        self.data_path = os.path.join(self.dir_path, "embeddings.f32")
+        self.labels_path = os.path.join(self.dir_path, "labels.txt")
+        self.log_path = os.path.join(self.dir_path, "enrollments.log")
+        self.default_dim = dim
+        self._write_lock = threading.Lock()
+
+    def read_header(self):
+        try:
+            with open(self.header_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": GALLERY_FORMAT_VERSION, "dim": self.default_dim, "count": 0,
+                    "labels_bytes": 0, "imported_pkl": []}
+
+    def header_mtime(self):
+        try:
+            return os.stat(self.header_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _write_header(self, header):
+        tmp_path = self.header_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.header_path)
+
+    def open_matrix(self, header=None):
+        """Ouvre la matrice validée en lecture seule via np.memmap (temps constant)."""
+        header = header or self.read_header()
+        count, dim = header["count"], header["dim"]
+        if count == 0 or not os.path.exists(self.data_path):
+            return np.empty((0, dim), dtype=np.float32)
+        return np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(count, dim))
+
+    def read_labels(self, start_byte=0, end_byte=None):
+        """Lit les labels validés entre deux positions du fichier (lecture incrémentale)."""
+        if end_byte is None:
+            end_byte = self.read_header()["labels_bytes"]
+        if end_byte <= start_byte or not os.path.exists(self.labels_path):
+            return []
+        with open(self.labels_path, "rb") as f:
+            f.seek(start_byte)
+            chunk = f.read(end_byte - start_byte)
+        return chunk.decode("utf-8").splitlines()
+
+    def append(self, name, embeddings, _header_update=None):
+        """Ajoute des embeddings pour une personne (nouvelle ou existante) sans réécrire la galerie."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[np.newaxis, :]
+        if embeddings.shape[0] == 0:
+            return 0
+        if "\n" in name or "\r" in name:
+            raise ValueError(f"Prénom invalide pour la galerie: {name!r}")
+
+        with self._write_lock:
+            os.makedirs(self.dir_path, exist_ok=True)
+            header = self.read_header()
+            if header["count"] == 0:
+                header["dim"] = embeddings.shape[1]
+            if embeddings.shape[1] != header["dim"]:
+                raise ValueError(f"Dimension d'embedding {embeddings.shape[1]} incompatible avec la galerie ({header['dim']}).")
+
+            row_bytes = header["dim"] * 4
+            # Écrire juste après la partie validée, par-dessus ce qu'une écriture interrompue aurait pu laisser.
+            # Pas de truncate : sous Windows, il échoue tant qu'un lecteur garde la matrice ouverte par np.memmap.
+            with open(self.data_path, "r+b" if os.path.exists(self.data_path) else "wb") as f:
+                f.seek(header["count"] * row_bytes)
+                f.write(embeddings.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            label_bytes = "".join(f"{name}\n" for _ in range(embeddings.shape[0])).encode("utf-8")
+            with open(self.labels_path, "ab") as f:
+                if os.path.getsize(self.labels_path) > header["labels_bytes"]:
+                    f.truncate(header["labels_bytes"])
+                f.write(label_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+
+            first_row = header["count"]
+            header["count"] += embeddings.shape[0]
+            header["labels_bytes"] += len(label_bytes)
+            if _header_update is not None:
+                _header_update(header)
+            self._write_header(header)
+
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{name}\t+{embeddings.shape[0]}\tlignes {first_row}-{header['count'] - 1}\n")
+        return embeddings.shape[0]
+
+    def import_pickles(self):
+        """Importe une seule fois chaque ancien fichier <prénom>.pkl du dossier de base de données."""
+        if not os.path.isdir(self.db_path):
+            return 0
+        imported = set(self.read_header().get("imported_pkl", []))
+        total = 0
+        for entry in sorted(os.listdir(self.db_path)):
+            if not entry.endswith(".pkl") or entry in imported:
+                continue
+            try:
+                with open(os.path.join(self.db_path, entry), 'rb') as f:
+                    saved_embeddings_list = pickle.load(f)
+            except Exception as e:
+                print(f"Erreur lors de la lecture du fichier .pkl {entry}: {e}")
+                continue
+            embeddings = np.asarray(saved_embeddings_list, dtype=np.float32)
+
+            def mark_imported(header, entry=entry):
+                header["imported_pkl"] = sorted(set(header.get("imported_pkl", [])) | {entry})
+
+            if embeddings.size == 0:
+                continue
+            total += self.append(entry[:-4], embeddings, _header_update=mark_imported)
+            print(f"Galerie: {entry} importé dans {self.dir_path}.")
+        return total
+
+
+_GalleryView = collections.namedtuple(
+    "_GalleryView",
+    "matrix sq_norms labels centroids centroid_sq_norms person_rows person_starts person_counts generation")
+
+
+class FaceGallery:
+    """
+    Index en mémoire des embeddings de la galerie d'un dossier de base de données.
+    La matrice (N x D, float32) est ouverte par np.memmap avec un tableau de labels parallèle,
+    ce qui permet de répondre à une requête d'identité avec une seule opération matricielle.
+    Seul header.json est surveillé (mtime) : quand des lignes sont ajoutées, seules les
+    nouvelles lignes et les nouveaux labels sont lus.
+
+    Stratégies de recherche (`search_mode`) :
+    - "exact"    : force brute sur toute la matrice
+    - "hnsw"     : index FAISS HNSW (approché), construit au fil des ajouts
+    - "centroid" : présélection des `centroid_candidates` personnes dont le centroïde est le
+                   plus proche, puis recherche exacte sur leurs seuls embeddings
+    - "auto"     : exacte sous `exact_search_threshold` lignes, HNSW au-delà si FAISS est
+                   installé, sinon présélection par centroïdes
+    """
+
+    SEARCH_MODES = ("auto", "exact", "hnsw", "centroid")
+
+    def __init__(self, db_path=None, refresh_interval=1.0, search_mode="auto", exact_search_threshold=5000,
+                 centroid_candidates=8, hnsw_m=32, hnsw_ef_construction=80, hnsw_ef_search=64):
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu: {search_mode!r} (attendu: {', '.join(self.SEARCH_MODES)})")
+        if search_mode == "hnsw" and faiss is None:
+            print("Galerie: FAISS indisponible, repli sur la présélection par centroïdes.")
+            search_mode = "centroid"
+        self.db_path = db_path
+        self.store = GalleryStore(db_path) if db_path is not None else None
+        self.refresh_interval = refresh_interval
+        self.search_mode = search_mode
+        self.exact_search_threshold = exact_search_threshold
+        self.centroid_candidates = centroid_candidates
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._header_mtime = None
+        self._labels_bytes = 0
+        self._generation = 0
+        self._clear_rows()
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._view = self._make_view()
+        self._hnsw_index = None
+        self._hnsw_generation = -1
+        self._last_refresh_time = 0.0
+
+    @classmethod
+    def from_arrays(cls, embeddings, labels, **kwargs):
+        """Galerie uniquement en mémoire (sans dossier), utile pour les tests et les benchmarks."""
+        gallery = cls(None, **kwargs)
+        gallery.add_many(embeddings, labels)
+        return gallery
+
+    def __len__(self):
+        return self._view.matrix.shape[0]
+
+    @property
+    def labels(self):
+        return self._view.labels
+
+    def _clear_rows(self):
+        self._sq_norms = np.empty((0,), dtype=np.float32)
+        self._labels = np.empty((0,), dtype=object)
+        self._row_person = np.empty((0,), dtype=np.int32)
+        self._person_ids = {}
+        self._centroid_sums = np.empty((0, 0), dtype=np.float64)
+        self._person_counts = np.empty((0,), dtype=np.int64)
+        self._generation += 1
+
+    def _append_rows(self, matrix, new_rows, new_labels):
+        """Met à jour normes, labels et centroïdes par personne avec les lignes ajoutées (appelé sous verrou)."""
+        new_pids = np.empty(len(new_labels), dtype=np.int32)
+        for i, label in enumerate(new_labels):
+            new_pids[i] = self._person_ids.setdefault(label, len(self._person_ids))
+
+        person_count = len(self._person_ids)
+        if self._centroid_sums.shape[0] < person_count or self._centroid_sums.shape[1] != matrix.shape[1]:
+            sums = np.zeros((person_count, matrix.shape[1]), dtype=np.float64)
+            counts = np.zeros(person_count, dtype=np.int64)
+            if self._centroid_sums.shape[1] == matrix.shape[1]:
+                sums[:self._centroid_sums.shape[0]] = self._centroid_sums
+                counts[:self._person_counts.shape[0]] = self._person_counts
+            self._centroid_sums, self._person_counts = sums, counts
+        if new_rows.shape[0] > 0:
+            np.add.at(self._centroid_sums, new_pids, np.asarray(new_rows, dtype=np.float64))
+            np.add.at(self._person_counts, new_pids, 1)
+
+        self._sq_norms = np.concatenate([self._sq_norms, np.einsum('ij,ij->i', new_rows, new_rows)])
+        self._labels = np.concatenate([self._labels, np.array(new_labels, dtype=object)])
+        self._row_person = np.concatenate([self._row_person, new_pids])
+        self._matrix = matrix
+        self._view = self._make_view()
+
+    def _make_view(self):
+        """Instantané immuable utilisé par les recherches (les ajouts ne modifient jamais un instantané publié)."""
+        dim = self._matrix.shape[1]
+        if self._person_counts.shape[0] > 0:
+            centroids = (self._centroid_sums / np.maximum(self._person_counts, 1)[:, np.newaxis]).astype(np.float32)
+        else:
+            centroids = np.empty((0, dim), dtype=np.float32)
+        person_rows = np.argsort(self._row_person, kind="stable").astype(np.int64)
+        person_starts = np.concatenate([[0], np.cumsum(self._person_counts)[:-1]]).astype(np.int64)
+        return _GalleryView(self._matrix, self._sq_norms, self._labels, centroids,
+                            np.einsum('ij,ij->i', centroids, centroids), person_rows, person_starts,
+                            self._person_counts.copy(), self._generation)
+
+    def add(self, name, embeddings):
+        """Enregistre de nouveaux embeddings pour `name` puis met l'index à jour."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[np.newaxis, :]
+        if self.store is None:
+            return self.add_many(embeddings, [name] * embeddings.shape[0])
+        added = self.store.append(name, embeddings)
+        self.refresh(force=True)
+        return added
+
+    def add_many(self, embeddings, labels):
+        """Ajoute des lignes à une galerie en mémoire (sans dossier) ; un label par ligne."""
+        if self.store is not None:
+            raise ValueError("add_many est réservé aux galeries en mémoire, utiliser add(name, embeddings).")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.shape[0] != len(labels):
+            raise ValueError(f"{embeddings.shape[0]} embeddings pour {len(labels)} labels.")
+        with self._lock:
+            matrix = embeddings if self._matrix.shape[0] == 0 else np.concatenate([self._matrix, embeddings])
+            self._append_rows(matrix, embeddings, list(labels))
+        return embeddings.shape[0]
+
+    def refresh(self, force=False):
+        """Recharge les lignes ajoutées depuis le dernier passage si header.json a changé."""
+        if self.store is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._last_refresh_time < self.refresh_interval:
+            return False
+        self._last_refresh_time = now
+
+        header_mtime = self.store.header_mtime()
+        if not force and header_mtime == self._header_mtime:
+            return False
+
+        with self._lock:
+            header = self.store.read_header()
+            old_count = self._matrix.shape[0]
+            matrix = self.store.open_matrix(header)
+            if matrix.shape[0] < old_count or header["labels_bytes"] < self._labels_bytes:
+                # Galerie recréée : rechargement complet
+                old_count = 0
+                self._labels_bytes = 0
+                self._clear_rows()
+
+            new_rows = matrix[old_count:]
+            new_labels = self.store.read_labels(self._labels_bytes, header["labels_bytes"])
+            if len(new_labels) != new_rows.shape[0]:
+                print(f"Galerie: incohérence entre embeddings ({new_rows.shape[0]}) et labels ({len(new_labels)}), rechargement complet.")
+                new_rows = matrix
+                new_labels = self.store.read_labels(0, header["labels_bytes"])
+                self._clear_rows()
+                if len(new_labels) != matrix.shape[0]:
+                    return False
+
+            self._append_rows(matrix, new_rows, new_labels)
+            self._labels_bytes = header["labels_bytes"]
+            self._header_mtime = header_mtime
+        return True
+
+    def active_strategy(self, row_count=None):
+        """Stratégie effectivement utilisée pour une galerie de `row_count` lignes."""
+        row_count = len(self) if row_count is None else row_count
+        if self.search_mode != "auto":
+            return self.search_mode
+        if row_count < self.exact_search_threshold:
+            return "exact"
+        return "hnsw" if faiss is not None else "centroid"
+
+    def search(self, embedding):
+        """Retourne (label, distance L2) du plus proche voisin, ou (None, inf) si la galerie est vide."""
+        labels, distances = self.search_batch(np.asarray(embedding, dtype=np.float32)[np.newaxis, :])
+        return labels[0], distances[0]
+
+    def search_batch(self, embeddings, strategy=None):
+        """
+        Recherche le plus proche voisin de chaque ligne de `embeddings` (M x D).
+        `strategy` force une stratégie ("exact", "hnsw", "centroid"), sinon `active_strategy()`.
+        """
+        queries = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[np.newaxis, :]
+        view = self._view
+        if view.matrix.shape[0] == 0 or queries.shape[0] == 0:
+            return [None] * queries.shape[0], np.full(queries.shape[0], np.inf, dtype=np.float32)
+
+        strategy = strategy or self.active_strategy(view.matrix.shape[0])
+        if strategy == "hnsw" and faiss is not None:
+            return self._search_hnsw(queries)
+        if strategy == "centroid" and view.centroids.shape[0] > self.centroid_candidates:
+            return self._search_centroid(queries, view)
+        best_idx, best_sq = self._nearest_rows(queries, view.matrix, view.sq_norms)
+        return [view.labels[i] for i in best_idx], np.sqrt(np.maximum(best_sq, 0.0))
+
+    @staticmethod
+    def _nearest_rows(queries, matrix, sq_norms):
+        """Force brute : distances calculées en une fois via ||a-b||² = ||a||² - 2a.b + ||b||²."""
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        sq_dists = q_sq[:, np.newaxis] - 2.0 * (queries @ matrix.T) + sq_norms[np.newaxis, :]
+        best_idx = np.argmin(sq_dists, axis=1)
+        return best_idx, sq_dists[np.arange(queries.shape[0]), best_idx]
+
+    def _search_centroid(self, queries, view):
+        candidates = min(self.centroid_candidates, view.centroids.shape[0])
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        centroid_dists = q_sq[:, np.newaxis] - 2.0 * (queries @ view.centroids.T) + view.centroid_sq_norms[np.newaxis, :]
+        nearest_people = np.argpartition(centroid_dists, candidates - 1, axis=1)[:, :candidates]
+
+        labels, distances = [], np.empty(queries.shape[0], dtype=np.float32)
+        for i, people in enumerate(nearest_people):
+            rows = np.concatenate([view.person_rows[view.person_starts[p]:view.person_starts[p] + view.person_counts[p]]
+                                   for p in people])
+            best_idx, best_sq = self._nearest_rows(queries[i:i + 1], view.matrix[rows], view.sq_norms[rows])
+            labels.append(view.labels[rows[best_idx[0]]])
+            distances[i] = np.sqrt(max(float(best_sq[0]), 0.0))
+        return labels, distances
+
+    def _search_hnsw(self, queries):
+        with self._index_lock:
+            # L'instantané est lu sous le verrou de l'index : l'index ne couvre jamais plus de lignes que lui
+            view = self._view
+            index = self._ensure_hnsw_index(view)
+            sq_dists, indices = index.search(queries, 1)
+        labels = [view.labels[i] if i >= 0 else None for i in indices[:, 0]]
+        distances = np.where(indices[:, 0] >= 0, np.sqrt(np.maximum(sq_dists[:, 0], 0.0)), np.inf).astype(np.float32)
+        return labels, distances
+
+    def _ensure_hnsw_index(self, view):
+        """Construit l'index HNSW au premier besoin puis n'y ajoute que les nouvelles lignes."""
+        dim = view.matrix.shape[1]
+        if self._hnsw_index is None or self._hnsw_generation != view.generation or self._hnsw_index.d != dim:
+            self._hnsw_index = faiss.IndexHNSWFlat(dim, self.hnsw_m)
+            self._hnsw_index.hnsw.efConstruction = self.hnsw_ef_construction
+            self._hnsw_generation = view.generation
+        self._hnsw_index.hnsw.efSearch = self.hnsw_ef_search
+        indexed = self._hnsw_index.ntotal
+        if indexed < view.matrix.shape[0]:
+            self._hnsw_index.add(np.ascontiguousarray(view.matrix[indexed:], dtype=np.float32))
+        return self._hnsw_index
+
+    def identify(self, embedding, threshold=0.7):
+        """Retourne le nom reconnu si la distance est sous le seuil, sinon "visage inconnu"."""
+        if embedding is None:
+            return UNKNOWN_FACE_LABEL
+        self.refresh()
+        label, distance = self.search(embedding)
+        return label if label is not None and distance < threshold else UNKNOWN_FACE_LABEL
+
+    def stats(self):
+        view = self._view
+        return {
+            "rows": view.matrix.shape[0],
+            "people": view.centroids.shape[0],
+            "strategy": self.active_strategy(view.matrix.shape[0]),
+            "hnsw_rows": self._hnsw_index.ntotal if self._hnsw_index is not None else 0,
+        }
+
+
+_galleries = {}
+_galleries_lock = threading.Lock()
+
+
+def get_face_gallery(db_path):
+    """
+    Retourne l'index partagé associé à un dossier de base de données (créé au premier appel).
+    Les anciens fichiers <prénom>.pkl sont importés dans la galerie à ce moment-là.
+    """
+    key = os.path.abspath(db_path)
+    with _galleries_lock:
+        gallery = _galleries.get(key)
+        if gallery is None:
+            gallery = FaceGallery(db_path)
+            try:
+                gallery.store.import_pickles()
+            except OSError as e:
+                print(f"Galerie: import des fichiers .pkl impossible: {e}")
+            gallery.refresh(force=True)
+            _galleries[key] = gallery
+    return gallery
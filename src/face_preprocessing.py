@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+
+# Coefficients de luminance BT.601 (ceux de cv2.COLOR_RGB2YUV)
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class FacePreprocessor:
+    """
+    Prétraitement fusionné des visages : chaque crop est lu une seule fois dans la frame RGB,
+    redimensionné dans un tampon préalloué, puis l'éclairage est normalisé directement en RGB.
+    Multiplier Y par alpha dans l'espace YUV (U et V inchangés) revient à ajouter (alpha - 1) * Y
+    à chaque canal R, G et B : pas d'aller-retour RGB -> BGR -> YUV -> BGR -> RGB.
+    L'entrée émotion (224x224 par défaut) et l'entrée FaceNet (160x160) viennent du même tampon.
+    Les tableaux retournés sont des vues sur les tampons internes, réutilisés à l'appel suivant :
+    une instance par thread.
+    """
+
+    def __init__(self, facenet_size=(160, 160), emotion_size=(224, 224), target_luminance=120.0, max_faces=4):
+        self.facenet_size = tuple(facenet_size)
+        self.emotion_size = tuple(emotion_size)
+        self.target_luminance = target_luminance
+        self._buffers = {}
+        self._capacity = 0
+        self._allocate(max_faces)
+
+    def _allocate(self, capacity):
+        self._capacity = capacity
+        self._buffers = {}
+        for size in {self.facenet_size, self.emotion_size}:
+            width, height = size
+            self._buffers[size] = (
+                np.empty((capacity, height, width, 3), dtype=np.uint8),   # sortie
+                np.empty((capacity, height, width, 3), dtype=np.float32), # calcul
+                np.empty((capacity, height, width), dtype=np.float32),    # luminance / décalage
+                np.empty((capacity, height, width), dtype=np.float32),    # marge avant saturation
+            )
+
+    @staticmethod
+    def clip_boxes(frame_shape, boxes):
+        """Boîtes [x1, y1, x2, y2] ramenées dans l'image ; les boîtes vides sont écartées."""
+        coords = []
+        for box in boxes if boxes is not None else []:
+            x1, y1, x2, y2 = map(int, box)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(frame_shape[1], x2), min(frame_shape[0], y2)
+            if x1 < x2 and y1 < y2:
+                coords.append([x1, y1, x2, y2])
+        return coords
+
+    def _normalize_lighting(self, size, count):
+        """Normalisation de luminance vectorisée sur les `count` premiers visages du tampon `size`."""
+        out, work, luma, headroom = (buffer[:count] for buffer in self._buffers[size])
+        np.copyto(work, out)
+        np.dot(work, LUMA_WEIGHTS, out=luma)
+        mean_lum = luma.mean(axis=(1, 2))
+        alpha = np.where(mean_lum > 1e-5, self.target_luminance / np.maximum(mean_lum, 1e-5), 1.0).astype(np.float32)
+        # Décalage min((alpha - 1) * Y, 255 - Y) : la nouvelle luminance sature à 255 comme dans l'espace YUV
+        np.subtract(255.0, luma, out=headroom)
+        luma *= (alpha - 1.0)[:, np.newaxis, np.newaxis]
+        np.minimum(luma, headroom, out=luma)
+        work += luma[..., np.newaxis]
+        np.clip(work, 0.0, 255.0, out=work)
+        np.copyto(out, work, casting="unsafe")
+        return out
+
+    def process(self, rgb_frame, boxes, facenet=True, emotion=False):
+        """
+        Retourne (facenet_batch, emotion_batch, coords) pour les boîtes valides :
+        - facenet_batch : N x 160 x 160 x 3 uint8 RGB normalisé (ou None si facenet=False)
+        - emotion_batch : N x 224 x 224 x 3 uint8 RGB normalisé (ou None si emotion=False)
+        """
+        coords = self.clip_boxes(rgb_frame.shape, boxes)
+        count = len(coords)
+        if count == 0:
+            return (np.empty((0,) + self.facenet_size[::-1] + (3,), dtype=np.uint8) if facenet else None,
+                    np.empty((0,) + self.emotion_size[::-1] + (3,), dtype=np.uint8) if emotion else None, coords)
+        if count > self._capacity:
+            self._allocate(count)
+        # Le plus grand format demandé est calculé depuis le crop, l'autre en est dérivé
+        source_size = self.emotion_size if emotion else self.facenet_size
+        source = self._buffers[source_size][0]
+        for i, (x1, y1, x2, y2) in enumerate(coords):
+            cv2.resize(rgb_frame[y1:y2, x1:x2], source_size, dst=source[i], interpolation=cv2.INTER_LINEAR)
+        self._normalize_lighting(source_size, count)
+
+        emotion_batch = source[:count] if emotion else None
+        facenet_batch = None
+        if facenet:
+            facenet_batch = self._buffers[self.facenet_size][0][:count]
+            if source_size != self.facenet_size:
+                for i in range(count):
+                    cv2.resize(source[i], self.facenet_size, dst=facenet_batch[i], interpolation=cv2.INTER_AREA)
+        return facenet_batch, emotion_batch, coords
@@ -0,0 +1,175 @@
+import itertools
+
+import cv2
+
+
+def box_iou(box_a, box_b):
+    """IoU entre deux boîtes [x1, y1, x2, y2]."""
+    inter_x1 = max(box_a[0], box_b[0])
+    inter_y1 = max(box_a[1], box_b[1])
+    inter_x2 = min(box_a[2], box_b[2])
+    inter_y2 = min(box_a[3], box_b[3])
+    inter_w = max(0, inter_x2 - inter_x1)
+    inter_h = max(0, inter_y2 - inter_y1)
+    inter_area = inter_w * inter_h
+    if inter_area == 0:
+        return 0.0
+    area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+    area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+    return inter_area / float(area_a + area_b - inter_area)
+
+
+def _create_cv_tracker(tracker_type):
+    """Crée un tracker OpenCV (KCF ou CSRT) si opencv-contrib le fournit, sinon None."""
+    factory_name = f"Tracker{tracker_type.upper()}_create"
+    for module in (cv2, getattr(cv2, "legacy", None)):
+        factory = getattr(module, factory_name, None) if module is not None else None
+        if factory is not None:
+            return factory()
+    return None
+
+
+class FaceTrack:
+    """Un visage suivi d'une frame à l'autre."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = list(box)
+        self.hits = 1
+        self.misses = 0
+        self.confidence = 1.0
+        self.identity_attempts = 0
+        self.cv_tracker = None
+
+    @property
+    def area(self):
+        return max(0, self.box[2] - self.box[0]) * max(0, self.box[3] - self.box[1])
+
+
+class FaceTracker:
+    """
+    Association des boîtes de détection entre frames par IoU.
+    La détection complète n'est relancée que toutes les `detection_interval` frames,
+    ou dès qu'un track perd sa confiance (échec du tracker OpenCV optionnel).
+    L'identité FaceNet n'est calculée que sur les `identity_samples` premières
+    occurrences d'un nouveau track.
+    """
+
+    def __init__(self, detection_interval=10, iou_threshold=0.3, max_misses=2,
+                 min_confidence=0.5, identity_samples=3, cv_tracker_type=None):
+        self.detection_interval = detection_interval
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_confidence = min_confidence
+        self.identity_samples = identity_samples
+        self.cv_tracker_type = cv_tracker_type
+        self._id_counter = itertools.count(1)
+        self._frames_since_detection = detection_interval
+        self.tracks = []
+
+    def reset(self):
+        self.tracks = []
+        self._frames_since_detection = self.detection_interval
+
+    def needs_detection(self):
+        if self._frames_since_detection >= self.detection_interval:
+            return True
+        return any(track.confidence < self.min_confidence for track in self.tracks)
+
+    def update_detections(self, boxes, frame_rgb=None):
+        """
+        Associe les boîtes détectées aux tracks existants (glouton par IoU décroissante).
+        Retourne la liste des nouveaux tracks créés.
+        """
+        self._frames_since_detection = 0
+        boxes = [list(map(int, box)) for box in boxes] if boxes is not None else []
+
+        candidate_pairs = []
+        for t_idx, track in enumerate(self.tracks):
+            for b_idx, box in enumerate(boxes):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    candidate_pairs.append((iou, t_idx, b_idx))
+        candidate_pairs.sort(reverse=True)
+
+        matched_tracks = set()
+        matched_boxes = set()
+        for _, t_idx, b_idx in candidate_pairs:
+            if t_idx in matched_tracks or b_idx in matched_boxes:
+                continue
+            track = self.tracks[t_idx]
+            track.box = boxes[b_idx]
+            track.hits += 1
+            track.misses = 0
+            track.confidence = 1.0
+            matched_tracks.add(t_idx)
+            matched_boxes.add(b_idx)
+
+        surviving_tracks = []
+        for t_idx, track in enumerate(self.tracks):
+            if t_idx not in matched_tracks:
+                track.misses += 1
+                track.confidence = 0.0
+                if track.misses > self.max_misses:
+                    continue
+            surviving_tracks.append(track)
+
+        new_tracks = []
+        for b_idx, box in enumerate(boxes):
+            if b_idx not in matched_boxes:
+                track = FaceTrack(next(self._id_counter), box)
+                surviving_tracks.append(track)
+                new_tracks.append(track)
+        self.tracks = surviving_tracks
+
+        if self.cv_tracker_type and frame_rgb is not None:
+            for track in self.tracks:
+                if track.misses == 0:
+                    self._init_cv_tracker(track, frame_rgb)
+        return new_tracks
+
+    def _init_cv_tracker(self, track, frame_rgb):
+        track.cv_tracker = _create_cv_tracker(self.cv_tracker_type)
+        if track.cv_tracker is None:
+            return
+        x1, y1, x2, y2 = track.box
+        try:
+            track.cv_tracker.init(frame_rgb, (x1, y1, x2 - x1, y2 - y1))
+        except cv2.error:
+            track.cv_tracker = None
+
+    def predict(self, frame_rgb=None):
+        """Avance les tracks d'une frame sans détection (mise à jour par tracker OpenCV si activé)."""
+        self._frames_since_detection += 1
+        if frame_rgb is None:
+            return
+        for track in self.tracks:
+            if track.cv_tracker is None:
+                continue
+            ok, bbox = track.cv_tracker.update(frame_rgb)
+            if ok:
+                x, y, w, h = map(int, bbox)
+                track.box = [x, y, x + w, y + h]
+            else:
+                track.confidence = 0.0
+
+    def tracks_needing_identity(self):
+        return [track for track in self.tracks
+                if track.misses == 0 and track.identity_attempts < self.identity_samples]
+
+    def record_identity_attempt(self, track):
+        track.identity_attempts += 1
+
+    def track_ids(self):
+        return {track.track_id for track in self.tracks}
+
+    def primary_track(self, preferred_track_id=None):
+        """Retourne le track suivi précédemment s'il est encore visible, sinon le plus grand visage."""
+        visible = [track for track in self.tracks if track.misses == 0]
+        if not visible:
+            return None
+        if preferred_track_id is not None:
+            for track in visible:
+                if track.track_id == preferred_track_id:
+                    return track
+        return max(visible, key=lambda track: track.area)
@@ -0,0 +1,185 @@
+import hashlib
+import os
+import pickle
+import string
+import threading
+
+from langchain_community.llms import LlamaCpp
+
+
+def static_prompt_prefix(template, **static_values):
+    """
+    Partie constante d'un template str.format : le texte qui précède le premier champ dont la valeur
+    n'est pas fournie dans `static_values` (les champs fournis sont remplacés).
+    """
+    parts = []
+    for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+        parts.append(literal)
+        if field_name is None:
+            continue  # Fin du template ou accolades échappées
+        if field_name not in static_values:
+            break
+        parts.append(format(static_values[field_name], format_spec or ""))
+    return "".join(parts)
+
+
+class LlmCallProfile:
+    """
+    Réglages d'échantillonnage d'un rôle (température, longueur, motifs d'arrêt), appliqués à chaque appel.
+    `grammar` (llama_cpp.LlamaGrammar) contraint la sortie, par exemple à un schéma JSON.
+    """
+
+    def __init__(self, name, temperature, max_tokens, stop=None, grammar=None):
+        self.name = name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.stop = list(stop or [])
+        self.grammar = grammar
+
+    def call_kwargs(self):
+        kwargs = {"stop": list(self.stop), "temperature": self.temperature, "max_tokens": self.max_tokens}
+        if self.grammar is not None:
+            kwargs["grammar"] = self.grammar
+        return kwargs
+
+
+class SharedLlamaModel:
+    """
+    Modèle GGUF chargé une seule fois (un seul contexte llama.cpp) et partagé par tous les rôles.
+    Le contexte llama.cpp n'est pas réentrant : les appels sont sérialisés par un verrou, gardé
+    pendant toute la durée d'un streaming.
+
+    Préfixes de prompt : pour chaque rôle, l'état KV du début constant de son template est calculé
+    une fois (et enregistré dans `prompt_cache_dir`), puis rechargé avant chaque appel du rôle.
+    llama.cpp réutilise alors le plus long préfixe de tokens commun et n'évalue que la partie variable.
+    """
+
+    def __init__(self, prompt_cache_dir=None, **llama_params):
+        # Pas de "stop" au niveau de l'instance : LlamaCpp refuse alors les motifs passés à l'appel
+        llama_params.pop("stop", None)
+        self.llm = LlamaCpp(**llama_params)
+        self.lock = threading.RLock()
+        self.prompt_cache_dir = prompt_cache_dir
+        self._model_signature = self._signature(llama_params)
+        self._prefix_states = {}
+        self.prefix_hits = 0
+        self.prefix_restores = 0
+
+    @staticmethod
+    def _signature(llama_params):
+        model_path = llama_params.get("model_path", "")
+        try:
+            stat = os.stat(model_path)
+            file_id = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            file_id = ""
+        return f"{os.path.abspath(model_path)}|{file_id}|{llama_params.get('n_ctx')}"
+
+    def _prefix_cache_path(self, prefix):
+        digest = hashlib.sha1(f"{self._model_signature}\n{prefix}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.prompt_cache_dir, f"prefix_{digest}.pkl")
+
+    def prime_prefix(self, prefix):
+        """Calcule (ou relit sur disque) l'état KV de `prefix`. Retourne le nombre de tokens du préfixe."""
+        with self.lock:
+            state = self._prefix_states.get(prefix)
+            if state is None:
+                state = self._load_or_build_prefix_state(prefix)
+                self._prefix_states[prefix] = state
+            return state.n_tokens
+
+    def _load_or_build_prefix_state(self, prefix):
+        cache_path = self._prefix_cache_path(prefix) if self.prompt_cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    return pickle.load(f)
+            except Exception as e:
+                print(f"LLM: Cache de préfixe illisible ({e}), recalcul.")
+        client = self.llm.client
+        # Même tokenisation que Llama.create_completion (BOS + tokens spéciaux)
+        tokens = client.tokenize(prefix.encode("utf-8"), special=True)
+        client.reset()
+        client.eval(tokens)
+        state = client.save_state()
+        if cache_path:
+            try:
+                os.makedirs(self.prompt_cache_dir, exist_ok=True)
+                tmp_path = cache_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(state, f)
+                os.replace(tmp_path, cache_path)
+            except Exception as e:
+                print(f"LLM: Impossible d'enregistrer le cache de préfixe: {e}")
+        return state
+
+    def _restore_prefix(self, prompt, prefix):
+        if not prefix or not prompt.startswith(prefix):
+            return
+        self.prime_prefix(prefix)
+        state = self._prefix_states[prefix]
+        client = self.llm.client
+        current = client.input_ids
+        if len(current) >= state.n_tokens and list(current[:state.n_tokens]) == list(state.input_ids[:state.n_tokens]):
+            self.prefix_hits += 1  # Le préfixe est déjà dans le cache KV
+            return
+        client.load_state(state)
+        self.prefix_restores += 1
+
+    def prefill(self, prompt, prompt_prefix=None):
+        """
+        Évalue `prompt` sans rien générer : l'appel suivant qui commence par ce prompt n'évalue que
+        la suite. Retourne le nombre de tokens réellement calculés.
+        """
+        with self.lock:
+            self._restore_prefix(prompt, prompt_prefix)
+            client = self.llm.client
+            tokens = client.tokenize(prompt.encode("utf-8"), special=True)
+            common = 0
+            for current_token, token in zip(client.input_ids, tokens):
+                if current_token != token:
+                    break
+                common += 1
+            # Même réutilisation du préfixe commun que Llama.generate (eval() tronque le cache KV à n_tokens)
+            client.n_tokens = common
+            if common < len(tokens):
+                client.eval(tokens[common:])
+            return len(tokens) - common
+
+    def invoke(self, prompt, profile, prompt_prefix=None):
+        with self.lock:
+            self._restore_prefix(prompt, prompt_prefix)
+            return self.llm.invoke(prompt, **profile.call_kwargs())
+
+    def stream(self, prompt, profile, prompt_prefix=None):
+        with self.lock:
+            self._restore_prefix(prompt, prompt_prefix)
+            for chunk in self.llm.stream(prompt, **profile.call_kwargs()):
+                yield chunk
+
+    def role(self, profile, prompt_prefix=None):
+        return LlmRole(self, profile, prompt_prefix)
+
+
+class LlmRole:
+    """Un rôle sur le modèle partagé, avec les mêmes invoke()/stream() qu'une instance LlamaCpp dédiée."""
+
+    def __init__(self, model, profile, prompt_prefix=None):
+        self.model = model
+        self.profile = profile
+        self.prompt_prefix = prompt_prefix
+
+    def prime(self):
+        """Précalcule l'état KV du préfixe constant du rôle."""
+        if self.prompt_prefix:
+            return self.model.prime_prefix(self.prompt_prefix)
+        return 0
+
+    def prefill(self, prompt):
+        return self.model.prefill(prompt, self.prompt_prefix)
+
+    def invoke(self, prompt):
+        return self.model.invoke(prompt, self.profile, self.prompt_prefix)
+
+    def stream(self, prompt):
+        return self.model.stream(prompt, self.profile, self.prompt_prefix)
@@ -1,18 +1,25 @@
 import os
 import re
+import json
 import sqlite3
 import pickle
+import threading
 from datetime import datetime
-from collections import deque
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 import sys
 
 import numpy as np
-from langchain_community.llms import LlamaCpp
+from llama_cpp import LlamaGrammar
 from langchain.agents import Tool
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
 
+from .llm_backend import LlmCallProfile, SharedLlamaModel, static_prompt_prefix
+from .tool_router import ToolRouter
+from .ai_emotion_classifier import EmotionCentroidClassifier
+
 NEW_FACE_REQUEST_LANGCHAIN = False # Flag global pour la demande d'enregistrement
 
 # --- Configuration ---
@@ -20,6 +27,7 @@ MEMORY_DIR = "memory_langchain"
 VECTOR_STORE_INDEX_DIR = os.path.join(MEMORY_DIR, "vector_store_stm")
 VECTOR_IDS_PATH = os.path.join(MEMORY_DIR, "vector_store_stm_ids.pkl")
 LTM_DB_PATH = os.path.join(MEMORY_DIR, "long_term_memory.db")
+PROMPT_CACHE_DIR = os.path.join(MEMORY_DIR, "prompt_cache") # États KV des préfixes constants des templates
 
 MODEL_DIR = "./model"
 MODEL_NAME = "gemma-3-4B-it-QAT-Q4_0.gguf"
@@ -28,11 +36,34 @@ MODEL_PATH = os.path.join(MODEL_DIR, MODEL_NAME)
 NUM_RECENT_TURNS_FOR_DIRECT_CONTEXT = 3
 MAX_STM_VECTOR_COUNT = 100
 NUM_TURNS_FOR_EMOTION_CONTEXT = 3
-
+LLM_CONTEXT_SIZE = 2048
+# Pré-routage (règles + similarité MiniLM) avant le décideur d'outils LLM
+TOOL_PRE_ROUTER_ENABLED = True
+# Émotion de Julie : "llm" (agent émotion) ou "classifier" (plus proche centroïde MiniLM appris sur la LTM, repli LLM)
+AI_EMOTION_BACKEND = "llm"
+# Déroulement d'un tour : "three_calls" (décideur d'outils, répondeur, agent émotion) ou
+# "single_shot" (une génération JSON contrainte par grammaire : outil, réponse et émotion)
+LLM_TURN_MODE = "three_calls"
+
+# Les trois rôles partagent le même modèle chargé une seule fois : seuls ces réglages d'appel diffèrent
+TOOL_DECIDER_PROFILE = LlmCallProfile("tool_decider", temperature=0.05, max_tokens=100,
+    stop=["\n", "Utilisateur:", "Julie:", "Historique:", "Outils disponibles:", "Décision d'outil:", "Réponse:", "Assistant:"])
+FINAL_RESPONDER_PROFILE = LlmCallProfile("final_responder", temperature=0.65, max_tokens=250,
+    stop=["Utilisateur:", "Utilisateur :", "\nUtilisateur:", "Julie:", "Julie :", "\nJulie:",
+          "Assistant:", "Assistant :", "\nAssistant:", "\n\n", "<|eot_id|>", "<|end_of_turn|>"])
+EMOTION_AGENT_PROFILE = LlmCallProfile("emotion_agent", temperature=0.05, max_tokens=30, stop=["\n", ".", ","])
+
+shared_llm = None
 llm_tool_decider = None
 llm_final_responder = None
 llm_emotion_agent = None
+llm_single_shot = None
 embeddings_model = None
+tool_router = None
+ai_emotion_classifier = None
+# Fin de tour (émotion de Julie, STM, LTM) exécutée en arrière-plan quand un callback d'émotion est fourni
+_turn_finalizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-finalize")
+_pending_turn_finalization = None
 stm_vectorstore = None
 stm_vector_id_deque = deque()
 stm_retriever = None # Ajouté pour être initialisé
@@ -42,7 +73,8 @@ full_conversation_log_for_emotion_agent = deque(maxlen=NUM_TURNS_FOR_EMOTION_CON
 _CURRENT_USER_QUERY_FOR_STM_TOOL = ""
 
 def init_llms_and_memory():
-    global llm_tool_decider, llm_final_responder, llm_emotion_agent, embeddings_model
+    global shared_llm, llm_tool_decider, llm_final_responder, llm_emotion_agent, embeddings_model, tool_router
+    global ai_emotion_classifier, llm_single_shot
     global stm_vectorstore, stm_vector_id_deque, stm_retriever
     global conversation_history_deque, full_conversation_log_for_emotion_agent
 
@@ -55,24 +87,29 @@ def init_llms_and_memory():
     common_llm_params = {
         "model_path": MODEL_PATH,
         "n_gpu_layers": -1,
-        "n_ctx": 2048,
+        "n_ctx": LLM_CONTEXT_SIZE,
         "verbose": False,
         "model_kwargs": {"backend": "vulkan"},
     }
     try:
-        llm_tool_decider = LlamaCpp(**common_llm_params, temperature=0.05, max_tokens=100,
-            stop=["\n", "Utilisateur:", "Julie:", "Historique:", "Outils disponibles:", "Décision d'outil:", "Réponse:", "Assistant:"])
-        llm_final_responder = LlamaCpp(**common_llm_params, temperature=0.65, max_tokens=250,
-            stop=["Utilisateur:", "Utilisateur :", "\nUtilisateur:", "Julie:", "Julie :", "\nJulie:",
-                  "Assistant:", "Assistant :", "\nAssistant:", "\n\n", "<|eot_id|>", "<|end_of_turn|>"])
-        llm_emotion_agent = LlamaCpp(**common_llm_params, temperature=0.05, max_tokens=30, stop=["\n", ".", ","])
-        print("LLMs LlamaCpp initialisés.")
+        shared_llm = SharedLlamaModel(prompt_cache_dir=PROMPT_CACHE_DIR, **common_llm_params)
+        llm_tool_decider = shared_llm.role(TOOL_DECIDER_PROFILE,
+            prompt_prefix=static_prompt_prefix(TOOL_DECIDE_PROMPT_TEMPLATE, tools_description=TOOLS_DESCRIPTION))
+        llm_final_responder = shared_llm.role(FINAL_RESPONDER_PROFILE,
+            prompt_prefix=static_prompt_prefix(FINAL_RESPONSE_PROMPT_TEMPLATE))
+        llm_emotion_agent = shared_llm.role(EMOTION_AGENT_PROFILE,
+            prompt_prefix=static_prompt_prefix(EMOTION_DETECT_PROMPT_TEMPLATE))
+        llm_single_shot = _build_single_shot_role()
+        print("LLM LlamaCpp initialisé (un modèle partagé par les 3 rôles).")
     except Exception as e:
         print(f"ERREUR CRITIQUE lors de l'initialisation des LLMs LlamaCpp: {e}")
         raise
 
     embeddings_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
     print("Modèle d'embeddings HuggingFace chargé.")
+    if TOOL_PRE_ROUTER_ENABLED:
+        tool_router = ToolRouter(embeddings_model)
+        print("Pré-routeur d'outils prêt.")
 
     if os.path.exists(os.path.join(VECTOR_STORE_INDEX_DIR, "index.faiss")):
         print("Chargement de la STM (FAISS) existante...")
@@ -103,10 +140,17 @@ def init_llms_and_memory():
     print("STM (FAISS sémantique) prête.")
     init_ltm_db()
     print("LTM (SQLite persistante) prête.")
+    if AI_EMOTION_BACKEND == "classifier":
+        ai_emotion_classifier = EmotionCentroidClassifier(embeddings_model, EMOTIONS_LIST_FOR_AGENT)
+        ai_emotion_classifier.train_from_ltm(LTM_DB_PATH)
 
     print("Chauffage des modèles LLM...")
     try:
-        _ = llm_tool_decider.invoke(TOOL_DECIDE_PROMPT_TEMPLATE.format(tools_description="Test", conversation_history_for_tool_decider="Test", input="Test"))
+        prefix_tokens = [role.prime() for role in (llm_tool_decider, llm_final_responder, llm_emotion_agent)]
+        print(f"Préfixes de prompt en cache KV (tokens): outils={prefix_tokens[0]}, réponse={prefix_tokens[1]}, émotion={prefix_tokens[2]}")
+        if LLM_TURN_MODE == "single_shot" and llm_single_shot is not None:
+            print(f"Préfixe single-shot en cache KV: {llm_single_shot.prime()} tokens")
+        _ = llm_tool_decider.invoke(TOOL_DECIDE_PROMPT_TEMPLATE.format(tools_description=TOOLS_DESCRIPTION, conversation_history_for_tool_decider="Test", input="Test"))
         _ = llm_final_responder.invoke(FINAL_RESPONSE_PROMPT_TEMPLATE.format(user_name="Testeur",user_detected_emotion="neutre",tool_results_context="Aucun.",conversation_history_for_responder="Utilisateur: Bonjour.") + "Julie:")
         _ = llm_emotion_agent.invoke(EMOTION_DETECT_PROMPT_TEMPLATE.format(recent_history_for_emotion="Utilisateur: test", text_to_analyze="test") + "\nÉmotion de Julie:")
         print("Modèles LLM chauffés.")
@@ -168,8 +212,17 @@ def add_to_stm_and_slide(texts_to_add: list[str]):
         with open(VECTOR_IDS_PATH, "wb") as f: pickle.dump(stm_vector_id_deque, f)
     except Exception as e_save: print(f"Erreur sauvegarde STM sémantique: {e_save}")
 
+def wait_for_pending_turn():
+    """Attend la fin de tour en arrière-plan (émotion, STM, LTM) du tour précédent."""
+    global _pending_turn_finalization
+    pending, _pending_turn_finalization = _pending_turn_finalization, None
+    if pending is not None:
+        try: pending.result()
+        except Exception as e: print(f"Erreur fin de tour en arrière-plan: {e}")
+
 def reset_short_term_context_deques():
     global conversation_history_deque, full_conversation_log_for_emotion_agent
+    wait_for_pending_turn()
     print("--- Réinitialisation des deques de contexte direct ---")
     conversation_history_deque.clear()
     full_conversation_log_for_emotion_agent.clear()
@@ -229,6 +282,8 @@ tools_list = [
     Tool(name="end_conversation", func=end_conversation_func, description="Si l'utilisateur veut CLAIREMENT finir. Format: `end_conversation()`")
 ]
 tools_map = {tool.name: tool for tool in tools_list}
+# Constante : fait partie du préfixe mis en cache du prompt de décision d'outil
+TOOLS_DESCRIPTION = "\n".join([f"- {tool.name}: {tool.description}" for tool in tools_list])
 
 EMOTIONS_LIST_FOR_AGENT = ["joie", "tristesse", "neutre", "colère", "surprise", "peur", "dégout"]
 EMOTION_DETECT_PROMPT_TEMPLATE = f"""Tu interprètes l'émotion de Julie basée sur sa réponse et le contexte récent.
@@ -278,6 +333,74 @@ Historique de la conversation (le dernier message est celui de l'utilisateur, tu
 {conversation_history_for_responder}
 Julie:"""
 
+SINGLE_SHOT_TOOL_NAMES = ["none"] + [tool.name for tool in tools_list]
+SINGLE_SHOT_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tool": {"type": "string", "enum": SINGLE_SHOT_TOOL_NAMES},
+        "tool_args": {"type": "string"},
+        "reply": {"type": "string"},
+        "emotion": {"type": "string", "enum": EMOTIONS_LIST_FOR_AGENT},
+    },
+    "required": ["tool", "tool_args", "reply", "emotion"],
+}
+
+SINGLE_SHOT_PROMPT_TEMPLATE = """Tu es Julie, une IA amicale et serviable. Poursuis la conversation de manière naturelle et concise.
+Soit plutot positif dans tes réponses, ne t'excuse pas. Comporte toi de façon empathique, s'il est dégouter, alors soit dégouté.
+INTERDICTION DE REPETER LES MESSAGES PRECEDANTS
+
+Outils disponibles:
+{tools_description}
+
+Réponds UNIQUEMENT avec un objet JSON :
+- "tool": "none" si aucun outil n'est nécessaire, sinon le nom de l'outil à utiliser.
+- "tool_args": les mots-clés pour query_long_term_memory (ex: "vacances, plage"), sinon "".
+- "reply": ta réponse à l'utilisateur si "tool" vaut "none", sinon "".
+- "emotion": ton émotion en répondant, parmi : {emotions_list}.
+
+Contexte de l'utilisateur:
+- Prénom: {user_name}
+- Émotion détectée chez l'utilisateur (à prendre avec précaution, peut être "impossible" ou "---"): {user_detected_emotion}
+
+Historique de la conversation (le dernier message est celui de l'utilisateur):
+{conversation_history_for_responder}
+JSON:"""
+
+def _build_single_shot_role():
+    """Rôle single-shot sur le modèle partagé, sortie contrainte par la grammaire du schéma JSON."""
+    try:
+        grammar = LlamaGrammar.from_json_schema(json.dumps(SINGLE_SHOT_JSON_SCHEMA, ensure_ascii=False), verbose=False)
+    except Exception as e:
+        print(f"Mode single-shot indisponible (grammaire JSON): {e}")
+        return None
+    profile = LlmCallProfile("single_shot", temperature=0.65, max_tokens=320, grammar=grammar)
+    return shared_llm.role(profile, prompt_prefix=static_prompt_prefix(
+        SINGLE_SHOT_PROMPT_TEMPLATE, tools_description=TOOLS_DESCRIPTION, emotions_list=", ".join(EMOTIONS_LIST_FOR_AGENT)))
+
+def _single_shot_decision(user_name: str, user_detected_emotion: str, history_for_responder_str: str):
+    """Une seule génération JSON : {"tool", "tool_args", "reply", "emotion"}, ou None si la sortie est inexploitable."""
+    prompt = SINGLE_SHOT_PROMPT_TEMPLATE.format(
+        tools_description=TOOLS_DESCRIPTION,
+        emotions_list=", ".join(EMOTIONS_LIST_FOR_AGENT),
+        user_name=user_name,
+        user_detected_emotion=user_detected_emotion,
+        conversation_history_for_responder=history_for_responder_str
+    )
+    try:
+        decision = json.loads(llm_single_shot.invoke(prompt))
+    except Exception as e:
+        print(f"Erreur single-shot, repli sur les trois appels: {e}")
+        return None
+    if not isinstance(decision, dict) or decision.get("tool") not in SINGLE_SHOT_TOOL_NAMES:
+        print(f"Sortie single-shot invalide, repli sur les trois appels: {decision}")
+        return None
+    return {
+        "tool": decision["tool"],
+        "tool_args": str(decision.get("tool_args") or "").strip(),
+        "reply": str(decision.get("reply") or ""),
+        "emotion": decision.get("emotion") if decision.get("emotion") in EMOTIONS_LIST_FOR_AGENT else "neutre",
+    }
+
 def detect_ai_emotion(text_to_analyze: str, recent_history_for_emotion_prompt: str) -> str:
     if not text_to_analyze.strip() or llm_emotion_agent is None: return "neutre"
     prompt = EMOTION_DETECT_PROMPT_TEMPLATE.format(
@@ -296,26 +419,125 @@ def detect_ai_emotion(text_to_analyze: str, recent_history_for_emotion_prompt: s
         print(f"Erreur détection émotion Julie: {e}")
         return "neutre"
 
-def process_user_input_langchain(user_query_raw: str, user_name: str, user_detected_emotion: str):
-    global _CURRENT_USER_QUERY_FOR_STM_TOOL, conversation_history_deque, full_conversation_log_for_emotion_agent
-    global NEW_FACE_REQUEST_LANGCHAIN
-
-    NEW_FACE_REQUEST_LANGCHAIN = False # Réinitialiser le flag à chaque appel
-    _CURRENT_USER_QUERY_FOR_STM_TOOL = user_query_raw
+def detect_julie_emotion(text_to_analyze: str, recent_history_for_emotion_prompt: str) -> str:
+    """Classifieur si configuré et assez sûr de lui, sinon agent émotion LLM."""
+    if ai_emotion_classifier is not None:
+        try:
+            predicted_emotion = ai_emotion_classifier.predict(text_to_analyze)
+            if predicted_emotion is not None: return predicted_emotion
+        except Exception as e:
+            print(f"Erreur classifieur émotion Julie, repli LLM: {e}")
+    return detect_ai_emotion(text_to_analyze, recent_history_for_emotion_prompt)
+
+RESPONDER_STOP_PATTERNS = [
+    "Utilisateur:", "Utilisateur :", "\nUtilisateur:",
+    "Julie:", "Julie :", "\nJulie:",
+    "Assistant:", "Assistant :", "\nAssistant:",
+    "\n\n\n"
+]
+# Fin de phrase pour le streaming : ponctuation finale suivie d'un espace (la phrase suivante a commencé)
+SENTENCE_END_PATTERN = re.compile(r"[.!?…]+[\"»)]*\s+")
+MIN_STREAMED_SENTENCE_CHARS = 20
+
+def _strip_responder_prefix(raw_text: str) -> str:
+    text = raw_text.lstrip()
+    if text.lower().startswith("julie:"):
+        text = text[len("Julie:"):].lstrip()
+    return text
+
+def clean_responder_output(raw_julie_response: str) -> str:
+    """Retire le préfixe "Julie:" et coupe au premier motif d'arrêt (tour de parole halluciné)."""
+    raw_julie_response = _strip_responder_prefix(raw_julie_response.strip())
+    min_index = len(raw_julie_response)
+    for pattern in RESPONDER_STOP_PATTERNS:
+        try:
+            idx = raw_julie_response.index(pattern)
+            if idx < min_index: min_index = idx
+        except ValueError: continue
+    
+    if min_index < len(raw_julie_response):
+        raw_julie_response = raw_julie_response[:min_index].strip()
+    return raw_julie_response
 
-    history_for_tool_decider_str = "\n".join(list(conversation_history_deque)) or "(Début de la conversation)"
-    history_for_responder_list = list(conversation_history_deque)
-    history_for_responder_list.append(f"Utilisateur: {user_query_raw}")
-    history_for_responder_str = "\n".join(history_for_responder_list)
+class ResponderStream:
+    """
+    Nettoyage incrémental de la sortie du répondeur pendant le streaming : même résultat que
+    clean_responder_output, appliqué au fil des tokens. La fin du texte qui pourrait encore devenir
+    un motif d'arrêt est retenue jusqu'au token suivant ; chaque phrase complète est transmise à
+    `on_sentence`. Si `on_sentence` retourne False (barge-in), la génération est abandonnée.
+    """
 
-    tools_description_for_prompt = "\n".join([f"- {tool.name}: {tool.description}" for tool in tools_list])
-    
-    tool_decide_prompt_input = TOOL_DECIDE_PROMPT_TEMPLATE.format(
-        tools_description=tools_description_for_prompt,
-        conversation_history_for_tool_decider=history_for_tool_decider_str,
-        input=user_query_raw
-    )
-    raw_tool_decisions_str = llm_tool_decider.invoke(tool_decide_prompt_input).strip().replace("`", "")
+    def __init__(self, on_sentence):
+        self.on_sentence = on_sentence
+        self.raw = ""
+        self.stopped = False
+        self.cancelled = False
+        self._sentence_start = 0
+        self._max_pattern_len = max(len(pattern) for pattern in RESPONDER_STOP_PATTERNS)
+
+    def _held_back(self, text):
+        """Nombre de caractères finaux qui peuvent encore être le début d'un motif d'arrêt."""
+        for size in range(min(len(text), self._max_pattern_len - 1), 0, -1):
+            tail = text[-size:]
+            if any(pattern.startswith(tail) for pattern in RESPONDER_STOP_PATTERNS):
+                return size
+        return 0
+
+    def feed(self, chunk):
+        """Ajoute un morceau de sortie ; retourne False quand la génération doit s'arrêter."""
+        if self.stopped or self.cancelled:
+            return False
+        self.raw += chunk
+        head = self.raw.lstrip().lower()
+        if len(head) < len("julie:") and "julie:".startswith(head):
+            return True  # Peut encore être le préfixe "Julie:"
+        text = _strip_responder_prefix(self.raw)
+        if any(pattern in text for pattern in RESPONDER_STOP_PATTERNS):
+            self.stopped = True  # Les phrases restantes partent dans finish()
+            return False
+        self._emit_sentences(text[:len(text) - self._held_back(text)])
+        return not self.cancelled
+
+    def _emit_sentences(self, safe_text):
+        for match in SENTENCE_END_PATTERN.finditer(safe_text, self._sentence_start):
+            sentence = safe_text[self._sentence_start:match.end()].strip()
+            if len(sentence) < MIN_STREAMED_SENTENCE_CHARS:
+                continue  # Trop court (abréviation, interjection) : regroupé avec la suite
+            self._sentence_start = match.end()
+            if self.on_sentence(sentence) is False:
+                self.cancelled = True
+                return
+
+    def finish(self):
+        """Envoie la fin de la réponse et retourne la réponse complète nettoyée."""
+        final_response = clean_responder_output(self.raw)
+        if self.cancelled:
+            # Interrompue : seul ce qui a été transmis a été (en partie) prononcé
+            return final_response[:self._sentence_start].strip()
+        remainder = final_response[self._sentence_start:].strip()
+        if remainder:
+            self.on_sentence(remainder)
+        return final_response
+
+def _decide_tool_calls(user_query_raw: str, history_for_tool_decider_str: str, speculation=None):
+    """
+    Décision d'outil (pré-routeur puis décideur LLM). Retourne la liste des appels [(nom, argument)].
+    Pendant une spéculation, la décision du pré-routeur n'est pas comptée : elle est gardée dans
+    `speculation` et comptée par take_speculative_turn si la spéculation est réutilisée.
+    """
+    routed_decision = None
+    if tool_router is not None:
+        routed_decision = tool_router.route(user_query_raw, record=speculation is None)
+        if speculation is not None: speculation["routed_decision"] = routed_decision
+    if routed_decision is not None:
+        raw_tool_decisions_str = routed_decision.tool_call
+    else:
+        tool_decide_prompt_input = TOOL_DECIDE_PROMPT_TEMPLATE.format(
+            tools_description=TOOLS_DESCRIPTION,
+            conversation_history_for_tool_decider=history_for_tool_decider_str,
+            input=user_query_raw
+        )
+        raw_tool_decisions_str = llm_tool_decider.invoke(tool_decide_prompt_input).strip().replace("`", "")
     
     common_prefixes_to_strip = [
         "décision d'outil:", "tool decision:", "outil:", "tool:",
@@ -327,10 +549,7 @@ def process_user_input_langchain(user_query_raw: str, user_name: str, user_detec
             raw_tool_decisions_str = raw_tool_decisions_str[len(prefix):].strip()
             break
 
-    accumulated_tool_results = []
-    julie_final_response = ""
-    conversation_ended_by_tool_flag = False
-
+    tool_calls = []
     if raw_tool_decisions_str.upper() != "NONE" and raw_tool_decisions_str != "":
         potential_tool_calls = [call.strip() for call in raw_tool_decisions_str.split(',') if call.strip()]
         tool_call_pattern = re.compile(r"([a-zA-Z0-9_]+)\s*\(\s*(?:([a-zA-Z0-9_]+)\s*=\s*)?(?:'(.*?)'|\"(.*?)\"|([^'\")\s][^,()]*?))?\s*\)")
@@ -340,86 +559,264 @@ def process_user_input_langchain(user_query_raw: str, user_name: str, user_detec
             if tool_match:
                 tool_name = tool_match.group(1)
                 tool_arg_value = next((val for val in tool_match.groups()[2:] if val is not None), "").strip()
+                tool_calls.append((tool_name, tool_arg_value))
+    return tool_calls
 
-                if tool_name in tools_map:
-                    try:
-                        tool_to_run = tools_map[tool_name]
-                        if tool_name in ["query_long_term_memory"]:
-                            tool_output = tool_to_run.func(tool_arg_value)
-                        else:
-                            tool_output = tool_to_run.func()
-                        
-                        if tool_output == "FIN_CONVERSATION_DEMANDEE_PAR_OUTIL":
-                            conversation_ended_by_tool_flag = True
-                            julie_final_response = "D'accord. À la prochaine !"
-                            accumulated_tool_results.append(f"Note: L'outil '{tool_name}' a mis fin à la conversation.")
-                            break
-                        else:
-                            accumulated_tool_results.append(f"Résultat de l'outil '{tool_name}': \"{tool_output}\"")
-                            if tool_name == "enregistrer_visage_utilisateur": # NEW_FACE_REQUEST_LANGCHAIN est mis à True dans la fonction
-                                pass # Le message de l'outil est suffisant pour le contexte du LLM
-                    except Exception as e_tool_exec:
-                        accumulated_tool_results.append(f"(Erreur interne avec l'outil {tool_name}.)")
+def _run_tool_calls(tool_calls):
+    """Exécute les appels [(nom, argument)]. Retourne (contexte des outils, réponse imposée ou "", fin demandée)."""
+    accumulated_tool_results = []
+    julie_final_response = ""
+    conversation_ended_by_tool_flag = False
+
+    for tool_name, tool_arg_value in tool_calls:
+        if tool_name in tools_map:
+            try:
+                tool_to_run = tools_map[tool_name]
+                if tool_name in ["query_long_term_memory"]:
+                    tool_output = tool_to_run.func(tool_arg_value)
+                else:
+                    tool_output = tool_to_run.func()
+                
+                if tool_output == "FIN_CONVERSATION_DEMANDEE_PAR_OUTIL":
+                    conversation_ended_by_tool_flag = True
+                    julie_final_response = "D'accord. À la prochaine !"
+                    accumulated_tool_results.append(f"Note: L'outil '{tool_name}' a mis fin à la conversation.")
+                    break
                 else:
-                    accumulated_tool_results.append(f"(Outil '{tool_name}' non reconnu.)")
+                    accumulated_tool_results.append(f"Résultat de l'outil '{tool_name}': \"{tool_output}\"")
+                    if tool_name == "enregistrer_visage_utilisateur": # NEW_FACE_REQUEST_LANGCHAIN est mis à True dans la fonction
+                        pass # Le message de l'outil est suffisant pour le contexte du LLM
+            except Exception as e_tool_exec:
+                accumulated_tool_results.append(f"(Erreur interne avec l'outil {tool_name}.)")
+        else:
+            accumulated_tool_results.append(f"(Outil '{tool_name}' non reconnu.)")
 
     tool_results_for_final_prompt = "\n".join(accumulated_tool_results)
     if tool_results_for_final_prompt:
         tool_results_for_final_prompt = "Contexte fourni par les outils:\n" + tool_results_for_final_prompt + "\n"
     else:
         tool_results_for_final_prompt = "Aucun outil n'a été utilisé."
+    return tool_results_for_final_prompt, julie_final_response, conversation_ended_by_tool_flag
+
+def _generate_final_response(final_response_prompt_input: str, on_sentence=None) -> str:
+    """Réponse de Julie ; avec `on_sentence`, les tokens sont lus en flux et chaque phrase est transmise dès qu'elle est complète."""
+    if on_sentence is None:
+        return clean_responder_output(llm_final_responder.invoke(final_response_prompt_input))
+    stream = ResponderStream(on_sentence)
+    chunks = llm_final_responder.stream(final_response_prompt_input)
+    try:
+        for chunk in chunks:
+            if not stream.feed(chunk):
+                break
+    finally:
+        chunks.close()  # Libère le modèle partagé même si la génération est abandonnée
+    return stream.finish()
 
-    if not conversation_ended_by_tool_flag:
-        final_response_prompt_input = FINAL_RESPONSE_PROMPT_TEMPLATE.format(
-            user_name=user_name,
-            user_detected_emotion=user_detected_emotion,
-            tool_results_context=tool_results_for_final_prompt,
-            conversation_history_for_responder=history_for_responder_str
-        )
-        raw_julie_response = llm_final_responder.invoke(final_response_prompt_input).strip()
-
-        stop_patterns_responder = [
-            "Utilisateur:", "Utilisateur :", "\nUtilisateur:",
-            "Julie:", "Julie :", "\nJulie:",
-            "Assistant:", "Assistant :", "\nAssistant:",
-            "\n\n\n"
-        ]
-        if raw_julie_response.lower().startswith("julie:"):
-            raw_julie_response = raw_julie_response[len("Julie:"):].strip()
-
-        min_index = len(raw_julie_response)
-        for pattern in stop_patterns_responder:
-            try:
-                idx = raw_julie_response.index(pattern)
-                if idx < min_index: min_index = idx
-            except ValueError: continue
-        
-        if min_index < len(raw_julie_response):
-            raw_julie_response = raw_julie_response[:min_index].strip()
-        
-        julie_final_response = raw_julie_response or "Je ne suis pas sûre de comment répondre à cela."
-    
+def _finalize_turn(user_query_raw: str, julie_final_response: str, user_name: str, user_detected_emotion: str, on_emotion=None, known_emotion=None) -> str:
+    """
+    Émotion de Julie (sauf si `known_emotion` est déjà fournie, en mode single-shot), historique de
+    l'agent émotion, STM et LTM une fois la réponse connue. Retourne l'émotion.
+    """
     emotion_agent_history_list = list(full_conversation_log_for_emotion_agent)
     emotion_agent_history_list.append(f"Utilisateur: {user_query_raw}")
     recent_history_for_emotion_prompt = "\n".join(emotion_agent_history_list) or "(Début conversation)"
     
-    julies_detected_emotion = detect_ai_emotion(julie_final_response, recent_history_for_emotion_prompt)
-    
-    conversation_history_deque.append(f"Utilisateur: {user_query_raw}")
-    conversation_history_deque.append(f"Julie: {julie_final_response}")
+    julies_detected_emotion = known_emotion or detect_julie_emotion(julie_final_response, recent_history_for_emotion_prompt)
+    if on_emotion is not None:
+        try: on_emotion(julies_detected_emotion)
+        except Exception as e: print(f"Erreur callback émotion Julie: {e}")
 
     full_conversation_log_for_emotion_agent.append(f"Utilisateur: {user_query_raw}")
     full_conversation_log_for_emotion_agent.append(f"Julie ({julies_detected_emotion}): {julie_final_response}")
 
     add_to_stm_and_slide([f"Utilisateur: {user_query_raw}", f"Julie: {julie_final_response}"])
     save_to_long_term_memory(user_query_raw, julie_final_response, julies_detected_emotion, user_name, user_detected_emotion)
+    return julies_detected_emotion
+
+def process_user_input_langchain(user_query_raw: str, user_name: str, user_detected_emotion: str, on_sentence=None, on_emotion=None,
+                                 speculative_tool_calls=None):
+    """
+    Tour complet : outils, réponse de Julie, émotion et mémoires.
+    Avec `on_sentence`, la réponse est générée en streaming et chaque phrase complète est passée
+    à `on_sentence` (le TTS) pendant que la génération continue ; les réponses imposées par un
+    outil ne sont pas transmises.
+    Avec `on_emotion`, l'émotion de Julie, la STM et la LTM sont traitées en arrière-plan (pendant
+    la synthèse vocale) : l'émotion retournée vaut None et arrive plus tard par `on_emotion`.
+    `speculative_tool_calls` : décision d'outil déjà prise par le mode spéculatif (take_speculative_turn).
+    Retourne (réponse, émotion de Julie, fin de conversation, demande de visage).
+    """
+    global _CURRENT_USER_QUERY_FOR_STM_TOOL, _pending_turn_finalization
+    global NEW_FACE_REQUEST_LANGCHAIN
+
+    wait_for_pending_turn() # Historiques et mémoires du tour précédent complets
+
+    NEW_FACE_REQUEST_LANGCHAIN = False # Réinitialiser le flag à chaque appel
+    _CURRENT_USER_QUERY_FOR_STM_TOOL = user_query_raw
+
+    history_for_tool_decider_str = "\n".join(list(conversation_history_deque)) or "(Début de la conversation)"
+    history_for_responder_list = list(conversation_history_deque)
+    history_for_responder_list.append(f"Utilisateur: {user_query_raw}")
+    history_for_responder_str = "\n".join(history_for_responder_list)
+
+    julie_final_response, known_emotion, conversation_ended_by_tool_flag = "", None, False
+    single_shot = None
+    if LLM_TURN_MODE == "single_shot" and llm_single_shot is not None:
+        single_shot = _single_shot_decision(user_name, user_detected_emotion, history_for_responder_str)
+    if single_shot is not None and single_shot["tool"] == "none":
+        # Réponse et émotion déjà produites par la génération JSON
+        julie_final_response = clean_responder_output(single_shot["reply"])
+        known_emotion = single_shot["emotion"]
+        if julie_final_response and on_sentence is not None: on_sentence(julie_final_response)
+
+    if not julie_final_response:
+        if single_shot is not None:
+            tool_calls = [] if single_shot["tool"] == "none" else [(single_shot["tool"], single_shot["tool_args"])]
+        elif speculative_tool_calls is not None:
+            tool_calls = speculative_tool_calls
+        else:
+            tool_calls = _decide_tool_calls(user_query_raw, history_for_tool_decider_str)
+        tool_results_for_final_prompt, julie_final_response, conversation_ended_by_tool_flag = _run_tool_calls(tool_calls)
+        known_emotion = None
+
+    if not julie_final_response and not conversation_ended_by_tool_flag:
+        final_response_prompt_input = FINAL_RESPONSE_PROMPT_TEMPLATE.format(
+            user_name=user_name,
+            user_detected_emotion=user_detected_emotion,
+            tool_results_context=tool_results_for_final_prompt,
+            conversation_history_for_responder=history_for_responder_str
+        )
+        julie_final_response = _generate_final_response(final_response_prompt_input, on_sentence) \
+            or "Je ne suis pas sûre de comment répondre à cela."
+    
+    conversation_history_deque.append(f"Utilisateur: {user_query_raw}")
+    conversation_history_deque.append(f"Julie: {julie_final_response}")
+
+    if on_emotion is not None:
+        julies_detected_emotion = None
+        _pending_turn_finalization = _turn_finalizer.submit(
+            _finalize_turn, user_query_raw, julie_final_response, user_name, user_detected_emotion, on_emotion, known_emotion)
+    else:
+        julies_detected_emotion = _finalize_turn(user_query_raw, julie_final_response, user_name, user_detected_emotion,
+                                                 known_emotion=known_emotion)
 
     return julie_final_response, julies_detected_emotion, conversation_ended_by_tool_flag, NEW_FACE_REQUEST_LANGCHAIN
 
+# --- Mode spéculatif : routage d'outil et préremplissage du prompt pendant une courte pause de l'utilisateur ---
+# Mots qui, ajoutés à la fin du texte partiel, ne changent pas la demande
+SPECULATIVE_FILLER_WORDS = {"euh", "heu", "hum", "bah", "ben", "bon", "hein", "quoi", "voilà", "donc", "alors", "julie"}
+_speculation_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-speculation")
+_speculation = None
+_speculation_lock = threading.Lock()
+speculation_stats = Counter()
+
+def _transcript_words(text: str):
+    return re.findall(r"[\w']+", text.lower())
+
+def transcript_extends_with_filler(final_text: str, speculative_text: str) -> bool:
+    """True si la transcription finale est le texte spéculé, suivi au plus de mots de remplissage."""
+    final_words, speculative_words = _transcript_words(final_text), _transcript_words(speculative_text)
+    if not speculative_words or final_words[:len(speculative_words)] != speculative_words:
+        return False
+    return all(word in SPECULATIVE_FILLER_WORDS for word in final_words[len(speculative_words):])
+
+def start_speculative_turn(partial_text: str, user_name: str, user_detected_emotion: str):
+    """
+    Lance en arrière-plan, sur un texte partiel, la décision d'outil et le préremplissage du cache KV
+    avec le prompt du répondeur. Aucun outil n'est exécuté : le résultat n'est utilisé que si la
+    transcription finale correspond (take_speculative_turn).
+    """
+    global _speculation
+    partial_text = partial_text.strip()
+    if not partial_text or shared_llm is None: return
+    with _speculation_lock:
+        if _speculation is not None and _speculation["text"] == partial_text: return
+        speculation = {
+            "text": partial_text,
+            "user_name": user_name,
+            "user_detected_emotion": user_detected_emotion,
+            "history": tuple(conversation_history_deque),
+        }
+        speculation["future"] = _speculation_executor.submit(_run_speculation, speculation)
+        _speculation = speculation
+        speculation_stats["started"] += 1
+
+def _run_speculation(speculation):
+    if _speculation is not speculation: return None # Déjà remplacée par un texte plus récent
+    pending = _pending_turn_finalization
+    if pending is not None: wait([pending])
+    user_query_raw = speculation["text"]
+    history_for_tool_decider_str = "\n".join(speculation["history"]) or "(Début de la conversation)"
+    history_for_responder_str = "\n".join(list(speculation["history"]) + [f"Utilisateur: {user_query_raw}"])
+
+    if LLM_TURN_MODE == "single_shot" and llm_single_shot is not None:
+        llm_single_shot.prefill(SINGLE_SHOT_PROMPT_TEMPLATE.format(
+            tools_description=TOOLS_DESCRIPTION,
+            emotions_list=", ".join(EMOTIONS_LIST_FOR_AGENT),
+            user_name=speculation["user_name"],
+            user_detected_emotion=speculation["user_detected_emotion"],
+            conversation_history_for_responder=history_for_responder_str
+        ))
+        return None
+
+    tool_calls = _decide_tool_calls(user_query_raw, history_for_tool_decider_str, speculation=speculation)
+    if not tool_calls and _speculation is speculation:
+        # Sans outil, le prompt du répondeur est entièrement connu : on le fait évaluer maintenant
+        llm_final_responder.prefill(FINAL_RESPONSE_PROMPT_TEMPLATE.format(
+            user_name=speculation["user_name"],
+            user_detected_emotion=speculation["user_detected_emotion"],
+            tool_results_context="Aucun outil n'a été utilisé.",
+            conversation_history_for_responder=history_for_responder_str
+        ))
+    return tool_calls
+
+def take_speculative_turn(final_text: str, user_name: str):
+    """
+    Transcription finale reçue : retourne la spéculation {"text", "user_detected_emotion", "tool_calls"}
+    si elle correspond (même texte, ou seulement des mots de remplissage en plus), sinon None.
+    Dans les deux cas, la spéculation en cours est consommée.
+    """
+    global _speculation
+    with _speculation_lock:
+        speculation, _speculation = _speculation, None
+    if speculation is None: return None
+    matches = speculation["user_name"] == user_name \
+        and speculation["history"] == tuple(conversation_history_deque) \
+        and transcript_extends_with_filler(final_text, speculation["text"])
+    if matches:
+        try:
+            speculation["tool_calls"] = speculation["future"].result()
+        except Exception as e:
+            print(f"Erreur spéculation: {e}")
+            matches = False
+    if matches and tool_router is not None and "routed_decision" in speculation:
+        tool_router.record(speculation["routed_decision"])  # Décision comptée une seule fois, quand elle est utilisée
+    speculation_stats["hits" if matches else "misses"] += 1
+    hits, misses = speculation_stats["hits"], speculation_stats["misses"]
+    print(f"Spéculation LLM: {'réutilisée' if matches else 'abandonnée'} - succès {hits}/{hits + misses}")
+    return speculation if matches else None
+
+def cancel_speculative_turn():
+    """Abandonne la spéculation en cours sans la compter (fin de conversation, entrée console, ...)."""
+    global _speculation
+    with _speculation_lock:
+        if _speculation is not None: speculation_stats["cancelled"] += 1
+        _speculation = None
+
+def get_llm_stats():
+    """Compteurs pour le réglage : spéculation, pré-routeur d'outils, cache des préfixes de prompt."""
+    hits, misses = speculation_stats["hits"], speculation_stats["misses"]
+    return {
+        "speculation": dict(speculation_stats, hit_ratio=hits / (hits + misses) if hits + misses else 0.0),
+        "tool_router": tool_router.stats() if tool_router is not None else None,
+        "prefix_cache": {"hits": shared_llm.prefix_hits, "restores": shared_llm.prefix_restores} if shared_llm is not None else None,
+    }
+
 def clear_all_memories():
     global conversation_history_deque, stm_vectorstore, stm_vector_id_deque, embeddings_model
     global full_conversation_log_for_emotion_agent, stm_retriever
 
+    cancel_speculative_turn()
+    wait_for_pending_turn()
     print("--- Effacement de TOUTES les mémoires ---")
     reset_short_term_context_deques()
 
@@ -449,6 +846,7 @@ def clear_all_memories():
             print(f"Erreur suppression LTM '{LTM_DB_PATH}': {e}.")
     init_ltm_db()
     print("LTM (SQLite persistante) effacée et réinitialisée.")
+    if ai_emotion_classifier is not None: ai_emotion_classifier.train_from_ltm(LTM_DB_PATH)
     print("--- Toutes les mémoires ont été effacées. ---")
 
 if __name__ == "__main__":
@@ -7,6 +7,9 @@ import emoji
 # MODIFIÉ: Import relatif explicite car llm_langchain_logic est dans le même package (src)
 from .llm_langchain_logic import process_user_input_langchain, NEW_FACE_REQUEST_LANGCHAIN
 
+# Réponse de secours en cas d'erreur (phrase fixe, pré-rendue au démarrage par le cache TTS)
+ERROR_RESPONSE_TEMPLATE = "Désolé {user_name}, une erreur interne s'est produite."
+
 def remove_emojis_fn(text):
     if text:
         return emoji.replace_emoji(text, replace='')
@@ -17,9 +20,15 @@ class LLMProcessor:
         self._running = True
         # Pas de modèle ou d'instance de chat ici, tout est géré par llm_langchain_logic
 
-    def process_input(self, texte_utilisateur_brut: str, emotion_utilisateur_detectee: str, prenom_utilisateur: str):
+    def process_input(self, texte_utilisateur_brut: str, emotion_utilisateur_detectee: str, prenom_utilisateur: str, on_sentence=None, on_emotion=None,
+                      speculative_tool_calls=None):
         """
         Traite l'entrée utilisateur en utilisant la logique Langchain.
+        Si `on_sentence` est fourni, la réponse est générée en streaming et chaque phrase (sans emojis)
+        lui est passée dès qu'elle est complète ; retourner False depuis `on_sentence` arrête la génération.
+        Si `on_emotion` est fourni, l'émotion de Julie lui est passée depuis un thread d'arrière-plan
+        et ai_detected_emotion vaut None.
+        `speculative_tool_calls` : décision d'outil déjà prise pendant la pause de l'utilisateur (mode spéculatif).
         Retourne: (ai_response_text, ai_detected_emotion, conversation_should_end, face_request_triggered)
         """
         if not self._running:
@@ -33,7 +42,10 @@ class LLMProcessor:
                 process_user_input_langchain(
                     user_query_raw=texte_utilisateur_brut,
                     user_name=prenom_utilisateur,
-                    user_detected_emotion=emotion_utilisateur_detectee
+                    user_detected_emotion=emotion_utilisateur_detectee,
+                    on_sentence=self._clean_sentence_callback(on_sentence),
+                    on_emotion=on_emotion,
+                    speculative_tool_calls=speculative_tool_calls
                 )
             
             final_response_cleaned = remove_emojis_fn(ai_response_text)
@@ -43,9 +55,18 @@ class LLMProcessor:
 
         except Exception as e:
             print(f"LLMProcessor: Erreur critique lors de l'appel à process_user_input_langchain: {e}")
-            error_message = f"Désolé {prenom_utilisateur}, une erreur interne s'est produite."
+            error_message = ERROR_RESPONSE_TEMPLATE.format(user_name=prenom_utilisateur)
             return error_message, "tristesse", False, False
 
+    @staticmethod
+    def _clean_sentence_callback(on_sentence):
+        if on_sentence is None:
+            return None
+        def forward(sentence):
+            cleaned = remove_emojis_fn(sentence).strip()
+            return on_sentence(cleaned) if cleaned else True
+        return forward
+
     def stop(self):
         print("LLMProcessor: Demande d'arrêt.")
         self._running = False
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class PresenceGate:
+    """
+    Filtre peu coûteux placé avant la détection MTCNN. La frame est réduite (~80 px de large)
+    et passée en niveaux de gris, puis comparée à un fond appris :
+    - "running_average" : moyenne glissante NumPy du fond
+    - "mog2"            : soustraction de fond OpenCV MOG2
+    Une frame n'est transmise à la détection que s'il y a du mouvement, si un visage est
+    déjà suivi, ou toutes les `keepalive_interval` secondes (personne parfaitement immobile).
+    """
+
+    def __init__(self, method="running_average", downscale_width=80, alpha=0.05,
+                 pixel_threshold=25, motion_fraction=0.01, keepalive_interval=3.0):
+        self.method = method
+        self.downscale_width = downscale_width
+        self.alpha = alpha
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.keepalive_interval = keepalive_interval
+        self._background = None
+        self._mog2 = None
+        if method == "mog2":
+            self._mog2 = cv2.createBackgroundSubtractorMOG2(history=200, varThreshold=16, detectShadows=False)
+        self._last_forward_time = 0.0
+        self.frames_seen = 0
+        self.frames_skipped = 0
+
+    def reset(self):
+        self._background = None
+        self._last_forward_time = 0.0
+        if self.method == "mog2":
+            self._mog2 = cv2.createBackgroundSubtractorMOG2(history=200, varThreshold=16, detectShadows=False)
+
+    def _small_gray(self, frame_bgr):
+        height, width = frame_bgr.shape[:2]
+        small_height = max(1, int(height * self.downscale_width / float(width)))
+        small = cv2.resize(frame_bgr, (self.downscale_width, small_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _motion_ratio(self, gray):
+        if self._mog2 is not None:
+            mask = self._mog2.apply(gray)
+            return np.count_nonzero(mask) / float(mask.size)
+
+        gray_f = gray.astype(np.float32)
+        if self._background is None:
+            self._background = gray_f
+            return 1.0
+        diff = np.abs(gray_f - self._background)
+        self._background += self.alpha * (gray_f - self._background)
+        return np.count_nonzero(diff > self.pixel_threshold) / float(diff.size)
+
+    def check(self, frame_bgr, tracked_faces=False, now=None):
+        """Retourne True si la frame doit être envoyée à la détection de visages."""
+        now = time.monotonic() if now is None else now
+        self.frames_seen += 1
+        motion = self._motion_ratio(self._small_gray(frame_bgr)) >= self.motion_fraction
+        if motion or tracked_faces or now - self._last_forward_time >= self.keepalive_interval:
+            self._last_forward_time = now
+            return True
+        self.frames_skipped += 1
+        return False
+
+    @property
+    def skipped_fraction(self):
+        return self.frames_skipped / float(self.frames_seen) if self.frames_seen else 0.0
+
+    def stats(self):
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_skipped": self.frames_skipped,
+            "skipped_fraction": round(self.skipped_fraction, 3),
+        }
@@ -1,10 +1,16 @@
 import pyaudio
 from vosk import Model, KaldiRecognizer
+import collections
 import json
 import threading
 import queue
 import time
 import os
+import numpy as np
+
+AUDIO_SAMPLE_RATE = 16000
+# Marqueur placé dans la queue audio : le reconnaisseur repart de zéro (voir BargeInDetector)
+RESET_RECOGNIZER = object()
 
 def init_vosk_model(model_path):
     """Charge et retourne le modèle Vosk"""
@@ -21,24 +27,151 @@ def init_vosk_model(model_path):
         raise RuntimeError(f"Erreur de chargement du modèle Vosk: {e}")
 
 
-def init_audio(input_device_index):
-    """Initialise l'audio dans un thread séparé et retourne la queue/shutdown_flag"""
+class BargeInDetector:
+    """
+    Détection de prise de parole pendant que Julie parle (barge-in), sur le flux du micro.
+    VAD par énergie : RMS de trames de 20 ms comparé à un plancher de bruit adaptatif (mis à jour
+    sur les trames sans parole, y compris l'écho de la voix de Julie après la calibration).
+    Quand le détecteur est armé (lecture TTS en cours), les chunks ne vont pas à Vosk mais dans
+    un tampon de pré-enregistrement. Si `trigger_frames` trames sur les `window_frames` dernières
+    sont de la parole : `on_barge_in()` est appelé (coupure du TTS) et le reconnaisseur reçoit un
+    RESET_RECOGNIZER suivi du pré-enregistrement, pour ne perdre aucun mot.
+    """
+
+    def __init__(self, sample_rate=AUDIO_SAMPLE_RATE, frame_ms=20, speech_ratio=3.0, min_rms=300.0,
+                 trigger_frames=6, window_frames=8, calibration_ms=300, preroll_ms=800,
+                 floor_alpha=0.05, on_barge_in=None):
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.speech_ratio = speech_ratio
+        self.min_rms = min_rms
+        self.trigger_frames = trigger_frames
+        self.calibration_frames = int(calibration_ms / frame_ms)
+        self.preroll_bytes = int(sample_rate * preroll_ms / 1000) * 2
+        self.floor_alpha = floor_alpha
+        self.on_barge_in = on_barge_in
+        self._lock = threading.Lock()
+        self._armed = False
+        self._noise_floor = None
+        self._speech_window = collections.deque(maxlen=window_frames)
+        self._frames_since_arm = 0
+        self._preroll = collections.deque()
+        self._preroll_size = 0
+        self.triggers = 0
+
+    @property
+    def armed(self):
+        return self._armed
+
+    def arm(self):
+        """À appeler au début de la lecture TTS."""
+        with self._lock:
+            if self._armed:
+                return
+            self._armed = True
+            self._frames_since_arm = 0
+            self._speech_window.clear()
+            self._preroll.clear()
+            self._preroll_size = 0
+
+    def disarm(self):
+        """Fin de lecture sans prise de parole : le pré-enregistrement (écho) est abandonné."""
+        with self._lock:
+            self._armed = False
+            self._preroll.clear()
+            self._preroll_size = 0
+
+    def _frame_rms(self, chunk):
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        count = samples.shape[0] // self.frame_length
+        if count == 0:
+            return np.empty(0, dtype=np.float32)
+        frames = samples[:count * self.frame_length].reshape(count, self.frame_length).astype(np.float32)
+        return np.sqrt(np.mean(frames * frames, axis=1))
+
+    def process(self, chunk):
+        """Retourne la liste des éléments à transmettre au reconnaisseur pour ce chunk."""
+        triggered = False
+        with self._lock:
+            for rms in self._frame_rms(chunk):
+                if self._noise_floor is None:
+                    self._noise_floor = rms
+                if self._armed and self._frames_since_arm < self.calibration_frames:
+                    # Début de lecture : le plancher rejoint vite le niveau de l'écho
+                    self._frames_since_arm += 1
+                    self._noise_floor = max(self._noise_floor, 0.5 * self._noise_floor + 0.5 * rms)
+                    continue
+                is_speech = rms > max(self._noise_floor * self.speech_ratio, self.min_rms)
+                if not is_speech:
+                    self._noise_floor += self.floor_alpha * (rms - self._noise_floor)
+                if self._armed:
+                    self._speech_window.append(is_speech)
+                    if sum(self._speech_window) >= self.trigger_frames:
+                        triggered = True
+            if not self._armed:
+                return [chunk]
+            self._preroll.append(chunk)
+            self._preroll_size += len(chunk)
+            while self._preroll_size > self.preroll_bytes and len(self._preroll) > 1:
+                self._preroll_size -= len(self._preroll.popleft())
+            if not triggered:
+                return []
+            forwarded = [RESET_RECOGNIZER] + list(self._preroll)
+            self._armed = False
+            self._preroll.clear()
+            self._preroll_size = 0
+            self.triggers += 1
+        if self.on_barge_in is not None:
+            try:
+                self.on_barge_in()
+            except Exception as e:
+                print(f"Barge-in: Erreur dans le callback: {e}")
+        return forwarded
+
+
+def _put_audio_item(audio_queue, item, timeout=0.5):
+    """
+    Transmet un élément au reconnaisseur. File pleine : le plus ancien chunk audio est abandonné pour
+    faire de la place ; un RESET_RECOGNIZER déjà en file n'est jamais abandonné.
+    """
+    try:
+        audio_queue.put(item, block=True, timeout=timeout)
+        return
+    except queue.Full:
+        pass
+    with audio_queue.mutex:
+        for index, queued in enumerate(audio_queue.queue):
+            if queued is not RESET_RECOGNIZER:
+                del audio_queue.queue[index]
+                audio_queue.not_full.notify()
+                break
+    audio_queue.put(item, block=True, timeout=timeout)
+
+
+def init_audio(input_device_index, barge_in_detector=None):
+    """
+    Initialise l'audio dans un thread séparé et retourne la queue/shutdown_flag.
+    Avec un `barge_in_detector`, chaque chunk passe d'abord par lui (voir BargeInDetector).
+    """
     print(f"Audio: Initialisation de PyAudio. Utilisation du périphérique index {input_device_index}.")
-    audio_queue = queue.Queue(maxsize=20) # Augmenté un peu pour la robustesse
+    audio_queue = queue.Queue(maxsize=100) # ~10 s d'audio en chunks de 100 ms
     shutdown_flag = threading.Event()
 
     def audio_capture_thread(p_audio_instance, stream_instance):
         print("AudioCapture Thread: Démarré.")
-        frames_per_buffer_capture = 8000 # Lire des chunks plus petits plus fréquemment
+        # Chunks de 100 ms : assez courts pour que le barge-in réagisse vite
+        frames_per_buffer_capture = AUDIO_SAMPLE_RATE // 10
         try:
             while not shutdown_flag.is_set():
                 try:
                     data = stream_instance.read(frames_per_buffer_capture, exception_on_overflow=False)
                     if data:
-                        audio_queue.put(data, block=True, timeout=0.5) # Bloquant avec timeout
-                except queue.Full:
-                    # print("AudioCapture Thread: audio_queue pleine, buffer audio ignoré.")
-                    time.sleep(0.01) # Petite pause si la queue est pleine
+                        items = [data] if barge_in_detector is None else barge_in_detector.process(data)
+                        for item in items:
+                            try:
+                                _put_audio_item(audio_queue, item)
+                            except queue.Full:
+                                # File pleine de marqueurs (Vosk bloqué) : cet élément seul est perdu, pas la suite du pré-enregistrement
+                                time.sleep(0.01)
                 except IOError as e:
                     if e.errno == pyaudio.paInputOverflowed:
                         # print("AudioCapture Thread: Input overflowed. Ignoré.")
@@ -59,7 +192,7 @@ def init_audio(input_device_index):
     try:
         p = pyaudio.PyAudio()
         stream = p.open(
-            format=pyaudio.paInt16, channels=1, rate=16000, input=True,
+            format=pyaudio.paInt16, channels=1, rate=AUDIO_SAMPLE_RATE, input=True,
             frames_per_buffer=16000, # Buffer interne de PyAudio
             input_device_index=input_device_index
         )
@@ -83,7 +216,7 @@ def speech_to_text(model: Model, audio_data_queue: queue.Queue, shutdown_event:
     if not isinstance(model, Model):
         raise ValueError("Le modèle Vosk fourni n'est pas une instance valide de vosk.Model.")
 
-    recognizer = KaldiRecognizer(model, 16000)
+    recognizer = KaldiRecognizer(model, AUDIO_SAMPLE_RATE)
     recognizer.SetWords(True) # Activer pour obtenir des résultats partiels plus fréquents
     # recognizer.SetPartialWords(True) # Pourrait être utile aussi
 
@@ -92,6 +225,10 @@ def speech_to_text(model: Model, audio_data_queue: queue.Queue, shutdown_event:
         while not shutdown_event.is_set():
             try:
                 audio_chunk = audio_data_queue.get(block=True, timeout=0.1) # Attendre un peu pour les données
+                if audio_chunk is RESET_RECOGNIZER:
+                    # Barge-in : la phrase de l'utilisateur repart d'un état propre
+                    recognizer.Reset()
+                    continue
                 
                 if recognizer.AcceptWaveform(audio_chunk):
                     result_json = recognizer.Result()
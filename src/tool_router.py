@@ -0,0 +1,176 @@
+import collections
+import re
+import threading
+
+import numpy as np
+
+# tool_call : même format que la sortie du décideur LLM ("NONE" ou "outil()") ; source : "regle" ou "embedding"
+RouteDecision = collections.namedtuple("RouteDecision", ["tool_call", "source", "confidence"])
+
+NO_TOOL = "NONE"
+# Phrases types des questions sur la mémoire : jamais décidées ici (mots-clés à extraire), le LLM tranche
+MEMORY_LABEL = "memoire"
+
+# Formules de fin de conversation : la phrase entière doit n'être qu'un au revoir, avec au plus des
+# mots de remplissage ("mon fils m'a dit à bientôt" ne termine pas la conversation)
+_GOODBYE = (r"(au revoir|à la prochaine|à plus tard|à bientôt|bonne nuit|bye"
+            r"|(on arrête|arrêtons|terminons|finissons) (là|de discuter)"
+            r"|(fin|finir|terminer|arrêter|arrête|termine) (de |à )?(la|cette|notre) (conversation|discussion))")
+_GOODBYE_FILLERS = r"(bon|bah|ok|d'accord|allez|eh bien|merci( beaucoup)?|julie|alors|et|à toi|à vous|pour aujourd'hui)"
+
+# Règles sûres : un motif reconnu suffit à décider de l'outil
+TOOL_RULES = [
+    # L'heure actuelle seulement
+    ("get_current_time()", re.compile(
+        r"(?<!à )\bquelle heure (est-il|est il|il est)\b|\bil est quelle heure\b|^quelle heure\W*$"
+        r"|\b(donne|connais|sais|savoir|connaître)\w*\b.{0,20}\bl'heure\W*$|\bl'heure (qu'il est|actuelle)\b")),
+    ("enregistrer_visage_utilisateur()", re.compile(
+        r"\b(enregistr|m[ée]moris|sauvegard|retien)\w*\b.{0,40}\bvisage\b|\bvisage\b.{0,40}\b(enregistr|m[ée]moris|sauvegard)")),
+    ("end_conversation()", re.compile(
+        rf"^(\W*{_GOODBYE_FILLERS}\b)*\W*{_GOODBYE}(\W+({_GOODBYE_FILLERS}|{_GOODBYE})\b)*\W*$")),
+]
+
+# Négation ou discours rapporté : une règle ou une phrase type ne suffit plus ("n'enregistre pas mon visage",
+# "je n'ai pas envie de te dire au revoir") : toujours laissés au décideur LLM
+NEGATION_OR_REPORTED_SPEECH = re.compile(
+    r"(\bne\b|\bn')[^.?!]*\b(pas|jamais|plus|rien)\b|\bpas envie\b|\bsurtout pas\b|\bjamais\b"
+    r"|\bdi(re|s|t|sait)\b")
+
+# Heure d'un événement ("à quelle heure commence le film ?") : pas l'horloge, le décideur LLM tranche
+EVENT_TIME_QUESTION = re.compile(r"\b(à|vers|de|jusqu'à) quelle heure\b")
+
+# Questions qui peuvent demander la mémoire (STM/LTM, avec mots-clés) : toujours laissées au décideur LLM
+MEMORY_CUES = re.compile(
+    r"souvien|rappelle|m[ée]moire|derni[eè]re fois|tout à l'heure|je t'ai (dit|parlé|raconté)|on a (parlé|discuté)"
+    r"|\bhier\b|\bavant\b|la semaine")
+
+# Phrases types par décision, comparées à la question via l'embedding MiniLM déjà chargé pour la STM
+TOOL_EXEMPLARS = {
+    "get_current_time()": [
+        "Quelle heure est-il ?", "Tu peux me donner l'heure ?", "Il est quelle heure maintenant ?",
+        "Tu sais quelle heure il est ?",
+    ],
+    "enregistrer_visage_utilisateur()": [
+        "Enregistre mon visage.", "Je voudrais que tu mémorises mon visage.",
+        "Tu peux apprendre à me reconnaître ?", "Ajoute-moi à ta base de visages.",
+    ],
+    "end_conversation()": [
+        "Au revoir Julie.", "On arrête là, merci.", "J'ai fini, à plus tard.", "Je dois y aller, salut.",
+        "Merci, c'est tout pour aujourd'hui.",
+    ],
+    NO_TOOL: [
+        "Bonjour Julie, comment ça va ?", "Raconte-moi une blague.", "Qu'est-ce que tu aimes faire ?",
+        "Je suis fatigué aujourd'hui.", "Tu connais des bons films ?", "Merci beaucoup, c'est gentil.",
+        "Explique-moi comment fonctionne un arc-en-ciel.", "J'ai passé une bonne journée.",
+        "Quel temps fait-il chez toi ?", "Tu es qui ?",
+    ],
+    MEMORY_LABEL: [
+        "Comment s'appelle mon chien ?", "Tu te souviens de mon prénom ?", "Qu'est-ce que je t'ai dit sur mon travail ?",
+        "C'est quoi mon plat préféré ?", "Où est-ce que je suis parti en vacances ?", "Quel âge a ma sœur ?",
+        "De quoi on parlait ?", "Tu sais ce que j'ai fait ce week-end ?",
+    ],
+}
+
+
+class ToolRouter:
+    """
+    Pré-routage de la décision d'outil, avant le décideur LLM :
+    1. règles (regex) pour l'heure, l'enregistrement de visage et les au revoir ;
+    2. similarité cosinus de l'embedding de la question avec des phrases types par outil, par
+       conversation ordinaire (NONE) et par question sur la mémoire.
+    Une décision n'est prise que si la meilleure catégorie est assez proche et devance toutes les
+    autres de `min_margin`. route() retourne None sinon, ou quand la question ressemble à une
+    question sur la mémoire : le décideur LLM tranche alors. Il tranche aussi, sans règle ni
+    embedding, en cas de négation, de discours rapporté ou d'heure d'un événement.
+    """
+
+    def __init__(self, embeddings_model=None, accept_similarity=0.75, min_margin=0.08, no_tool_above=0.6):
+        self.embeddings_model = embeddings_model
+        self.accept_similarity = accept_similarity
+        self.min_margin = min_margin
+        self.no_tool_above = no_tool_above
+        self._lock = threading.Lock()
+        self._counts = collections.Counter()
+        self._exemplar_labels = []
+        self._exemplar_matrix = None
+        if embeddings_model is not None:
+            try:
+                texts = []
+                for label, sentences in TOOL_EXEMPLARS.items():
+                    texts.extend(sentences)
+                    self._exemplar_labels.extend([label] * len(sentences))
+                self._exemplar_matrix = self._normalize(np.asarray(embeddings_model.embed_documents(texts), dtype=np.float32))
+            except Exception as e:
+                print(f"Routeur d'outils: Embeddings indisponibles ({e}), règles seules.")
+                self._exemplar_matrix = None
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _route_by_embedding(self, query):
+        if self._exemplar_matrix is None:
+            return None
+        query_vector = self._normalize(np.asarray(self.embeddings_model.embed_query(query), dtype=np.float32))
+        similarities = self._exemplar_matrix @ query_vector
+        best_by_label = {}
+        for label, similarity in zip(self._exemplar_labels, similarities):
+            best_by_label[label] = max(best_by_label.get(label, -1.0), float(similarity))
+        no_tool_similarity = best_by_label.pop(NO_TOOL, -1.0)
+        memory_similarity = best_by_label.pop(MEMORY_LABEL, -1.0)
+        tool_call, tool_similarity = max(best_by_label.items(), key=lambda item: item[1])
+        if tool_similarity >= self.accept_similarity \
+           and tool_similarity - max(no_tool_similarity, memory_similarity) >= self.min_margin:
+            return RouteDecision(tool_call, "embedding", tool_similarity)
+        if no_tool_similarity >= self.no_tool_above \
+           and no_tool_similarity - max(tool_similarity, memory_similarity) >= self.min_margin:
+            # Ressemble nettement à une conversation ordinaire
+            return RouteDecision(NO_TOOL, "embedding", no_tool_similarity)
+        return None
+
+    def route(self, query, record=True):
+        """
+        Décision sûre (RouteDecision) ou None pour laisser décider le LLM.
+        `record=False` (spéculation) : la décision n'est pas comptée, l'appelant la passe à record()
+        s'il l'utilise vraiment.
+        """
+        normalized = " ".join(query.lower().split())
+        decision = None
+        if not any(cue.search(normalized) for cue in (MEMORY_CUES, NEGATION_OR_REPORTED_SPEECH, EVENT_TIME_QUESTION)):
+            for tool_call, pattern in TOOL_RULES:
+                if pattern.search(normalized):
+                    decision = RouteDecision(tool_call, "regle", 1.0)
+                    break
+            if decision is None:
+                try:
+                    decision = self._route_by_embedding(query)
+                except Exception as e:
+                    print(f"Routeur d'outils: Erreur embedding ({e}), décision confiée au LLM.")
+        if record:
+            self.record(decision)
+        return decision
+
+    def record(self, decision):
+        """Compte une décision de route() (None = décideur LLM) dans les statistiques."""
+        with self._lock:
+            self._counts["total"] += 1
+            self._counts[decision.source if decision else "llm"] += 1
+            total, avoided = self._counts["total"], self._counts["total"] - self._counts["llm"]
+        if decision:
+            print(f"Routeur d'outils: {decision.tool_call} ({decision.source}, confiance {decision.confidence:.2f}) "
+                  f"- appels LLM évités: {avoided}/{total} ({100.0 * avoided / total:.0f}%)")
+        else:
+            print(f"Routeur d'outils: confiance insuffisante, décideur LLM - appels LLM évités: {avoided}/{total} ({100.0 * avoided / total:.0f}%)")
+
+    def stats(self):
+        with self._lock:
+            total = self._counts["total"]
+            avoided = total - self._counts["llm"]
+            return {
+                "total": total,
+                "regle": self._counts["regle"],
+                "embedding": self._counts["embedding"],
+                "llm": self._counts["llm"],
+                "llm_calls_avoided_ratio": avoided / total if total else 0.0,
+            }
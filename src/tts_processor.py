@@ -1,26 +1,143 @@
 # MODIFIÉ: Import relatif
-from .Kokoro import speak_mix 
+import itertools
+import queue
+import threading
+
+from .Kokoro import speak_mix_stream, warm_up_phrase_cache
+
+
+class SpeechJob:
+    """
+    Demande de synthèse confiée au thread TTS. `done` est levé quand la demande est terminée
+    (jouée, interrompue ou annulée) ; `interrupted` indique si elle a été coupée avant la fin.
+    """
+
+    def __init__(self, job_id, text, priority, on_done=None):
+        self.id = job_id
+        self.text = text
+        self.priority = priority
+        self.done = threading.Event()
+        self.stop_event = threading.Event()
+        self.interrupted = False
+        self._on_done = on_done
+
+    def cancel(self):
+        """Annule la demande si elle attend encore, ou coupe la lecture si elle est en cours."""
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def _finish(self, interrupted):
+        self.interrupted = interrupted
+        self.done.set()
+        if self._on_done is not None:
+            try:
+                self._on_done(self)
+            except Exception as e:
+                print(f"TTSProcessor: Erreur dans le callback de fin de synthèse: {e}")
+
 
 class TTSProcessor:
+    """
+    Synthèse vocale dans un thread dédié : speak_async() place une demande dans une file à
+    priorité (plus petite valeur = plus urgente) et rend la main immédiatement.
+    Les événements {"type": "speaking_started" | "speaking_finished", "job": SpeechJob}
+    sont publiés dans `events` pour l'orchestrateur.
+    """
+
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 10
+    EVENT_SPEAKING_STARTED = "speaking_started"
+    EVENT_SPEAKING_FINISHED = "speaking_finished"
+    VOICE_SETTINGS = {"voice1": "ff_siwis", "voice2": "if_sara", "mix_ratio": 0.85, "speed": 1.0, "lang": "fr-fr"}
+
     def __init__(self):
         self._running = True
+        self._jobs = queue.PriorityQueue()
+        self._job_ids = itertools.count(1)
+        self._state_lock = threading.Condition()
+        self._live_jobs = set()
+        self.events = queue.Queue()
+        self._worker_thread = threading.Thread(target=self._worker_loop, name="tts-worker", daemon=True)
+        self._worker_thread.start()
+
+    @staticmethod
+    def prepare_text(text_to_speak):
+        """Texte réellement synthétisé (les points de suspension finaux adoucissent la fin de phrase)."""
+        return str(text_to_speak) + "..."
+
+    def warm_up(self, texts):
+        """Pré-rend des réponses récurrentes exactement comme speak_text les prononcera."""
+        return warm_up_phrase_cache([self.prepare_text(text) for text in texts], **self.VOICE_SETTINGS)
+
+    def speak_async(self, text_to_speak, priority=PRIORITY_NORMAL, on_done=None, interrupt=False):
+        """
+        Ajoute une demande de synthèse et retourne son SpeechJob sans attendre.
+        `interrupt=True` coupe d'abord ce qui est en cours ou en attente (barge-in, message urgent).
+        """
+        job = SpeechJob(next(self._job_ids), text_to_speak, priority, on_done)
+        if not self._running or not text_to_speak or not str(text_to_speak).strip():
+            job._finish(interrupted=False)
+            return job
+        if interrupt:
+            self.interrupt()
+        with self._state_lock:
+            self._live_jobs.add(job)
+        self._jobs.put((priority, job.id, job))
+        return job
 
     def speak_text(self, text_to_speak: str):
-        if not self._running:
-            # print("TTSProcessor est arrêté, synthèse ignorée.")
-            return
-
-        if not text_to_speak or not text_to_speak.strip():
-            # print("TTSProcessor: Texte vide, rien à dire.")
-            return
-        
-        try:
-            speak_mix(str(text_to_speak) + "...", 
-                      voice1="ff_siwis", voice2="if_sara", 
-                      mix_ratio=0.85, speed=1.0, lang="fr-fr")
-        except Exception as e:
-            print(f"TTSProcessor: Erreur lors de la synthèse vocale: {e}")
+        """Version bloquante : attend la fin de la lecture."""
+        self.speak_async(text_to_speak).wait()
+
+    def interrupt(self):
+        """Coupe la phrase en cours et annule toutes les demandes en attente."""
+        with self._state_lock:
+            jobs = list(self._live_jobs)
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def is_busy(self):
+        """True tant qu'une demande est en attente ou en cours de lecture."""
+        with self._state_lock:
+            return bool(self._live_jobs)
+
+    def wait_until_idle(self, timeout=None):
+        with self._state_lock:
+            return self._state_lock.wait_for(lambda: not self._live_jobs, timeout=timeout)
+
+    def _worker_loop(self):
+        while True:
+            try:
+                _, _, job = self._jobs.get(timeout=0.2)
+            except queue.Empty:
+                if not self._running:
+                    break
+                continue
+            if job is None:
+                break
+            interrupted = job.stop_event.is_set()
+            if not interrupted:
+                try:
+                    # Synthèse phrase par phrase : la lecture commence dès que la première phrase est prête.
+                    # "speaking_started" est publié quand le son sort réellement (armement du barge-in).
+                    interrupted = not speak_mix_stream(
+                        self.prepare_text(job.text), stop_event=job.stop_event,
+                        on_playback_start=lambda: self.events.put({"type": self.EVENT_SPEAKING_STARTED, "job": job}),
+                        **self.VOICE_SETTINGS)
+                except Exception as e:
+                    print(f"TTSProcessor: Erreur lors de la synthèse vocale: {e}")
+            with self._state_lock:
+                self._live_jobs.discard(job)
+                self._state_lock.notify_all()
+            # Événement publié avant `done` : une demande terminée a toujours son "speaking_finished" dans `events`
+            self.events.put({"type": self.EVENT_SPEAKING_FINISHED, "job": job})
+            job._finish(interrupted)
 
     def stop(self):
         # print("TTSProcessor: Demande d'arrêt.")
-        self._running = False
\ No newline at end of file
+        self._running = False
+        self.interrupt()
+        self._jobs.put((-1, 0, None))
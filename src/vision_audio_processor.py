@@ -6,15 +6,22 @@ import numpy as np
 import time
 
 # MODIFIÉ: Imports relatifs
-from .emotion_detection import analyze_emotion 
-from .faceNet import detect_faces_and_coords, face_to_embedding, compare_face, analyze_database, normalize_lighting_color
+from .emotion_detection import analyze_emotions_batch
+from .faceNet import faces_to_embeddings, analyze_database
+from .face_preprocessing import FacePreprocessor
+from .face_tracker import FaceTracker
+from .vision_pipeline import LatestFrameGrabber, PipelineStage, StageQueue
+from .vision_governor import VisionGovernor
+from .presence_gate import PresenceGate
 from .text import speech_to_text 
 
 class VisionAudioProcessor:
     CONVERSATION_TRIGGER_WORD = "julie" 
 
     def __init__(self, history_size, emotion_model_instance, mtcnn_instance, facenet_instance, 
-                 vosk_model_instance, cap_instance, audio_data_q, shutdown_event, db_path):
+                 vosk_model_instance, cap_instance, audio_data_q, shutdown_event, db_path,
+                 detection_interval=10, cv_tracker_type=None, pipelined=True, governor=None,
+                 presence_gate=None, speculative_pause=None):
         self._history_size = history_size
         self._emotion_model = emotion_model_instance
         self._mtcnn = mtcnn_instance
@@ -27,20 +34,51 @@ class VisionAudioProcessor:
         self._database_path = db_path
 
         self._emotion_history = deque(maxlen=self._history_size)
-        self._face_identity_history = deque(maxlen=self._history_size) 
-        
-        self._last_processed_face_embedding = None 
+        # Vote majoritaire de l'identité, un historique par track de visage
+        self._face_identity_history = {}
+        self._tracker = FaceTracker(detection_interval=detection_interval, cv_tracker_type=cv_tracker_type)
+        self._tracker_reset_requested = threading.Event()
+        # Filtre de mouvement/présence devant MTCNN (pièce vide la plupart du temps)
+        self._presence_gate = presence_gate if presence_gate is not None else PresenceGate()
+        self._primary_track_id = None
+        self._vision_state_lock = threading.Lock()
+        # Prétraitement fusionné des visages (tampons préalloués : un par étage/thread)
+        emotion_input_size = getattr(emotion_model_instance, "input_size", (224, 224))
+        self._identity_preprocessor = FacePreprocessor()
+        self._emotion_preprocessor = FacePreprocessor(emotion_size=emotion_input_size, max_faces=1)
+
+        # Pipeline vision : chaque étage a son thread et une queue bornée en entrée
+        self._pipelined = pipelined
+        self._frame_grabber = LatestFrameGrabber(cap_instance)
+        self._identity_queue = StageQueue(maxsize=2, merge_dropped=self._merge_dropped_identity_requests)
+        self._emotion_queue = StageQueue(maxsize=2)
+        # Cadence de chaque étage selon l'état de la conversation et la latence mesurée
+        self._governor = governor if governor is not None else VisionGovernor()
+        self._vision_stages = [
+            PipelineStage("detection", self._stage_detect, None, self._identity_queue,
+                          frame_source=self._frame_grabber, governor=self._governor),
+            PipelineStage("identity", self._stage_identity, self._identity_queue, self._emotion_queue,
+                          governor=self._governor),
+            PipelineStage("emotion", self._stage_emotion, self._emotion_queue, governor=self._governor),
+        ]
         
         self._speech_text_queue = queue.Queue() 
         self._speech_recognition_thread = None 
 
         self._running = True 
         self._heavy_processing_active = True 
+        # Capture de la parole : suspendue avec les traitements lourds, mais reprise seule dès un barge-in
+        self._speech_capture_active = True
 
         self._current_accumulated_speech = ""
         self._last_speech_activity_time = time.time() 
         self._speech_stability_timeout = 2.0  
         self._min_speech_length_for_llm = 1   
+        # Mode spéculatif (None = désactivé) : après `speculative_pause` s sans changement du texte partiel,
+        # un événement "speech_pause" permet de préparer la réponse avant "speech_stable"
+        self._speculative_pause = speculative_pause
+        self._last_speech_change_time = time.time()
+        self._speculated_speech = ""
 
         self._last_console_print_time = 0
         self._console_print_interval = 1.0 
@@ -60,26 +98,193 @@ class VisionAudioProcessor:
         return max(counts, key=counts.get)
 
 
+    def _stable_identity(self):
+        history = self._face_identity_history.get(self._primary_track_id)
+        if history is None:
+            return "---"
+        return self._calculate_most_frequent(history)
+
+
+    # --- Étages du pipeline vision (capture -> détection -> identité -> émotion) ---
+
+    def _stage_detect(self, packet):
+        """Détection complète seulement quand le tracker l'exige, sinon simple suivi des boîtes."""
+        if self._tracker_reset_requested.is_set():
+            self._tracker_reset_requested.clear()
+            self._tracker.reset()
+            self._presence_gate.reset()
+            self._primary_track_id = None
+        if not self._heavy_processing_active:
+            return None
+        if not self._presence_gate.check(packet["frame_bgr"], tracked_faces=bool(self._tracker.tracks)):
+            self._record_no_face_emotion()  # Aucun visage suivi : la frame est écartée sans passer par l'émotion
+            return None
+
+        frame_rgb = cv2.cvtColor(packet["frame_bgr"], cv2.COLOR_BGR2RGB)
+        if self._tracker.needs_detection():
+            try:
+                boxes, _, _ = self._mtcnn.detect(frame_rgb)
+            except Exception as e:
+                print(f"Erreur de détection faciale (VisionAudioProcessor): {e}")
+                boxes = None
+            self._tracker.update_detections(boxes, frame_rgb)
+        else:
+            self._tracker.predict(frame_rgb)
+
+        # FaceNet uniquement pour les nouveaux tracks
+        identify_ids = set()
+        for track in self._tracker.tracks_needing_identity():
+            self._tracker.record_identity_attempt(track)
+            identify_ids.add(track.track_id)
+
+        primary_track = self._tracker.primary_track(self._primary_track_id)
+        self._primary_track_id = primary_track.track_id if primary_track is not None else None
+
+        packet["frame_rgb"] = frame_rgb
+        packet["tracks"] = [(track.track_id, list(track.box)) for track in self._tracker.tracks if track.misses == 0]
+        packet["alive_ids"] = self._tracker.track_ids()
+        packet["identify_ids"] = identify_ids
+        packet["primary_track_id"] = self._primary_track_id
+        self._governor.set_faces_present(bool(packet["tracks"]))
+        if not packet["tracks"]:
+            # Même si l'étage émotion est au repos (0 fps sans visage), l'émotion du visage parti ne doit pas rester
+            self._record_no_face_emotion()
+        return packet
+
+    def _record_no_face_emotion(self):
+        with self._vision_state_lock:
+            self._emotion_history.append("---")
+
+
+    def _stage_identity(self, packet):
+        """Un seul passage FaceNet pour tous les nouveaux visages de la frame, puis vote par track."""
+        if not self._heavy_processing_active:
+            return None
+        boxes_by_id = dict(packet["tracks"])
+        track_ids = [track_id for track_id in packet["identify_ids"] if track_id in boxes_by_id]
+        identities = []
+        if track_ids:
+            faces_rgb, _, coords = self._identity_preprocessor.process(
+                packet["frame_rgb"], [boxes_by_id[track_id] for track_id in track_ids])
+            if len(coords) == len(track_ids):
+                embeddings = faces_to_embeddings(faces_rgb, self._facenet)
+                identities = [(track_id, analyze_database(embedding, self._database_path))
+                              for track_id, embedding in zip(track_ids, embeddings)]
+
+        with self._vision_state_lock:
+            for track_id in list(self._face_identity_history):
+                if track_id not in packet["alive_ids"]:
+                    del self._face_identity_history[track_id]
+            for track_id, identity in identities:
+                history = self._face_identity_history.setdefault(track_id, deque(maxlen=self._history_size))
+                history.append(identity)
+        return packet
+
+
+    def _stage_emotion(self, packet):
+        """Émotion sur le visage principal uniquement."""
+        if not self._heavy_processing_active or not packet["tracks"]:
+            return None  # Sans visage, "---" est déjà enregistré par l'étage de détection
+        current_frame_emotion = "---"
+        primary_box = dict(packet["tracks"]).get(packet["primary_track_id"])
+        if primary_box is not None:
+            _, faces_rgb, coords = self._emotion_preprocessor.process(
+                packet["frame_rgb"], [primary_box], facenet=False, emotion=True)
+            if coords:
+                emotion_scores = analyze_emotions_batch(faces_rgb, self._emotion_model, is_rgb=True)[0]
+                current_frame_emotion = max(emotion_scores, key=emotion_scores.get, default="---") if emotion_scores else "---"
+
+        with self._vision_state_lock:
+            self._emotion_history.append(current_frame_emotion)
+        return None
+
+
+    @staticmethod
+    def _merge_dropped_identity_requests(dropped_packet, incoming_packet):
+        """Une frame abandonnée ne doit pas faire perdre une demande d'identification."""
+        visible_ids = {track_id for track_id, _ in incoming_packet["tracks"]}
+        incoming_packet["identify_ids"] |= dropped_packet["identify_ids"] & visible_ids
+
+
+    def _run_vision_stages_inline(self, frame_bgr):
+        """Mode séquentiel : les mêmes étages enchaînés dans le thread principal."""
+        packet = {"frame_id": None, "timestamp": time.time(), "frame_bgr": frame_bgr}
+        for stage in self._vision_stages:
+            packet = stage.run_once(packet)
+            if packet is None:
+                break
+
+
+    def _start_vision_pipeline(self):
+        self._frame_grabber.start()
+        for stage in self._vision_stages:
+            stage.start()
+
+
+    def read_frame(self):
+        """
+        Lecture d'une frame pour un usage externe (enregistrement de visage). En mode pipeline,
+        la caméra appartient au thread de capture : on prend sa dernière frame.
+        """
+        if self._pipelined and self._frame_grabber.running:
+            frame = self._frame_grabber.peek()
+            return frame is not None, frame
+        return self._cap.read()
+
+
+    def set_conversation_active(self, active):
+        """Appelé par l'orchestrateur pour adapter la cadence de la vision à l'état de la conversation."""
+        self._governor.set_conversation_active(active)
+
+
+    def get_pipeline_stats(self):
+        """Profondeur de queue, frames abandonnées et latence de chaque étage."""
+        stats = {
+            "capture": self._frame_grabber.stats(),
+            "governor": self._governor.stats(),
+            "presence_gate": self._presence_gate.stats(),
+        }
+        for stage in self._vision_stages:
+            stats[stage.name] = stage.stats()
+        return stats
+
+
+    def _reset_vision_state(self):
+        self._identity_queue.clear()
+        self._emotion_queue.clear()
+        self._tracker_reset_requested.set()
+        self._primary_track_id = None
+        with self._vision_state_lock:
+            self._emotion_history.clear()
+            self._face_identity_history.clear()
+
+
     def pause_heavy_processing(self):
         # print("VisionAudioProcessor: Pause des traitements lourds.")
         self._heavy_processing_active = False
+        self._speech_capture_active = False
         self._current_accumulated_speech = "" 
+        self._speculated_speech = ""
         while not self._speech_text_queue.empty():
             try: self._speech_text_queue.get_nowait()
             except queue.Empty: break
-        self._emotion_history.clear()
-        self._face_identity_history.clear()
-        self._last_processed_face_embedding = None
+        self._reset_vision_state()
 
 
     def resume_heavy_processing(self):
         # print("VisionAudioProcessor: Reprise des traitements lourds.")
         self._heavy_processing_active = True
-        self._last_speech_activity_time = time.time() 
+        self.resume_speech_capture()  # Sans effet après un barge-in : le texte déjà reçu est conservé
+        self._reset_vision_state()
+
+    def resume_speech_capture(self):
+        """Reprend l'accumulation de la parole sans relancer la vision (barge-in pendant que Julie parle)."""
+        if self._speech_capture_active:
+            return
+        self._last_speech_activity_time = time.time()
         self._current_accumulated_speech = ""
-        self._emotion_history.clear()
-        self._face_identity_history.clear()
-        self._last_processed_face_embedding = None
+        self._speculated_speech = ""
+        self._speech_capture_active = True
 
     def _start_speech_recognition(self):
         if self._speech_recognition_thread is None or not self._speech_recognition_thread.is_alive():
@@ -93,7 +298,7 @@ class VisionAudioProcessor:
     def _speech_to_text_loop(self):
         # print("VisionAudioProcessor: _speech_to_text_loop en attente de texte...")
         for text_segment in speech_to_text(self._vosk_model, self._audio_queue_from_text_module, self._shutdown_flag_from_text_module):
-            if text_segment and self._heavy_processing_active : 
+            if text_segment and self._speech_capture_active : 
                 self._speech_text_queue.put(text_segment)
             if self._shutdown_flag_from_text_module.is_set(): 
                 break
@@ -104,65 +309,28 @@ class VisionAudioProcessor:
         # print("VisionAudioProcessor: Démarrage du thread principal.")
         self._start_speech_recognition() 
         self._last_speech_activity_time = time.time()
+        if self._pipelined:
+            self._start_vision_pipeline()
 
         while self._running:
             if self._shutdown_flag_from_text_module.is_set(): 
                 self.stop() 
                 break
 
-            ret, frame_bgr = self._cap.read()
-            if not ret or frame_bgr is None:
-                time.sleep(0.02) 
-                continue
-
-            current_frame_emotion = "---"
-            current_frame_identity = "---"
-            
-            if self._heavy_processing_active:
-                face_images_rgb_list, face_coords_list = detect_faces_and_coords(frame_bgr, self._mtcnn)
-
-                if face_images_rgb_list:
-                    embeddings_list = []
-                    processed_face_images_rgb = []
-                    for face_rgb_raw in face_images_rgb_list:
-                        face_bgr_for_norm = cv2.cvtColor(face_rgb_raw, cv2.COLOR_RGB2BGR)
-                        normalized_bgr_face = normalize_lighting_color(face_bgr_for_norm)
-                        normalized_rgb_face = cv2.cvtColor(normalized_bgr_face, cv2.COLOR_BGR2RGB)
-                        embedding = face_to_embedding(normalized_rgb_face, self._facenet)
-                        if embedding is not None:
-                            embeddings_list.append(embedding)
-                            processed_face_images_rgb.append(normalized_rgb_face) 
-                    
-                    chosen_face_idx = -1
-                    if embeddings_list:
-                        if self._last_processed_face_embedding is not None:
-                            distances = [compare_face(self._last_processed_face_embedding, emb) for emb in embeddings_list]
-                            if distances:
-                                min_dist = min(distances)
-                                if min_dist < 0.8: 
-                                    chosen_face_idx = distances.index(min_dist)
-                                else: 
-                                    chosen_face_idx = 0 
-                        else: 
-                            chosen_face_idx = 0
-                    
-                    if chosen_face_idx != -1:
-                        self._last_processed_face_embedding = embeddings_list[chosen_face_idx]
-                        chosen_face_rgb = processed_face_images_rgb[chosen_face_idx]
-                        chosen_face_bgr_for_emotion = cv2.cvtColor(chosen_face_rgb, cv2.COLOR_RGB2BGR)
-                        emotion_scores = analyze_emotion(chosen_face_bgr_for_emotion, self._emotion_model)
-                        current_frame_emotion = max(emotion_scores, key=emotion_scores.get, default="---") if emotion_scores else "---"
-                        current_frame_identity = analyze_database(self._last_processed_face_embedding, self._database_path)
-                else: 
-                    self._last_processed_face_embedding = None 
-                
-                self._emotion_history.append(current_frame_emotion)
-                self._face_identity_history.append(current_frame_identity)
+            if not self._pipelined:
+                ret, frame_bgr = self._cap.read()
+                if not ret or frame_bgr is None:
+                    time.sleep(0.02) 
+                    continue
+                if self._heavy_processing_active:
+                    self._run_vision_stages_inline(frame_bgr)
 
+            if self._speech_capture_active:
                 try:
                     while not self._speech_text_queue.empty():
                         speech_part = self._speech_text_queue.get_nowait().strip()
                         if speech_part:
+                            previous_speech = self._current_accumulated_speech
                             if not self._current_accumulated_speech or \
                                (len(speech_part) > len(self._current_accumulated_speech) and \
                                 speech_part.startswith(self._current_accumulated_speech)) or \
@@ -171,11 +339,14 @@ class VisionAudioProcessor:
                             elif not self._current_accumulated_speech.endswith(speech_part): 
                                  self._current_accumulated_speech += " " + speech_part
                             self._last_speech_activity_time = time.time()
+                            if self._current_accumulated_speech != previous_speech:
+                                self._last_speech_change_time = self._last_speech_activity_time
                 except queue.Empty:
                     pass 
 
-            stable_emotion = self._calculate_most_frequent(self._emotion_history)
-            stable_identity = self._calculate_most_frequent(self._face_identity_history)
+            with self._vision_state_lock:
+                stable_emotion = self._calculate_most_frequent(self._emotion_history)
+                stable_identity = self._stable_identity()
             
             current_time_loop = time.time() # Renommé pour éviter conflit avec time module
             if current_time_loop - self._last_console_print_time > self._console_print_interval:
@@ -187,7 +358,20 @@ class VisionAudioProcessor:
                 })
                 self._last_console_print_time = current_time_loop
 
-            if self._heavy_processing_active and self._current_accumulated_speech:
+            if self._speech_capture_active and self._speculative_pause is not None and self._current_accumulated_speech \
+               and self._current_accumulated_speech != self._speculated_speech \
+               and time.time() - self._last_speech_change_time > self._speculative_pause:
+                self._speculated_speech = self._current_accumulated_speech
+                self.output_queue.put({
+                    "type": "speech_pause",
+                    "text": self._current_accumulated_speech.strip(),
+                    "user_emotion": stable_emotion,
+                    "user_identity": stable_identity,
+                    "is_known_user": stable_identity not in ["visage inconnu", "---"],
+                    "contains_trigger_word": self.CONVERSATION_TRIGGER_WORD in self._current_accumulated_speech.lower()
+                })
+
+            if self._speech_capture_active and self._current_accumulated_speech:
                 if (time.time() - self._last_speech_activity_time > self._speech_stability_timeout):
                     text_to_send_to_llm = self._current_accumulated_speech.strip()
                     num_words = len(text_to_send_to_llm.split())
@@ -208,6 +392,7 @@ class VisionAudioProcessor:
                     else: 
                         self._current_accumulated_speech = ""
                     self._last_speech_activity_time = time.time() 
+                    self._speculated_speech = ""
             
             time.sleep(0.03) 
 
@@ -216,4 +401,7 @@ class VisionAudioProcessor:
     def stop(self):
         # print("VisionAudioProcessor: Arrêt demandé.")
         self._running = False
+        self._frame_grabber.stop()
+        for stage in self._vision_stages:
+            stage.stop()
         # print("VisionAudioProcessor: Stoppé.")
\ No newline at end of file
@@ -0,0 +1,93 @@
+import threading
+import time
+
+
+class VisionGovernor:
+    """
+    Choisit la cadence de chaque étage du pipeline vision selon l'état de l'orchestrateur :
+    - "idle"         : personne devant la caméra, détection seulement (~2 fps)
+    - "presence"     : visage présent sans conversation, suivi + identité (~5 fps)
+    - "conversation" : conversation active, émotion à une cadence configurable
+    La cadence est aussi bornée par la latence mesurée de l'étage, pour qu'un étage ne
+    dépasse jamais `max_duty_cycle` du temps CPU d'un cœur et laisse la place au LLM.
+    """
+
+    STATE_IDLE = "idle"
+    STATE_PRESENCE = "presence"
+    STATE_CONVERSATION = "conversation"
+
+    DEFAULT_RATES = {
+        STATE_IDLE: {"detection": 2.0, "emotion": 0.0},
+        STATE_PRESENCE: {"detection": 5.0, "emotion": 1.0},
+        STATE_CONVERSATION: {"detection": 8.0, "emotion": 4.0},
+    }
+
+    def __init__(self, rates=None, conversation_emotion_fps=None, max_duty_cycle=0.5):
+        self._rates = {state: dict(stage_rates) for state, stage_rates in self.DEFAULT_RATES.items()}
+        if rates:
+            for state, stage_rates in rates.items():
+                self._rates.setdefault(state, {}).update(stage_rates)
+        if conversation_emotion_fps is not None:
+            self._rates[self.STATE_CONVERSATION]["emotion"] = conversation_emotion_fps
+        self.max_duty_cycle = max_duty_cycle
+        self._lock = threading.Lock()
+        self._conversation_active = False
+        self._faces_present = False
+        self._latencies = {}
+        self._next_run_time = {}
+
+    @property
+    def state(self):
+        if self._conversation_active:
+            return self.STATE_CONVERSATION
+        if self._faces_present:
+            return self.STATE_PRESENCE
+        return self.STATE_IDLE
+
+    def set_conversation_active(self, active):
+        self._conversation_active = bool(active)
+
+    def set_faces_present(self, present):
+        self._faces_present = bool(present)
+
+    def report_latency(self, stage, latency_seconds):
+        self._latencies[stage] = latency_seconds
+
+    def interval(self, stage):
+        """
+        Intervalle minimal (secondes) entre deux exécutions de l'étage, ou None si l'étage est coupé.
+        Un étage absent de la table des cadences n'est pas limité (il suit l'étage précédent).
+        """
+        fps = self._rates[self.state].get(stage)
+        if fps is None:
+            return 0.0
+        if fps <= 0:
+            return None
+        latency_bound = self._latencies.get(stage, 0.0) / self.max_duty_cycle
+        return max(1.0 / fps, latency_bound)
+
+    def time_until(self, stage, now=None):
+        """Secondes à attendre avant la prochaine exécution autorisée (None si l'étage est coupé)."""
+        if self.interval(stage) is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._next_run_time.get(stage, 0.0) - now)
+
+    def try_acquire(self, stage, now=None):
+        """Réserve un créneau pour l'étage si sa cadence le permet. Retourne True si l'étage doit tourner."""
+        interval = self.interval(stage)
+        if interval is None:
+            return False
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._next_run_time.get(stage, 0.0):
+                return False
+            self._next_run_time[stage] = now + interval
+        return True
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "intervals_ms": {stage: (None if self.interval(stage) is None else round(self.interval(stage) * 1000.0, 1))
+                             for stage in self._rates[self.state]},
+        }
@@ -0,0 +1,205 @@
+import collections
+import threading
+import time
+
+
+class LatestFrameGrabber:
+    """
+    Thread de capture qui lit la caméra en continu et ne garde que la frame la plus récente.
+    Les frames non consommées sont écrasées (comptées dans `dropped`), la caméra n'attend
+    donc jamais l'inférence.
+    """
+
+    def __init__(self, cap, idle_sleep=0.02):
+        self._cap = cap
+        self._idle_sleep = idle_sleep
+        self._condition = threading.Condition()
+        self._frame = None
+        self._frame_id = 0
+        self._last_returned_id = 0
+        self._running = False
+        self._thread = None
+        self.captured = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+
+    def _capture_loop(self):
+        while self._running:
+            ret, frame = self._cap.read()
+            if not ret or frame is None:
+                time.sleep(self._idle_sleep)
+                continue
+            with self._condition:
+                if self._frame is not None and self._frame_id != self._last_returned_id:
+                    self.dropped += 1
+                self._frame = frame
+                self._frame_id += 1
+                self.captured += 1
+                self._condition.notify_all()
+
+    def get(self, timeout=0.5):
+        """Retourne (frame_id, frame) pour une frame plus récente que la dernière rendue, ou (None, None)."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frame_id != self._last_returned_id or not self._running,
+                                            timeout=timeout):
+                return None, None
+            if self._frame_id == self._last_returned_id:
+                return None, None
+            self._last_returned_id = self._frame_id
+            return self._frame_id, self._frame
+
+    def peek(self):
+        """Retourne une copie de la dernière frame sans la marquer comme consommée."""
+        with self._condition:
+            return None if self._frame is None else self._frame.copy()
+
+    @property
+    def running(self):
+        return self._running
+
+    def stats(self):
+        return {"captured": self.captured, "dropped": self.dropped}
+
+
+class StageQueue:
+    """
+    Queue bornée entre deux étages. Quand elle est pleine, l'élément le plus ancien est
+    abandonné (compté dans `dropped`) ; `merge_dropped(dropped, incoming)` permet de
+    reporter dans le nouvel élément ce qui ne doit pas être perdu.
+    """
+
+    def __init__(self, maxsize=2, merge_dropped=None):
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._merge_dropped = merge_dropped
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            while len(self._items) >= self._maxsize:
+                dropped_item = self._items.popleft()
+                self.dropped += 1
+                if self._merge_dropped is not None:
+                    self._merge_dropped(dropped_item, item)
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=0.5):
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._items) > 0, timeout=timeout):
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        with self._condition:
+            self._items.clear()
+
+    def depth(self):
+        with self._condition:
+            return len(self._items)
+
+
+class PipelineStage:
+    """
+    Un étage du pipeline : lit `input_queue`, applique `func(packet)` et transmet le résultat
+    à `output_queue` (si le résultat n'est pas None). Tourne dans son propre thread.
+    Si un `governor` est fourni, il décide de la cadence de l'étage et reçoit sa latence mesurée.
+    """
+
+    def __init__(self, name, func, input_queue, output_queue=None, frame_source=None, governor=None):
+        self.name = name
+        self._func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self._frame_source = frame_source
+        self._governor = governor
+        self._running = False
+        self._thread = None
+        self.processed = 0
+        self.errors = 0
+        self.skipped = 0
+        self._latency_ema = 0.0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=f"vision-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_packet(self):
+        if self._frame_source is not None:
+            frame_id, frame = self._frame_source.get()
+            if frame is None:
+                return None
+            return {"frame_id": frame_id, "timestamp": time.time(), "frame_bgr": frame}
+        return self.input_queue.get()
+
+    def _loop(self):
+        while self._running:
+            if self._frame_source is not None and self._governor is not None:
+                # Pas la peine de prendre une frame avant le prochain créneau autorisé
+                delay = self._governor.time_until(self.name)
+                if delay is None or delay > 0:
+                    time.sleep(0.1 if delay is None else min(delay, 0.1))
+                    continue
+            packet = self._next_packet()
+            if packet is None:
+                continue
+            result = self.run_once(packet)
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result)
+
+    def run_once(self, packet):
+        """Applique la fonction de l'étage en mettant à jour les compteurs (utilisable sans thread)."""
+        if self._governor is not None and not self._governor.try_acquire(self.name):
+            self.skipped += 1
+            return None
+        start_time = time.perf_counter()
+        try:
+            result = self._func(packet)
+        except Exception as e:
+            self.errors += 1
+            print(f"Pipeline vision: Erreur dans l'étage '{self.name}': {e}")
+            return None
+        elapsed = time.perf_counter() - start_time
+        self._latency_ema = elapsed if self.processed == 0 else 0.9 * self._latency_ema + 0.1 * elapsed
+        self.processed += 1
+        if self._governor is not None:
+            self._governor.report_latency(self.name, self._latency_ema)
+        return result
+
+    @property
+    def latency(self):
+        """Latence moyenne (moyenne mobile exponentielle) en secondes."""
+        return self._latency_ema
+
+    def stats(self):
+        input_queue = self.input_queue
+        return {
+            "queue_depth": input_queue.depth() if input_queue is not None else 0,
+            "dropped": input_queue.dropped if input_queue is not None else 0,
+            "processed": self.processed,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "latency_ms": round(self._latency_ema * 1000.0, 1),
+        }
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+# Mélanges de voix nommés : nom -> (voix 1, voix 2, part de la voix 1)
+DEFAULT_BLENDS = {
+    "julie": ("ff_siwis", "if_sara", 0.85),
+}
+# Précision de la part de la voix 1 : la même pour le nom d'un mélange anonyme et pour sa recette
+BLEND_RATIO_DECIMALS = 4
+
+
+class VoiceRegistry:
+    """
+    Table des voix Kokoro partagée par speak/speak_mix et par l'instance Kokoro elle-même.
+    Au premier lancement, le fichier voices-v1.0.bin (archive npz) est converti en un fichier .npy
+    par voix dans `cache_dir` ; ensuite chaque voix est ouverte en np.load(mmap_mode="r"), sans
+    pickle et sans copie en mémoire. Les mélanges (nommés ou non) sont calculés une seule fois
+    puis enregistrés dans `cache_dir/blends/`.
+    """
+
+    MANIFEST_NAME = "manifest.json"
+    EMPTY_ARCHIVE_NAME = "empty_voices.npz"
+
+    def __init__(self, voices_path, cache_dir=None, blends=None):
+        self.voices_path = voices_path
+        self.cache_dir = cache_dir or os.path.splitext(voices_path)[0] + "_npy"
+        self.blends_dir = os.path.join(self.cache_dir, "blends")
+        self._lock = threading.Lock()
+        self._voices = {}
+        self._blend_recipes = {}
+        self._load_or_convert()
+        for name, (voice1, voice2, ratio) in (DEFAULT_BLENDS if blends is None else blends).items():
+            self.define_blend(name, voice1, voice2, ratio)
+
+    def _source_signature(self):
+        stat = os.stat(self.voices_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _voice_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.npy")
+
+    def _load_or_convert(self):
+        manifest_path = os.path.join(self.cache_dir, self.MANIFEST_NAME)
+        manifest = None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if manifest is None or manifest.get("source") != self._source_signature():
+            manifest = self._convert(manifest_path)
+        for name in manifest["voices"]:
+            self._voices[name] = np.load(self._voice_path(name), mmap_mode="r")
+
+    def _convert(self, manifest_path):
+        print(f"Kokoro: Conversion des voix {self.voices_path} vers {self.cache_dir} (une seule fois)...")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with np.load(self.voices_path, allow_pickle=False) as archive:
+            names = sorted(archive.files)
+            for name in names:
+                np.save(self._voice_path(name), np.ascontiguousarray(archive[name], dtype=np.float32))
+        manifest = {"source": self._source_signature(), "voices": names}
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+        return manifest
+
+    def empty_archive_path(self):
+        """
+        Archive de voix vide, à passer à kokoro_onnx à la place de voices-v1.0.bin : il ne relit pas
+        tout le fichier à la construction, et sa table de voix est ensuite remplacée par ce registre.
+        """
+        path = os.path.join(self.cache_dir, self.EMPTY_ARCHIVE_NAME)
+        if not os.path.exists(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f)
+            os.replace(path + ".tmp", path)
+        return path
+
+    @staticmethod
+    def blend_name(voice1, voice2, ratio):
+        return f"mix_{voice1}_{voice2}_{round(float(ratio), BLEND_RATIO_DECIMALS):.{BLEND_RATIO_DECIMALS}f}"
+
+    def define_blend(self, name, voice1, voice2, ratio):
+        """
+        Enregistre `name` = ratio * voix1 + (1 - ratio) * voix2. Le style est relu depuis le disque
+        si la même recette y est déjà, sinon calculé et enregistré. Retourne le style.
+        """
+        ratio = round(float(ratio), BLEND_RATIO_DECIMALS)
+        recipe = [voice1, voice2, ratio]
+        with self._lock:
+            if self._blend_recipes.get(name) == recipe:
+                return self._voices[name]
+            for voice in (voice1, voice2):
+                if voice not in self._voices:
+                    raise KeyError(f"Voix '{voice}' inconnue pour le mélange '{name}'.")
+            path = os.path.join(self.blends_dir, f"{name}.npy")
+            recipe_path = os.path.join(self.blends_dir, f"{name}.json")
+            style = None
+            try:
+                with open(recipe_path, "r", encoding="utf-8") as f:
+                    if json.load(f) == recipe:
+                        style = np.load(path, mmap_mode="r")
+            except (OSError, ValueError):
+                pass
+            if style is None:
+                blended = ratio * self._voices[voice1] + (1 - ratio) * self._voices[voice2]
+                os.makedirs(self.blends_dir, exist_ok=True)
+                # Style puis recette, chacun via un fichier temporaire : un fichier interrompu n'est jamais relu
+                with open(path + ".tmp", "wb") as f:
+                    np.save(f, blended.astype(np.float32))
+                os.replace(path + ".tmp", path)
+                with open(recipe_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(recipe, f)
+                os.replace(recipe_path + ".tmp", recipe_path)
+                style = np.load(path, mmap_mode="r")
+            self._voices[name] = style
+            self._blend_recipes[name] = recipe
+            return style
+
+    def blend(self, voice1, voice2, ratio):
+        """Mélange anonyme (nommé d'après sa recette), persistant comme les mélanges nommés."""
+        return self.define_blend(self.blend_name(voice1, voice2, ratio), voice1, voice2, ratio)
+
+    # Interface de type dictionnaire utilisée par kokoro_onnx (Kokoro.voices)
+    def __getitem__(self, name):
+        return self._voices[name]
+
+    def __contains__(self, name):
+        return name in self._voices
+
+    def get(self, name, default=None):
+        return self._voices.get(name, default)
+
+    def keys(self):
+        return self._voices.keys()
+
+    def __iter__(self):
+        return iter(self._voices)
+
+    def __len__(self):
+        return len(self._voices)